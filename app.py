@@ -1,9 +1,58 @@
 import streamlit as st
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from io import BytesIO
-import re
+import os
+import json
+from functools import partial
+from scraping.fetch import DEFAULT_WORKERS, DEFAULT_PER_HOST
+from scraping.extractors import EXTRACTORS
+from scraping.page import available_parsers
+from scraping.pipeline import run_rows
+from scraping.cache import ResponseCache, DEFAULT_TTL, DEFAULT_CACHE_DIR
+from scraping.ratelimit import Scheduler, DEFAULT_RATE
+from scraping.sinks import RowSpool, FORMATS, MIME_TYPES
+from scraping.metrics import RunMetrics
+from scraping.plugins import discover
+from scraping.sheets import read_pairs, INPUT_FORMATS
+from scraping.canonical import Canonicalizer
+from scraping.images import ImageVerifier, ProbeCache
+from scraping.jobs import JobManager, job_key, file_hash, CANCELLED, FAILED
+from scraping.monitor import MonitorStore, Outcomes, run_monitor, CHANGE_COLUMNS
+
+
+@st.cache_resource
+def get_response_cache(ttl, offline):
+    return ResponseCache(ttl=ttl, offline=offline)
+
+
+@st.cache_resource
+def get_probe_cache():
+    # Image probe results are kept next to the page cache and reused across runs
+    return ProbeCache(os.path.join(DEFAULT_CACHE_DIR, "images.sqlite3"))
+
+
+@st.cache_resource
+def get_monitor_store():
+    # The last fields of every monitored URL, compared against by the next run
+    return MonitorStore(os.path.join(DEFAULT_CACHE_DIR, "monitor.sqlite3"))
+
+
+@st.cache_resource
+def get_scheduler(rate, per_host):
+    # Shared by every session so concurrent runs respect the same per-site limits
+    return Scheduler(rate=rate, max_per_host=per_host)
+
+
+@st.cache_resource
+def get_job_manager():
+    # One per server process, so jobs outlive the reruns and sessions that started them
+    return JobManager()
+
+
+@st.cache_resource
+def load_client_plugins():
+    # Client folders with a spec.json become extractors (and cards) of their own
+    return discover()
+
 
 st.set_page_config(page_title="Product Info Extractor", layout="wide")
 
@@ -37,6 +86,37 @@ with st.sidebar:
         <a href='#home'>🏠 Home</a>
     """, unsafe_allow_html=True)
 
+    st.markdown("<h2>⚙️ Settings</h2>", unsafe_allow_html=True)
+    max_workers = st.number_input("Concurrent requests", min_value=1, max_value=128, value=DEFAULT_WORKERS)
+    per_host = st.number_input("Max requests per host", min_value=1, max_value=64, value=DEFAULT_PER_HOST)
+    rate = st.number_input("Requests per second per host", min_value=0.0, value=DEFAULT_RATE,
+                           help="Throttled and failed requests are retried with backoff. 0 turns limiting and retries off.")
+    scheduler = get_scheduler(rate, per_host) if rate > 0 else None
+    parser = st.selectbox("HTML parser", available_parsers(), help="lxml is a faster C parser; html.parser needs no extra install.")
+    use_cache = st.checkbox("Cache pages on disk", value=True, help="Re-running a sheet on another card reuses the downloaded pages.")
+    cache_hours = st.number_input("Cache freshness (hours)", min_value=0.0, value=DEFAULT_TTL / 3600, disabled=not use_cache)
+    offline = st.checkbox("Offline replay", value=False, disabled=not use_cache, help="Serve only cached pages and never touch the network.")
+    cache = get_response_cache(cache_hours * 3600, offline) if use_cache else None
+    dedupe = st.checkbox("Fetch duplicate URLs once", value=True, help="Rows whose URLs differ only by tracking parameters, http/https or a trailing slash share one fetch.")
+    verify_images = st.checkbox("Verify image URLs", value=False, help="Probe every image URL in the output (status, type, size, dimensions) without downloading the images.")
+    monitor = st.checkbox("Only report changes", value=False, help="Output only the fields that changed since the last run over the same URLs, e.g. for daily price checks. Unchanged pages are skipped with conditional requests and content hashes.")
+    output_format = st.selectbox("Output format", FORMATS)
+    timing_columns = st.checkbox("Add timing columns", value=False, help="DNS, connect, TTFB, download, size, parse and extract time per URL.")
+    refresh_seconds = st.number_input("Refresh progress every N seconds", min_value=0.5, value=1.0)
+
+jobs = get_job_manager()
+
+with st.sidebar:
+    st.markdown("<h2>🧵 Jobs</h2>", unsafe_allow_html=True)
+    for job in jobs.jobs():
+        done = f"{job.done}/{job.total}" if job.total else job.done
+        st.caption(f"`{job.id}` {job.label}: {job.status}, {done} rows, {job.elapsed():.0f}s")
+        if not job.finished and st.button("⏹️ Cancel", key=f"sidebar_cancel_{job.id}"):
+            job.cancel()
+        # A reopened page has no session state; reattach the job to its card
+        if st.session_state.get(f"job_{job.label}") != job.id and st.button("📎 Show on card", key=f"attach_{job.id}"):
+            st.session_state[f"job_{job.label}"] = job.id
+
 # --- Main Title ---
 st.markdown("""
     <div style='padding: 10px 0 30px;'>
@@ -60,8 +140,13 @@ scripts = {
     "Shaver Shop Image": "Extracts one or more image URLs depending on page type.",
     "Toyworlds AU/NZ": "Extracts title, description, and images from toyworlds.com.au/.nz.",
     "Cleverpatch + YouTube": "Extracts OG data and embedded YouTube video ID.",
-    "MikkoShoes Price": "Extracts current price from MikkoShoes men's product pages."
+    "MikkoShoes Price": "Extracts current price from MikkoShoes men's product pages.",
+    "Combined Extractors": "Runs any selection of the extractors above in one pass: each URL is fetched and parsed once and all their columns are merged into one row."
 }
+COMBINED = "Combined Extractors"
+for client in load_client_plugins():
+    scripts[client.name] = client.description
+scripts[COMBINED] = scripts.pop(COMBINED)
 
 # --- Styled Cards Layout ---
 st.markdown("""
@@ -89,6 +174,141 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Everything that changes the output; the cached result of a run is reused only if these match
+job_options = {
+    "parser": parser, "offline": offline, "dedupe": dedupe, "verify_images": verify_images,
+    "format": output_format, "timings": timing_columns, "monitor": monitor,
+}
+
+
+# What a job runs with, captured when it is submitted so later reruns cannot change it
+run_settings = {
+    "max_workers": max_workers, "per_host": per_host, "parser": parser, "cache": cache, "scheduler": scheduler,
+    "timing_columns": timing_columns, "dedupe": dedupe, "verify_images": verify_images, "output_format": output_format,
+    "monitor": monitor,
+}
+
+
+def run_monitor_job(job, selected, rows, settings):
+    # Every input row counts as progress; only its changes are written out
+    outcomes = Outcomes()
+    with RowSpool(preview_rows=0, columns=CHANGE_COLUMNS) as spool:
+        for changes in run_monitor(get_monitor_store(), selected, rows, max_workers=settings["max_workers"],
+                                   per_host=settings["per_host"], parser=settings["parser"],
+                                   scheduler=settings["scheduler"], outcomes=outcomes):
+            job.check()
+            for change in changes:
+                spool.append(change)
+                job.advance(change, count=0)
+            job.advance()
+        output_path = spool.export(settings["output_format"])
+    job.files.append(output_path)
+    return {"path": output_path, "format": settings["output_format"], "rows": spool.count,
+            "monitor": outcomes.summary()}
+
+
+def run_job(job, selected, rows, settings):
+    # Runs on a JobManager thread: no st.* calls in here, only job updates
+    if settings["monitor"]:
+        return run_monitor_job(job, selected, rows, settings)
+    metrics = RunMetrics()
+    duplicates = {}
+    verifier = None
+    if settings["verify_images"]:
+        verifier = ImageVerifier(get_probe_cache(), settings["scheduler"], max_workers=settings["max_workers"],
+                                 per_host=settings["per_host"])
+    with RowSpool(preview_rows=0) as spool:
+        results = run_rows(selected, rows, max_workers=settings["max_workers"], per_host=settings["per_host"],
+                           parser=settings["parser"], cache=settings["cache"], scheduler=settings["scheduler"],
+                           metrics=metrics, timing_columns=settings["timing_columns"],
+                           canonicalizer=Canonicalizer() if settings["dedupe"] else None, report=duplicates)
+        if verifier is not None:
+            results = verifier.verify(results)
+        for result in results:
+            job.check()
+            spool.append(result)
+            job.advance(result)
+        output_path = spool.export(settings["output_format"])
+    job.files.append(output_path)
+    metrics.finish()
+    return {
+        "path": output_path,
+        "format": settings["output_format"],
+        "rows": spool.count,
+        "summary": metrics.summary(),
+        "hosts": metrics.table("hosts"),
+        "extractors": metrics.table("extractors"),
+        "patterns": metrics.table("patterns"),
+        "duplicates": duplicates,
+        "images": (len(verifier.probes), verifier.table(only_broken=True)) if verifier is not None else None,
+    }
+
+
+@st.fragment(run_every=refresh_seconds)
+def job_progress(job_id, script_name):
+    # Only this fragment reruns while polling, not the whole page of cards
+    job = jobs.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    progress = job.progress()
+    st.progress(progress or 0.0, text=f"⏳ Job `{job.id}`: {job.done}/{job.total} rows extracted, {job.elapsed():.0f}s")
+    preview = job.preview()
+    if preview:
+        st.dataframe(pd.DataFrame(preview))
+    if st.button("⏹️ Cancel", key=f"cancel_{script_name}"):
+        job.cancel()
+
+
+def show_result(job, script_name):
+    if job.status == CANCELLED:
+        st.warning(f"Job `{job.id}` was cancelled after {job.done} rows")
+        return
+    if job.status == FAILED:
+        st.error(f"Job `{job.id}` failed: {job.error}")
+        return
+    result = job.result
+    if "monitor" in result:
+        st.success(f"✅ Done! {job.done} URLs checked in {job.elapsed():.0f}s, {result['rows']} changes "
+                   f"(job `{job.id}`): {result['monitor']}")
+    else:
+        st.success(f"✅ Done! {result['rows']} rows in {job.elapsed():.0f}s (job `{job.id}`)")
+    preview = job.preview()
+    if preview:
+        st.dataframe(pd.DataFrame(preview))
+    # A change set has no duplicate, image or performance report
+    duplicates = result.get("duplicates", {})
+    if duplicates.get("saved"):
+        with st.expander(f"🔁 {duplicates['saved']} duplicate rows shared a fetch ({duplicates['unique']} unique pages)"):
+            st.dataframe(pd.DataFrame([
+                {"Canonical URL": group["canonical"], "Rows": group["rows"], "Variants": ", ".join(group["variants"])}
+                for group in duplicates["collapsed"]
+            ]))
+    if result.get("images") is not None:
+        probed, broken = result["images"]
+        with st.expander(f"🖼️ {probed} image URLs checked, {len(broken)} broken"):
+            if broken:
+                st.dataframe(pd.DataFrame(broken))
+    output_format = result["format"]
+    with open(result["path"], "rb") as f:
+        st.download_button(f"⬇️ Download {output_format.upper()}", data=f, file_name=f"{script_name}_output.{output_format}",
+                           mime=MIME_TYPES[output_format], key=f"download_{script_name}")
+
+    if "summary" not in result:
+        return
+    summary = result["summary"]
+    with st.expander(f"📊 Performance: {summary['rows_per_second']} rows/s, {summary['cache_hits']} from cache"):
+        st.markdown("Latency per host (seconds)")
+        st.dataframe(pd.DataFrame(result["hosts"]))
+        st.markdown("Time per extractor (seconds)")
+        st.dataframe(pd.DataFrame(result["extractors"]))
+        if result.get("patterns"):
+            st.markdown("CPU time per extraction pattern")
+            st.dataframe(pd.DataFrame(result["patterns"]))
+        st.download_button("⬇️ Download metrics JSON", data=json.dumps(summary, indent=2),
+                           file_name=f"{script_name}_metrics.json", mime="application/json",
+                           key=f"metrics_{script_name}")
+
+
 cols = st.columns(2)
 
 for idx, (script_name, description) in enumerate(scripts.items()):
@@ -100,139 +320,43 @@ for idx, (script_name, description) in enumerate(scripts.items()):
                     <p>{description}</p>
             """, unsafe_allow_html=True)
 
-            uploaded_file = st.file_uploader("📥 Upload Excel with 'URL' and 'ProductID'", type=["xlsx"], key=script_name)
+            if script_name == COMBINED:
+                selected = st.multiselect("Extractors to run", list(EXTRACTORS), key=f"select_{script_name}")
+            else:
+                selected = [script_name]
+
+            uploaded_file = st.file_uploader("📥 Upload Excel, CSV or Parquet with 'URL' and 'ProductID'", type=[ext.lstrip(".") for ext in INPUT_FORMATS], key=script_name)
             st.markdown("<a href='https://example.com/template.xlsx' download style='font-size:14px;'>📄 Download Template File</a>", unsafe_allow_html=True)
             run_button = st.button("▶️ Run Script", key=f"run_{script_name}")
+            job_slot = f"job_{script_name}"
+
+            if uploaded_file and run_button and not selected:
+                st.error("Select at least one extractor")
+            elif uploaded_file and selected:
+                key = job_key(file_hash(uploaded_file.getvalue()), selected, job_options)
+                job = jobs.find(key)
+                again = job is not None and job.finished and st.button(
+                    "🔄 Run again", key=f"rerun_{script_name}", help="Ignore the cached result and fetch the pages again.")
+                # A change report depends on when it runs, so Run always starts a fresh check
+                fresh = run_button and (job is None or (monitor and job.finished))
+                if fresh or again:
+                    try:
+                        # Streamed row by row; only the two needed columns are kept
+                        rows = read_pairs(uploaded_file)
+                    except ValueError as e:
+                        rows = None
+                        st.error(f"{e}")
+                    if rows is not None:
+                        job = jobs.submit(key, partial(run_job, selected=list(selected), rows=rows, settings=run_settings),
+                                          label=script_name, total=len(rows), rerun=again or monitor)
+                if job is not None:
+                    # Reattach to the run (or cached result) for this file and these options
+                    st.session_state[job_slot] = job.id
 
-            if uploaded_file and run_button:
-                df = pd.read_excel(uploaded_file)
-                if not {'URL', 'ProductID'}.issubset(df.columns):
-                    st.error("Excel must contain 'URL' and 'ProductID' columns")
-                else:
-                    output = []
-                    with st.spinner("⏳ Extracting data..."):
-                        for i, row in df.iterrows():
-                            url = row['URL']
-                            pid = row['ProductID']
-                            result = {"ProductID": pid, "URL": url}
-                            try:
-                                r = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=20)
-                                html = r.text
-                                soup = BeautifulSoup(html, 'html.parser')
-
-                                if script_name == "Info Extractor":
-                                    result["Title"] = soup.find("meta", property="og:title")['content'] if soup.find("meta", property="og:title") else (soup.title.string if soup.title else "N/A")
-                                    result["Image"] = soup.find("meta", property="og:image")['content'] if soup.find("meta", property="og:image") else "N/A"
-                                    result["Description"] = soup.find("meta", property="og:description")['content'] if soup.find("meta", property="og:description") else "N/A"
-
-                                elif script_name == "Image Extractor":
-                                    image = soup.find("meta", property="og:image")
-                                    result["ImageFormula"] = f'=IMAGE("{image["content"]}")' if image else "No image"
-
-                                elif script_name == "GearWrench ZIP Link":
-                                    match = re.search(r'<span class="download-images-link">[\s\S]*?<a\s+href="([^"]+)"', html)
-                                    base = re.match(r'https://(www\.[^/]+)', url)
-                                    domain = f'https://{base[1]}' if base else ''
-                                    result["ZIP URL"] = domain + match.group(1) if match else "Not found"
-
-                                elif script_name == "NZSBW Full Extractor":
-                                    title = soup.find("meta", property="og:title")
-                                    image = soup.find("meta", property="og:image")
-                                    desc = soup.find(attrs={"data-component-id": "product-description-content"})
-                                    features = soup.find_all("li", attrs={"data-component-id": re.compile("product-description-features-")})
-                                    result.update({
-                                        "Title": title['content'] if title else "N/A",
-                                        "Image": image['content'] if image else "N/A",
-                                        "Description": desc.get_text(strip=True) if desc else "N/A",
-                                        "Features": '\n'.join("• " + f.get_text(strip=True) for f in features)
-                                    })
-
-                                elif script_name == "NZSBW Title Only":
-                                    match = re.search(r'<h2[^>]*data-component-id=["\']product-product-title["\'][^>]*>([^<]+)</h2>', html)
-                                    result["Title"] = match.group(1).strip() if match else "Not found"
-
-                                elif script_name == "Shiels Meta Details":
-                                    match_title = re.search(r'<div[^>]*class=["\']product-title-container[^"\']*["\'][^>]*>[\s\S]*?<h1[^>]*>(.*?)</h1>', html)
-                                    match_image = re.search(r'<meta[^>]+property=["\']og:image:secure_url["\'][^>]+content=["\']([^"\']+)', html)
-                                    result["Title"] = BeautifulSoup(match_title.group(1), 'html.parser').get_text(strip=True) if match_title else "Title not found"
-                                    result["Image"] = match_image.group(1).strip() if match_image else "Image not found"
-
-                                elif script_name == "Smokemart Extractor":
-                                    title = soup.find("meta", property="og:title")
-                                    img = re.search(r'src=\"([^\"]*/media/catalog/product/[^\"]+)', html)
-                                    result["Title"] = title['content'] if title else "N/A"
-                                    result["Image"] = img.group(1).replace("&amp;", "&") if img else "N/A"
-
-                                elif script_name == "Mitre10 Description Extractor":
-                                    match = re.search(r'<div[^>]*class=["\']value["\'][^>]*>([\s\S]*?)</div>', html)
-                                    if match:
-                                        raw = match.group(1)
-                                        bullets = ["• " + BeautifulSoup(li, 'html.parser').get_text(strip=True)
-                                                   for li in re.findall(r'<li>([\s\S]*?)</li>', raw)]
-                                        clean = BeautifulSoup(raw, 'html.parser').get_text(" ", strip=True)
-                                        result["Description"] = clean + ("\n" + "\n".join(bullets) if bullets else "")
-                                    else:
-                                        result["Description"] = "Not found"
-
-                                elif script_name == "Total Tools Price":
-                                    match = re.search(r'<span[^>]*class="currency-symbol"[^>]*>\$</span>\s*(\d+(\.\d{1,2})?)', html)
-                                    result["Price"] = f"${match.group(1)}" if match else "Not found"
-
-                                elif script_name == "Super Cheap Auto (YouTube IDs)":
-                                    ids = set(re.findall(r'id="video-([a-zA-Z0-9_-]{11})"', html))
-                                    for i, vid in enumerate(ids):
-                                        result[f"Video {i+1}"] = f"https://www.youtube.com/watch?v={vid}"
-                                    if not ids:
-                                        result["Video"] = "No video found"
-
-                                elif script_name == "Ramsau Pharma Image":
-                                    match = re.search(r'<img[^>]+src="(/globalassets/commerce/product/images/[^"?]+\.jpg)', html)
-                                    if match:
-                                        base = re.match(r'^(https?://[^/]+)', url)
-                                        result["Image"] = base.group(1) + match.group(1) if base else match.group(1)
-                                    else:
-                                        result["Image"] = "Not found"
-
-                                elif script_name == "Shaver Shop Image":
-                                    images = re.findall(r'class="primary-image[^"]*"[^>]+(?:data-src|src)="([^"]+)"', html)
-                                    for i, img in enumerate(images):
-                                        result[f"Image {i+1}"] = img
-                                    if not images:
-                                        result["Image"] = "No images found"
-
-                                elif script_name == "Toyworlds AU/NZ":
-                                    title = re.search(r'<h1[^>]*class="product-title-details"[^>]*>(.*?)</h1>', html)
-                                    desc = re.search(r'<div[^>]+id="product-description"[\s\S]*?<div[^>]+class="tab-content attributedescription"[^>]*>([\s\S]*?)</div>', html)
-                                    anchors = re.findall(r'<a[^>]+data-variants[^>]+href="([^"]+)"', html)
-                                    imgs = ["https://www.toyworld.com.au" + p if not p.startswith("http") else p for p in anchors]
-                                    result["Title"] = BeautifulSoup(title.group(1), 'html.parser').get_text(strip=True) if title else "Not found"
-                                    result["Description"] = BeautifulSoup(desc.group(1), 'html.parser').get_text(strip=True) if desc else "Not found"
-                                    result["Images"] = ", ".join(imgs) if imgs else "No images"
-
-                                elif script_name == "Cleverpatch + YouTube":
-                                    title = re.search(r'<meta[^>]+property=["\']og:title["\'][^>]+content=["\']([^"\']+)', html)
-                                    ogurl = re.search(r'<meta[^>]+property=["\']og:url["\'][^>]+content=["\']([^"\']+)', html)
-                                    image = re.search(r'<meta[^>]+property=["\']og:image["\'][^>]+content=["\']([^"\']+)', html)
-                                    yt = re.search(r'<iframe[^>]+src=["\'](?:https?:)?//www\.youtube\.com/embed/([^"?&]+)', html)
-                                    result["OG Title"] = title.group(1) if title else "❌"
-                                    result["OG URL"] = ogurl.group(1) if ogurl else "❌"
-                                    result["OG Image"] = image.group(1) if image else "❌"
-                                    result["YouTube"] = f"https://www.youtube.com/watch?v={yt.group(1)}" if yt else "❌"
-
-                                elif script_name == "MikkoShoes Price":
-                                    match = re.search(r'id="ctl00_MainCentre_container_container_Content_31_StyleDetail1_lblCurrentPrice"[^>]*>\s*\$([\d,.]+)', html)
-                                    result["Price"] = f"${match.group(1)}" if match else "Not found"
-
-                            except Exception as e:
-                                result["Error"] = str(e)
-
-                            output.append(result)
-
-                    df_out = pd.DataFrame(output)
-                    st.success("✅ Done!")
-                    st.dataframe(df_out)
-                    buffer = BytesIO()
-                    df_out.to_csv(buffer, index=False)
-                    st.download_button("⬇️ Download CSV", data=buffer.getvalue(), file_name=f"{script_name}_output.csv", mime="text/csv")
+            job = jobs.get(st.session_state[job_slot]) if job_slot in st.session_state else None
+            if job is not None and not job.finished:
+                job_progress(job.id, script_name)
+            elif job is not None:
+                show_result(job, script_name)
 
             st.markdown("</div>", unsafe_allow_html=True)
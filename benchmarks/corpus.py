@@ -0,0 +1,169 @@
+"""
+The benchmark corpus: one product page per supported site, stored offline.
+
+benchmarks/fixtures holds the pages and manifest.json, which lists for each
+fixture the extractors it exercises and their expected output. The shipped
+pages are reconstructions of each site's product markup, reduced to the
+structure the extractors read. A live page can replace one with
+
+    python -m benchmarks.suite record toyworld https://www.toyworld.com.au/... --extractor Toyworld
+
+after which everything runs offline against the recorded copy. Pages are
+inflated to a realistic size (navigation, recommendation carousels, inline
+JSON) when benchmarked, so the extractors see the same noise as in the wild.
+"""
+import json
+import os
+
+from scraping.browser import PageSnapshot
+from scraping.extractors import run_extractors
+from scraping.page import Page, DEFAULT_PARSER
+from scraping.plugins import discover
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MANIFEST = os.path.join(FIXTURES_DIR, "manifest.json")
+
+# The URL fixtures are extracted under when checked, so relative links resolve the same way every run
+BASE_URL = "https://www.example.com/product/"
+
+CARD = """
+<li class="product-card"><div class="card-inner" data-sku="{i}">
+  <a href="/p/{i}" class="card-link"><img data-lazy="/img/{i}-small.webp" alt="Product {i}" loading="lazy"></a>
+  <div class="card-body"><h3 class="card-title">Product {i}</h3>
+  <p class="card-price"><span class="amount">{i}.99</span></p>
+  <ul class="card-badges"><li>New</li><li>Free shipping</li></ul></div>
+</div></li>"""
+
+
+class Fixture:
+    """
+    One page of the corpus.
+
+    Attributes:
+        slug (str): File name without .html; also its path on the FixtureServer.
+        extractors (list): Extractor names benchmarked on this page.
+        expected (dict): {extractor: expected output row}.
+    """
+
+    def __init__(self, slug, extractors, expected=None):
+        self.slug = slug
+        self.extractors = list(extractors)
+        self.expected = dict(expected or {})
+
+    @property
+    def path(self):
+        return os.path.join(FIXTURES_DIR, f"{self.slug}.html")
+
+    @property
+    def url(self):
+        return BASE_URL + self.slug
+
+    def html(self, page_kb=0):
+        """The page, inflated to about page_kb KiB when given."""
+        with open(self.path, encoding="utf-8") as f:
+            return inflate(f.read(), page_kb)
+
+
+def inflate(html, page_kb):
+    """
+    Pads a page to about page_kb KiB with recommendation cards and inline
+    JSON inserted before </body>, keeping the product block where it is.
+    """
+    missing = page_kb * 1024 - len(html)
+    if missing <= 0:
+        return html
+    data = '<script type="application/json" id="catalog">{"items": [%s]}</script>' % ",".join(
+        f'{{"id": {i}, "name": "Item {i}"}}' for i in range(min(2000, missing // 200)))
+    card_bytes = len(CARD.format(i=10000))
+    cards = "".join(CARD.format(i=i) for i in range(max(0, (missing - len(data)) // card_bytes)))
+    filler = f'<section class="recommendations"><ul>{cards}</ul></section>{data}'
+    end = html.lower().rfind("</body>")
+    end = len(html) if end < 0 else end
+    return html[:end] + filler + html[end:]
+
+
+def load_corpus():
+    """
+    Loads the manifest and registers the client extractors.
+
+    Returns:
+        list: The Fixtures, in manifest order.
+    """
+    discover()
+    with open(MANIFEST, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return [Fixture(entry["fixture"], entry["extractors"], entry.get("expected")) for entry in manifest["fixtures"]]
+
+
+def save_corpus(fixtures):
+    manifest = {"fixtures": [
+        {"fixture": fixture.slug, "extractors": fixture.extractors, "expected": fixture.expected}
+        for fixture in fixtures
+    ]}
+    with open(MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def extract(fixture, name, page_kb=0, parser=DEFAULT_PARSER, snapshot=False):
+    """
+    Runs one extractor over a fixture the way the pipeline does, or with
+    snapshot the way the browser tier of the client scripts does.
+    """
+    html = fixture.html(page_kb)
+    page = PageSnapshot(None, fixture.url, html, {}) if snapshot else Page(fixture.url, html, parser=parser)
+    return run_extractors([name], page)
+
+
+def check(fixtures, page_kb=0, parser=DEFAULT_PARSER):
+    """
+    Compares every extractor's output on its fixtures with the expected rows,
+    over a fetched page and over a browser PageSnapshot of the same HTML.
+
+    Returns:
+        list: (slug, extractor, expected, actual) of every mismatch; the
+        extractor is suffixed with "(snapshot)" for the browser tier.
+    """
+    mismatches = []
+    for fixture in fixtures:
+        for name in fixture.extractors:
+            for snapshot in (False, True):
+                actual = json.loads(json.dumps(extract(fixture, name, page_kb, parser, snapshot), default=str))
+                if actual != fixture.expected.get(name):
+                    label = f"{name} (snapshot)" if snapshot else name
+                    mismatches.append((fixture.slug, label, fixture.expected.get(name), actual))
+    return mismatches
+
+
+def bless(fixtures, parser=DEFAULT_PARSER):
+    """Takes the current output of every extractor as its expected output; save_corpus() keeps it."""
+    for fixture in fixtures:
+        fixture.expected = {name: json.loads(json.dumps(extract(fixture, name, parser=parser), default=str))
+                            for name in fixture.extractors}
+
+
+def record(fixtures, slug, url, extractors):
+    """
+    Downloads a live page into the corpus as slug.html and blesses its output.
+
+    Replaces the fixture if slug exists; extractors defaults to its current ones.
+    """
+    from scraping.fetch import fetch
+
+    response = fetch(url)
+    if response.status_code != 200:
+        raise ValueError(f"{url} returned HTTP {response.status_code}")
+    existing = {fixture.slug: fixture for fixture in fixtures}
+    fixture = existing.get(slug)
+    if fixture is None:
+        if not extractors:
+            raise ValueError("a new fixture needs at least one --extractor")
+        fixture = Fixture(slug, extractors)
+        fixtures.append(fixture)
+    elif extractors:
+        fixture.extractors = list(extractors)
+    with open(fixture.path, "w", encoding="utf-8") as f:
+        f.write(response.text)
+    bless([fixture])
+    save_corpus(fixtures)
+    return fixture
@@ -0,0 +1,151 @@
+"""
+Full-tree vs targeted parsing on large product pages.
+
+Builds synthetic 1-3 MB product pages shaped like the Toyworld, Appliance Plus
+and NZSBW pages (the product block buried in navigation, recommendation
+carousels and inline JSON), checks that each extractor returns the same row
+from a tree of its targets as from the full tree, and reports parse time and
+peak traced memory for:
+
+    full     - BeautifulSoup of the whole page (what page.soup builds)
+    strainer - BeautifulSoup with a SoupStrainer on the targeted tag names;
+               still tokenizes the whole page but keeps only matching subtrees
+    targets  - Page.tree(targets): only the scanned windows are parsed
+
+Run from the repository root:
+
+    python -m benchmarks.partial_parse [--sizes 1 2 3] [--repeat 3]
+"""
+import argparse
+import os
+import statistics
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from scraping.extractors import get_extractor, NZSBW_TARGETS
+from scraping.page import Page, available_parsers
+from scraping.plugins import load_client, CLIENTS_DIR
+from scraping.specs import SpecExtractor
+
+CARD = """
+<li class="product-card"><div class="card-inner" data-sku="{i}">
+  <a href="/p/{i}" class="card-link"><img src="/img/{i}-small.jpg" alt="Product {i}" loading="lazy"></a>
+  <div class="card-body"><h3 class="card-title">Product {i}</h3>
+  <p class="card-price"><span class="currency-symbol">$</span>{i}.99</p>
+  <ul class="card-badges"><li>New</li><li>Free shipping</li></ul></div>
+</div></li>"""
+NAV = '<li class="menu-item"><a href="/c/{i}">Category {i}</a><ul class="sub"><li><a href="/c/{i}/a">A</a></li></ul></li>'
+
+TOYWORLD = """
+<h1 class="product-title-details">Lego Classic Brick Box &amp; Friends</h1>
+<ul class="gallery">
+  <li class="thumb zoom-item"><img src="/media/zoom/1.jpg"><img src="/media/zoom/1b.jpg"></li>
+  <li class="thumb zoom-item"><img src="/media/zoom/2.jpg"></li>
+  <li class="thumb"><img src="/media/thumb/3.jpg"></li>
+</ul>
+<a data-variants="1" href="/media/large/1.jpg">L</a><a data-variants="1" href="/media/full/1.jpg">F</a>
+<a data-variants="2" href="/media/full/2.jpg">F</a>
+<div id="product-description"><div class="tab-content attributedescription">
+  <p>Build anything.</p><script>var x = "<div>";</script><ul><li>500 bricks</li><li>Ages 4+</li></ul>
+</div></div>"""
+
+APPLIANCE_PLUS = """
+<h1 class="product-header" data-property="title">Bosch Series 6 Dishwasher</h1>
+<figure data-index="0"><img itemprop="image" src="/images/dw-1.jpg"></figure>
+<figure data-index="1"><img itemprop="image" src="/images/dw-2.jpg"><img src="/images/badge.png"></figure>
+<section id="description" class="tabcontent active">
+  <p>Quiet and <strong>efficient</strong>.</p><ul><li>44 dB</li><li>14 place settings</li></ul>
+</section>"""
+
+NZSBW = """
+<div data-component-id="product-description-content">A hand-made <b>wooden</b> board.</div>
+<ul><li data-component-id="product-description-features-1">Oak</li>
+<li data-component-id="product-description-features-2">Oiled finish</li></ul>"""
+
+CASES = {
+    "Toyworld": (TOYWORLD, ["h1", "div", "li", "a"]),
+    "Appliance Plus": (APPLIANCE_PLUS, ["h1", "section", "figure"]),
+    "NZSBW Full Extractor": (NZSBW, ["div", "li"]),
+}
+
+
+def make_page(product, megabytes):
+    """A product page of roughly the given size with the product block in the middle."""
+    head = ('<!DOCTYPE html><html><head><title>Shop</title>'
+            '<meta property="og:title" content="Shop product"><meta property="og:image" content="/og.jpg">'
+            '<script type="application/json">{"catalog": [%s]}</script></head><body>'
+            % ",".join(f'{{"id": {i}, "name": "Item {i}"}}' for i in range(2000)))
+    nav = '<nav><ul class="menu">' + "".join(NAV.format(i=i) for i in range(300)) + "</ul></nav>"
+    card_bytes = len(CARD.format(i=10000))
+    cards = max(1, int((megabytes * 1024 * 1024 - len(head) - len(nav)) / card_bytes))
+    before = '<div class="recs"><ul>' + "".join(CARD.format(i=i) for i in range(cards // 2)) + "</ul></div>"
+    after = '<div class="recs"><ul>' + "".join(CARD.format(i=i) for i in range(cards // 2, cards)) + "</ul></div>"
+    return head + nav + before + '<main class="product">' + product + "</main>" + after + "</body></html>"
+
+
+def measure(func, repeat):
+    """
+    Median seconds of func() and its peak traced memory in KiB.
+
+    Memory is traced in a separate run because tracemalloc slows the parse.
+    """
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(seconds), peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 3], help="Page sizes in MB.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the median is reported.")
+    args = parser.parse_args(argv)
+
+    for client in ("Toyworld", "Appliance Plus"):
+        load_client(os.path.join(CLIENTS_DIR, client))
+
+    print(f"{'extractor':<22}{'MB':>5}  {'parser':<12}{'mode':<10}{'seconds':>9}{'peak MiB':>10}{'speed-up':>10}")
+    for name, (product, tag_names) in CASES.items():
+        extractor = get_extractor(name).func
+        targets = extractor.targets if isinstance(extractor, SpecExtractor) else NZSBW_TARGETS
+        for size in args.sizes:
+            html = make_page(product, size)
+            for parser_name in available_parsers():
+                if parser_name == "html5lib":
+                    continue
+                expected = run_full(name, html, parser_name)
+                actual = extractor(Page("https://example.com/p/1", html, parser=parser_name))
+                if actual != expected:
+                    raise SystemExit(f"{name} ({parser_name}): targeted {actual!r} != full {expected!r}")
+
+                modes = {
+                    "full": lambda: BeautifulSoup(html, parser_name),
+                    "strainer": lambda: BeautifulSoup(html, parser_name, parse_only=SoupStrainer(tag_names)),
+                    "targets": lambda: Page("", html, parser=parser_name).tree(targets),
+                }
+                baseline = None
+                for mode, func in modes.items():
+                    seconds, peak = measure(func, args.repeat)
+                    baseline = baseline or seconds
+                    print(f"{name:<22}{len(html) / 2 ** 20:>5.1f}  {parser_name:<12}{mode:<10}"
+                          f"{seconds:>9.4f}{peak / 1024:>10.2f}{baseline / seconds:>9.1f}x")
+    return 0
+
+
+def run_full(name, html, parser_name):
+    page = Page("https://example.com/p/1", html, parser=parser_name)
+    page.soup
+    # With the full soup built, Page.tree() returns it, so this is the full-tree result
+    return get_extractor(name).func(page)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,213 @@
+"""
+A local stand-in for the shop sites, serving the corpus with injected faults.
+
+    GET /<slug>/<n>    the fixture <slug>.html; n only makes every row's URL distinct
+
+Every response can be delayed before the first byte (latency and jitter),
+replaced by an error (a 503 with Retry-After, which the Scheduler retries
+and backs off on) or sent slowly in chunks (a bandwidth cap). The faults
+are drawn from a seeded random generator, so a run sees the same pattern of
+errors every time. HTTP/1.1 keep-alive is supported, so connection reuse is
+measured the way it happens against the real sites. Run it on its own to
+point the dashboard or the CLI at it:
+
+    python -m benchmarks.server --port 8800 --latency-ms 80 --error-rate 0.05
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import load_corpus
+
+CHUNK_BYTES = 16 * 1024
+
+
+class Faults:
+    """
+    What the server does to each response.
+
+    Args:
+        latency_ms (float): Delay before the response starts.
+        jitter_ms (float): Uniform random extra delay, up to this much.
+        error_rate (float): Share of requests answered with error_status.
+        error_status (int): Status of injected errors.
+        bandwidth_kbps (float): Body speed in KiB/s; 0 sends at full speed.
+        seed (int): Seed of the random generator.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503, bandwidth_kbps=0, seed=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.bandwidth_kbps = bandwidth_kbps
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(delay seconds, inject an error) for the next request."""
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms)
+            error = self._random.random() < self.error_rate
+        return (self.latency_ms + jitter) / 1000, error
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Serves the corpus pages, inflated to page_kb, with the given Faults.
+
+    Attributes:
+        requests (int): Requests answered.
+        errors (int): Errors injected.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), faults=None, page_kb=0, fixtures=None, counters=None):
+        self.faults = faults or Faults()
+        fixtures = load_corpus() if fixtures is None else fixtures
+        self.pages = {fixture.slug: fixture.html(page_kb).encode("utf-8") for fixture in fixtures}
+        self.requests = 0
+        self.errors = 0
+        self._counters = counters
+        self._count_lock = threading.Lock()
+        super().__init__(address, _FixtureHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, error):
+        with self._count_lock:
+            self.requests += 1
+            self.errors += error
+            if self._counters is not None:
+                self._counters[0].value = self.requests
+                self._counters[1].value = self.errors
+
+    def handle_error(self, request, client_address):
+        # Clients drop keep-alive connections, e.g. after reading only the document head
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, name="fixture-server", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def _serve(faults, page_kb, fixtures, counters, ready):
+    server = FixtureServer(faults=Faults(**faults), page_kb=page_kb, fixtures=fixtures, counters=counters)
+    ready.put(server.url)
+    server.serve_forever()
+
+
+class ServerProcess:
+    """
+    A FixtureServer in a child process, so that its CPU time and memory are
+    not counted with the client's being benchmarked.
+
+    Args:
+        faults (dict): Keyword arguments of Faults.
+        page_kb (int): Inflate every page to about this size.
+        fixtures (list): The corpus Fixtures to serve.
+    """
+
+    def __init__(self, faults, page_kb=0, fixtures=None):
+        self._counters = (multiprocessing.Value("q", 0), multiprocessing.Value("q", 0))
+        self._ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(faults, page_kb, fixtures, self._counters, self._ready), daemon=True)
+        self.url = None
+
+    @property
+    def requests(self):
+        return self._counters[0].value
+
+    @property
+    def errors(self):
+        return self._counters[1].value
+
+    def __enter__(self):
+        self._process.start()
+        self.url = self._ready.get(timeout=60)
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join()
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        body = server.pages.get(self.path.strip("/").split("/")[0])
+        delay, error = server.faults.draw()
+        server.count(error)
+        time.sleep(delay)
+        if body is None or error:
+            status = 404 if body is None else server.faults.error_status
+            message = b"not found" if body is None else b"injected error"
+            self.send_response(status)
+            if status in (429, 503):
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", str(len(message)))
+            self.end_headers()
+            self.wfile.write(message)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        rate = server.faults.bandwidth_kbps * 1024
+        try:
+            for start in range(0, len(body), CHUNK_BYTES):
+                chunk = body[start:start + CHUNK_BYTES]
+                self.wfile.write(chunk)
+                if rate:
+                    time.sleep(len(chunk) / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. after the document head
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--page-kb", type=int, default=200, help="Inflate every page to about this size.")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--bandwidth-kbps", type=float, default=0, help="Body speed cap in KiB/s; 0 for none.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, bandwidth_kbps=args.bandwidth_kbps,
+                    seed=args.seed)
+    server = FixtureServer((args.host, args.port), faults, args.page_kb)
+    print(f"Serving {len(server.pages)} fixtures at {server.url}/<fixture>/<n>: {', '.join(server.pages)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,292 @@
+"""
+Offline benchmark suite for every extractor and the fetch pipeline.
+
+Runs against the recorded corpus (benchmarks/fixtures) and a local
+FixtureServer, so results are reproducible without network access:
+
+    extract     per extractor and parser: CPU milliseconds and peak traced
+                memory to parse and extract one inflated page, after checking
+                the output still matches the corpus
+    end-to-end  per parser, concurrency and fetch strategy: pages/sec, CPU
+                milliseconds per page and peak traced memory of the whole
+                pipeline (fetch, parse, extract) against the server, whose
+                latency, errors and bandwidth are injected
+
+Fetch strategies:
+
+    direct      plain requests, no rate limiter; injected errors reach the extractors as error pages
+    scheduled   through the Scheduler, which retries injected errors and backs off
+    cached      from a warm on-disk ResponseCache; the server is not hit
+
+Run from the repository root:
+
+    python -m benchmarks.suite run [--parsers lxml html.parser] [--workers 8 32] [--save results.json]
+    python -m benchmarks.suite run --compare results.json    # exit 1 on a regression
+    python -m benchmarks.suite check | bless | record SLUG URL [--extractor NAME]
+"""
+import argparse
+import itertools
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import load_corpus, save_corpus, check, bless, record
+from benchmarks.server import ServerProcess
+from scraping.extractors import run_extractors
+from scraping.fetch import imap_ordered
+from scraping.metrics import RunMetrics
+from scraping.page import Page, available_parsers
+from scraping.pipeline import extract_product
+
+STRATEGIES = ("direct", "scheduled", "cached")
+DEFAULT_TOLERANCE = 0.2
+# CPU times under this many milliseconds are timer noise and never flagged
+NOISE_MS = 0.05
+
+
+def measure(func, repeat):
+    """
+    Median wall seconds and CPU seconds of func(), and the result of the last call.
+    """
+    walls, cpus = [], []
+    result = None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return statistics.median(walls), statistics.median(cpus), result
+
+
+def traced_peak(func):
+    """Peak traced memory of func() in KiB; traced separately because tracing slows it down."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_extract(fixtures, parsers, page_kb, repeat):
+    """CPU and memory of parsing and extracting one page, per extractor and parser."""
+    results = []
+    for fixture, parser in itertools.product(fixtures, parsers):
+        html = fixture.html(page_kb)
+        for name in fixture.extractors:
+            def run():
+                return run_extractors([name], Page(fixture.url, html, parser=parser))
+
+            wall, cpu, output = measure(run, repeat)
+            output = json.loads(json.dumps(output, default=str))
+            results.append({
+                "extractor": name, "parser": parser, "fixture": fixture.slug,
+                "cpu_ms": round(cpu * 1000, 3), "wall_ms": round(wall * 1000, 3),
+                "peak_kib": round(traced_peak(run), 1), "ok": output == fixture.expected.get(name),
+            })
+    return results
+
+
+def bench_end_to_end(fixtures, server, parser, workers, strategy, rows, memory):
+    """One pipeline run over rows pages from the server; returns its result entry."""
+    tasks = [(fixture, name) for fixture in fixtures for name in fixture.extractors]
+    urls = [(f"{server.url}/{fixture.slug}/{n}", [name], n)
+            for n, (fixture, name) in zip(range(rows), itertools.cycle(tasks))]
+
+    cache = scheduler = cache_dir = None
+    if strategy == "scheduled":
+        from scraping.ratelimit import Scheduler
+
+        # A rate far above what the server can serve, so only its retries and backoff are measured
+        scheduler = Scheduler(rate=10_000, max_per_host=workers)
+    elif strategy == "cached":
+        from scraping.cache import ResponseCache
+
+        cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+        cache = ResponseCache(cache_dir, ttl=float("inf"))
+
+    def run(metrics=None):
+        def task(row):
+            url, names, pid = row
+            return extract_product(names, url, pid, parser=parser, cache=cache, scheduler=scheduler, metrics=metrics)
+
+        return list(imap_ordered(task, urls, max_workers=workers, per_host=workers, url_of=lambda row: row[0]))
+
+    try:
+        if cache is not None:
+            run()
+        served, injected = server.requests, server.errors
+        metrics = RunMetrics()
+        wall, cpu, results = measure(lambda: run(metrics), 1)
+        served, injected = server.requests - served, server.errors - injected
+        peak = traced_peak(run) if memory else None
+    finally:
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    metrics.finish()
+    summary = metrics.summary()
+    host = next(iter(summary["hosts"].values()), {})
+    return {
+        "parser": parser, "workers": workers, "strategy": strategy, "rows": len(results),
+        "pages_per_second": round(len(results) / wall, 1), "cpu_ms_per_page": round(cpu * 1000 / len(results), 3),
+        "peak_mib": round(peak / 1024, 1) if peak is not None else None,
+        "p50": host.get("p50"), "p95": host.get("p95"),
+        "errors": sum(1 for result in results if "Error" in result),
+        "requests": served, "injected_errors": injected,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    The regressions of results against a saved baseline.
+
+    A regression is a pages/sec drop or a CPU time rise of more than tolerance
+    (a fraction) on a configuration present in both.
+
+    Returns:
+        list: Human-readable regression messages.
+    """
+    regressions = []
+    previous = {(entry["extractor"], entry["parser"], entry["fixture"]): entry for entry in baseline.get("extract", [])}
+    for entry in results["extract"]:
+        before = previous.get((entry["extractor"], entry["parser"], entry["fixture"]))
+        if before and before["cpu_ms"] > NOISE_MS and entry["cpu_ms"] > before["cpu_ms"] * (1 + tolerance):
+            regressions.append(f"{entry['extractor']} ({entry['parser']}): {before['cpu_ms']} -> {entry['cpu_ms']} CPU ms")
+    previous = {(e["parser"], e["workers"], e["strategy"]): e for e in baseline.get("end_to_end", [])}
+    for entry in results["end_to_end"]:
+        before = previous.get((entry["parser"], entry["workers"], entry["strategy"]))
+        if not before:
+            continue
+        label = f"end-to-end {entry['strategy']} x{entry['workers']} ({entry['parser']})"
+        if entry["pages_per_second"] < before["pages_per_second"] * (1 - tolerance):
+            regressions.append(f"{label}: {before['pages_per_second']} -> {entry['pages_per_second']} pages/s")
+        if before["cpu_ms_per_page"] > NOISE_MS and entry["cpu_ms_per_page"] > before["cpu_ms_per_page"] * (1 + tolerance):
+            regressions.append(f"{label}: {before['cpu_ms_per_page']} -> {entry['cpu_ms_per_page']} CPU ms/page")
+    return regressions
+
+
+def run(args):
+    fixtures = load_corpus()
+    if args.extractors:
+        fixtures = [fixture for fixture in fixtures if set(fixture.extractors) & set(args.extractors)]
+        for fixture in fixtures:
+            fixture.extractors = [name for name in fixture.extractors if name in args.extractors]
+    parsers = args.parsers or [p for p in available_parsers() if p != "html5lib"]
+    results = {
+        "settings": {k: v for k, v in vars(args).items() if k not in ("func", "save", "compare")},
+        "python": platform.python_version(), "platform": platform.platform(),
+    }
+
+    print(f"{'extractor':<32}{'parser':<13}{'CPU ms':>9}{'peak KiB':>10}  output")
+    results["extract"] = bench_extract(fixtures, parsers, args.page_kb, args.repeat)
+    for entry in results["extract"]:
+        print(f"{entry['extractor']:<32}{entry['parser']:<13}{entry['cpu_ms']:>9.3f}{entry['peak_kib']:>10.1f}  "
+              f"{'ok' if entry['ok'] else 'MISMATCH'}")
+
+    faults = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+              "bandwidth_kbps": args.bandwidth_kbps, "seed": args.seed}
+    results["end_to_end"] = []
+    print(f"\n{'strategy':<11}{'workers':>8}  {'parser':<13}{'pages/s':>9}{'CPU ms/pg':>11}{'peak MiB':>10}"
+          f"{'p50 s':>8}{'p95 s':>8}{'errors':>8}{'requests':>10}")
+    with ServerProcess(faults, args.page_kb, fixtures) as server:
+        for strategy, workers, parser in itertools.product(args.strategies, args.workers, parsers):
+            entry = bench_end_to_end(fixtures, server, parser, workers, strategy, args.rows, args.memory)
+            results["end_to_end"].append(entry)
+            peak = f"{entry['peak_mib']:>10.1f}" if entry["peak_mib"] is not None else f"{'-':>10}"
+            print(f"{strategy:<11}{workers:>8}  {parser:<13}{entry['pages_per_second']:>9.1f}"
+                  f"{entry['cpu_ms_per_page']:>11.3f}{peak}{entry['p50'] or 0:>8.3f}{entry['p95'] or 0:>8.3f}"
+                  f"{entry['errors']:>8}{entry['requests']:>10}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+    status = 0
+    if not all(entry["ok"] for entry in results["extract"]):
+        print("\nSome extractors no longer produce their corpus output; see `check`.", file=sys.stderr)
+        status = 1
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return status
+
+
+def check_command(args):
+    fixtures = load_corpus()
+    mismatches = check(fixtures, args.page_kb)
+    for slug, name, expected, actual in mismatches:
+        print(f"{slug} / {name}:\n  expected {expected!r}\n  actual   {actual!r}")
+    runs = sum(len(f.extractors) for f in fixtures)
+    print(f"{len(mismatches)} mismatches in {runs} extractor runs, each over a fetched page and a browser snapshot")
+    return 1 if mismatches else 0
+
+
+def bless_command(args):
+    fixtures = load_corpus()
+    bless(fixtures)
+    save_corpus(fixtures)
+    print(f"Expected outputs of {len(fixtures)} fixtures updated")
+    return 0
+
+
+def record_command(args):
+    fixture = record(load_corpus(), args.slug, args.url, args.extractors)
+    print(f"Recorded {args.url} as {fixture.path}: {fixture.expected}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench = commands.add_parser("run", help="Run the extract and end-to-end benchmarks.")
+    bench.add_argument("--extractors", nargs="+", help="Only these extractors (default: every one in the corpus).")
+    bench.add_argument("--parsers", nargs="+", help="Parsers to compare (default: every installed one but html5lib).")
+    bench.add_argument("--workers", type=int, nargs="+", default=[8, 32], help="Concurrency settings to compare.")
+    bench.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    bench.add_argument("--rows", type=int, default=300, help="Pages fetched per end-to-end run.")
+    bench.add_argument("--page-kb", type=int, default=200, help="Inflate every page to about this size.")
+    bench.add_argument("--repeat", type=int, default=5, help="Runs per extract measurement; the median is kept.")
+    bench.add_argument("--latency-ms", type=float, default=50, help="Server delay before each response.")
+    bench.add_argument("--jitter-ms", type=float, default=20, help="Random extra delay, up to this much.")
+    bench.add_argument("--error-rate", type=float, default=0.02, help="Share of requests answered with a 503.")
+    bench.add_argument("--bandwidth-kbps", type=float, default=0, help="Body speed cap in KiB/s; 0 for none.")
+    bench.add_argument("--seed", type=int, default=1, help="Seed of the injected latency and errors.")
+    bench.add_argument("--no-memory", dest="memory", action="store_false",
+                       help="Skip the traced end-to-end run that measures peak memory.")
+    bench.add_argument("--save", help="Write the results to this JSON file, e.g. as a baseline.")
+    bench.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on a regression.")
+    bench.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                       help="Allowed slowdown before a result counts as a regression, as a fraction.")
+    bench.set_defaults(func=run)
+
+    verify = commands.add_parser("check", help="Check every extractor's output against the corpus.")
+    verify.add_argument("--page-kb", type=int, default=200)
+    verify.set_defaults(func=check_command)
+
+    commands.add_parser("bless", help="Accept the current outputs as the expected ones.").set_defaults(
+        func=bless_command)
+
+    capture = commands.add_parser("record", help="Download a live page into the corpus.")
+    capture.add_argument("slug", help="Fixture name; an existing one is replaced.")
+    capture.add_argument("url")
+    capture.add_argument("--extractor", dest="extractors", action="append", help="Extractor run on the page.")
+    capture.set_defaults(func=record_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
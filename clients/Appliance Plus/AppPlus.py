@@ -1,14 +1,23 @@
-import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
-import time
 import math
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import urljoin, urlparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from scraping.journal import Journal
+from scraping.workqueue import open_queue, default_worker_name
+from scraping.browser import BrowserPool, NetworkPolicy, apply_policy, install_policy, ready, render, SNAPSHOT_STATS
+from scraping.cache import ResponseCache
+from scraping.ratelimit import Scheduler
+from scraping.metrics import RunMetrics
+from scraping.tiered import scrape_tiered
+from scraping.plugins import load_client
+from scraping.page import Page
+from scraping.sheets import iter_rows, is_blank
+from scraping.canonical import Canonicalizer
 
 # ---------------------------- Configuration ---------------------------- #
 
@@ -22,160 +31,231 @@ options.add_argument('--disable-dev-shm-usage')  # Overcome limited resource pro
 # Path to the ChromeDriver executable
 chromedriver_path = "D:\\SOWMYA\\python script\\extract Title_ID\\Input\\CHROMDRIVE\\chromedriver-win64\\chromedriver.exe"
 
-# Initialize the WebDriver service with headless option
-service = Service(chromedriver_path)
-driver = webdriver.Chrome(service=service, options=options)
+# Resources the product pages can be rendered without; only DOM text and src attributes are read
+network_policy = NetworkPolicy(block_images=True, block_fonts=True, block_media=True, block_trackers=True)
+apply_policy(options, network_policy)
 
-# Define a wait object with a timeout of 30 seconds
-wait = WebDriverWait(driver, 30)
+# Output folder and the per-URL journal that makes reruns resumable
+output_dir = 'D:\\SOWMYA\\python script\\extract Title_ID\\Input\\Appliance Plus\\Final Output'
+
+# Product title, description and image selectors are declared in spec.json next to this script
+product_spec = load_client(os.path.dirname(os.path.abspath(__file__)))
+
+# Number of headless Chrome workers rendering pages in parallel
+num_workers = 4
+
+# Pages rendered by one driver before it is replaced with a fresh one
+recycle_after = 100
+
+# The page is ready once the product title is present
+ready_conditions = [ready(By.CLASS_NAME, 'product-header', timeout=30)]
+
+# Maximum plain HTTP requests per second sent to the site. The scheduler backs off
+# further on 429/503 responses and honours Retry-After
+requests_per_second = 4
+
+# Rows that point at the same product page (tracking parameters, http vs https,
+# trailing slashes) are fetched once and the result is copied to each row.
+# Add per-host rules for the query parameters that select a different product,
+# e.g. Canonicalizer(rules={'applianceplus.com.au': HostRule(keep=('variant',))})
+canonicalizer = Canonicalizer()
+
+# Pages are fetched with plain HTTP first and only rendered in Chrome when the
+# product title is missing; URLs containing any of these always use Chrome
+browser_only_patterns = []
+
+# To split the job across processes or machines, point every copy of this script at one shared
+# queue: a queue file on a local disk, or the http:// address of `python -m scraping queue serve`.
+# Fill it once with `python -m scraping queue add <queue> URLS.xlsx`; each copy then claims leased
+# batches of queue_batch_size rows until the queue is drained. requests_per_second applies per copy.
+queue_address = None
+queue_batch_size = 20
 
 # ---------------------------- Functions ---------------------------- #
 
-def extract_image_urls(soup, base_url):
+def make_driver():
+    """
+    Starts a headless Chrome driver. Each pool worker calls this for its own browser.
+
+    Returns:
+        WebDriver: A new Chrome driver.
     """
-    Extracts all image URLs from the BeautifulSoup-parsed HTML within <figure> tags.
-    
+    service = Service(chromedriver_path)
+    return install_policy(webdriver.Chrome(service=service, options=options), network_policy)
+
+def scrape_static(html, url):
+    """
+    Extracts product details from the server HTML without a browser.
+
+    Args:
+        html (str): The page HTML fetched over plain HTTP.
+        url (str): The product page URL.
+
+    Returns:
+        dict: The extracted product title, description and image URLs.
+    """
+    return product_spec(Page(url, html))
+
+def scrape_product(driver, url):
+    """
+    Renders one product page and extracts its details. Runs inside a pool worker.
+
     Args:
-        soup (BeautifulSoup): Parsed HTML content.
-        base_url (str): The base URL of the page for constructing absolute URLs.
-    
+        driver (WebDriver): The worker's browser.
+        url (str): The product page URL.
+
     Returns:
-        list: A list of all image URLs found within <figure> tags.
+        dict: The extracted product details plus the page's bytes downloaded and time to readiness.
+    """
+    # Open the webpage once and wait until it is ready
+    snapshot = render(driver, url, ready_conditions)
+    fields = product_spec(snapshot)
+    fields.update(snapshot.stats)
+    return fields
+
+def is_complete(fields):
+    """
+    Returns True when the static HTML already contained the product.
+    """
+    return fields['Product Title'] != 'Product title not found'
+
+def needs_browser(url):
     """
-    image_urls = []
-    figure_tags = soup.find_all('figure', attrs={'data-index': True})
-    
-    for tag in figure_tags:
-        img = tag.find('img', itemprop='image')
-        if img:
-            url = img.get('src')
-            if url:
-                full_url = urljoin(base_url, url)
-                image_urls.append(full_url)
-    
-    # Remove duplicates by converting to a set and back to a list
-    unique_image_urls = list(set(image_urls))
-    return unique_image_urls
-
-def process_batch(urls_batch, batch_number):
+    Per-client rule: pages matching browser_only_patterns skip the static attempt.
+    """
+    return any(pattern in url for pattern in browser_only_patterns)
+
+def process_batch(urls_batch, batch_number, pool, journal, cache, scheduler, metrics):
     """
     Processes a batch of URLs, extracting product details and image URLs.
-    
+    Pages are fetched with plain HTTP first and rendered on the browser pool only when needed.
+    Each URL is committed to the journal as soon as it completes.
+
     Args:
-        urls_batch (DataFrame): A batch of URLs to process.
+        urls_batch (list): A batch of (row number, row dict) pairs to process.
         batch_number (int): The current batch number.
+        pool (BrowserPool): The browser workers.
+        journal (Journal): The job journal, or a LeasedBatch when working from a queue.
+        cache (ResponseCache): On-disk cache for the plain HTTP fetches.
+        scheduler (Scheduler): Per-host rate limit and retries for the plain HTTP fetches.
+        metrics (RunMetrics): Collects the per-URL timings for the run report.
     """
-    results = []
+    rows = urls_batch
+    duplicates = {}
+    scraped = scrape_tiered([row['URL'] for index, row in rows], scrape_static, is_complete, pool,
+                            needs_browser=needs_browser, cache=cache, scheduler=scheduler, metrics=metrics,
+                            canonicalizer=canonicalizer, report=duplicates)
 
-    for index, row in urls_batch.iterrows():
-        url = row['URL']
+    for (index, row), (url, fields, error, tier) in zip(rows, scraped):
         page_no = row.get('Page No.', 'N/A')
-        print(f"\nProcessing URL: {url} (Page No.: {page_no})")
-
-        try:
-            # Open the webpage
-            driver.get(url)
-            print("URL opened successfully")
-
-            # Wait until the product title is present to ensure the page has loaded
-            wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'product-header')))
-            print("Product title loaded")
-
-            # Get the page source
-            page_source = driver.page_source
-
-            # Parse the HTML content using BeautifulSoup
-            soup = BeautifulSoup(page_source, 'html.parser')
-
-            # Extract Product Title
-            product_element = soup.find('h1', class_='product-header', attrs={'data-property': 'title'})
-            product_title = product_element.get_text(strip=True) if product_element else 'Product title not found'
-
-            # Find the section where the description is stored
-            description_section = soup.find('section', id='description', class_='tabcontent active')
-            if description_section:
-
-                # Extract paragraphs and list items
-                paragraphs = description_section.find_all(['p', 'strong'])  # Include <strong> within <p> as well
-                description_items = description_section.find_all('li')
-
-                # Extract text for paragraphs and list items
-                description_p = '\n'.join([para.get_text(separator=" ", strip=True) for para in paragraphs])
-                description_li = '\n'.join([f"• {item.get_text(strip=True)}" for item in description_items])
-
-                # Combine paragraphs first, followed by list items with a line break
-                description = f"{description_p}\n\n{description_li}".strip()
-            else:
-                description = 'Description not found'
-                
-            # Extract Image URLs
-            parsed_url = urlparse(url)
-            base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-            image_urls = extract_image_urls(soup, base_url)
-
-            # Append the result to the list
-            results.append({
-                'Page No.': page_no,
-                'URL': url,
-                'Product Title': product_title,
-                'Description': description,
-                'Image URLs': ', '.join(image_urls) if image_urls else 'Image URLs not found'
-            })
+        result = {'Page No.': page_no, 'URL': url}
 
-            # Optional: print the product title and number of images extracted for each URL
-            print(f'Product Title: {product_title}')
-            print(f'Extracted {len(image_urls)} image(s)')
+        if error is None:
+            result.update(fields)
+            result['Fetch Tier'] = tier
+            journal.record_done(index, result)
 
-        except Exception as e:
+            # Optional: print the product title extracted for each URL
+            print(f"\nProcessed URL: {url} (Page No.: {page_no}, {tier})")
+            print(f"Product Title: {fields['Product Title']}")
+        else:
             print(f"An error occurred while processing URL: {url}")
-            print(f"Error: {e}")
-            results.append({
-                'Page No.': page_no,
-                'URL': url,
+            print(f"Error: {error}")
+            result.update({
                 'Product Title': 'Error',
                 'Description': 'Error',
                 'Image URLs': 'Error'
             })
+            result.update(dict.fromkeys(SNAPSHOT_STATS))
+            result['Fetch Tier'] = tier
+            journal.record_failed(index, result, error)
 
-    # Convert the results to a DataFrame
-    results_df = pd.DataFrame(results)
-
-    # Save the results to a new Excel file
-    output_excel_path = f'D:\\SOWMYA\\python script\\extract Title_ID\\Input\\Appliance Plus\\Final Output\\output_urls_batch_{batch_number}.xlsx'
-    results_df.to_excel(output_excel_path, index=False)
-
-    print(f"\nBatch {batch_number} scraping complete. Results saved to: {output_excel_path}")
+    # No per-batch files: the journal holds every row and is exported to one consolidated file at the end
+    print(f"\nBatch {batch_number} scraping complete. {len(rows)} URLs recorded in the journal")
+    print(f"Duplicate URLs fetched once: {duplicates['saved']}")
 
 # ---------------------------- Main Execution ---------------------------- #
 
-try:
-    # Read URLs from the Excel file
-    excel_path = r'D:\SOWMYA\python script\extract Title_ID\Input\Appliance Plus\URLS.xlsx'
-    urls_df = pd.read_excel(excel_path)
-
-    # Define batch size
-    batch_size = 25  # Adjust the batch size as necessary
-
-    # Calculate the number of batches
-    num_batches = math.ceil(len(urls_df) / batch_size)
-
-    print(f"Total URLs to process: {len(urls_df)}")
-    print(f"Batch size: {batch_size}")
-    print(f"Number of batches: {num_batches}")
-
-    for batch_number in range(num_batches):
-        start_index = batch_number * batch_size
-        end_index = min((batch_number + 1) * batch_size, len(urls_df))
-        urls_batch = urls_df.iloc[start_index:end_index]
-
-        print(f"\n--- Processing batch {batch_number + 1}/{num_batches} ---")
-        process_batch(urls_batch, batch_number + 1)
-
-except Exception as main_e:
-    print("An error occurred during the scraping process.")
-    print(f"Error: {main_e}")
-
-finally:
-    # Quit the driver
-    driver.quit()
-    print("\nWebDriver closed.")
+def work_from_queue():
+    """
+    Runs as one of many workers sharing the job through queue_address.
+    Each row is committed to the queue as soon as it completes; if this worker stops,
+    its unfinished rows are handed to another worker once their leases expire.
+    """
+    queue = open_queue(queue_address)
+    cache = ResponseCache()
+    scheduler = Scheduler(rate=requests_per_second)
+    metrics = RunMetrics()
+    worker = default_worker_name()
+    try:
+        with BrowserPool(make_driver, scrape_product, workers=num_workers, recycle_after=recycle_after) as pool:
+            for batch_number, batch in enumerate(queue.batches(queue_batch_size, worker), 1):
+                print(f"\n--- Processing batch {batch_number} (queue: {queue.counts()}) ---")
+                # The leased batch records rows the same way the journal does
+                process_batch(batch.rows, batch_number, pool, batch, cache, scheduler, metrics)
+        print(f"\nQueue drained: {queue.counts()}")
+        print(f"Export it with: python -m scraping queue export {queue_address} output_urls_all.xlsx")
+    finally:
+        queue.close()
+        metrics.finish()
+        metrics_path = os.path.join(output_dir, f'metrics-{worker}.json')
+        metrics.write(metrics_path)
+        print(f"Run metrics saved to {metrics_path}")
+
+def main():
+    if queue_address:
+        return work_from_queue()
+    journal = Journal(os.path.join(output_dir, 'journal.sqlite3'))
+    cache = ResponseCache()
+    scheduler = Scheduler(rate=requests_per_second)
+    metrics = RunMetrics()
+    try:
+        # Read URLs from the Excel file, streaming it in read-only mode and skipping empty rows
+        # Built by hand, or from category pages with `python -m scraping crawl <category URL>... -o URLS.xlsx`
+        excel_path = r'D:\SOWMYA\python script\extract Title_ID\Input\Appliance Plus\URLS.xlsx'
+        rows = [(index, row) for index, row in enumerate(iter_rows(excel_path)) if not is_blank(row.get('URL'))]
+
+        # Skip URLs finished by a previous run; failed ones are retried
+        journal.add((index, row['URL']) for index, row in rows)
+        pending = journal.pending()
+        rows = [(index, row) for index, row in rows if index in pending]
+        print(f"Journal status: {journal.counts()}")
+
+        # Define batch size
+        batch_size = 25  # Adjust the batch size as necessary
+
+        # Calculate the number of batches
+        num_batches = math.ceil(len(rows) / batch_size)
+
+        print(f"Total URLs to process: {len(rows)}")
+        print(f"Batch size: {batch_size}")
+        print(f"Number of batches: {num_batches}")
+        print(f"Browser workers: {num_workers}")
+
+        # Browser workers start on the first page that needs one and serve every batch
+        with BrowserPool(make_driver, scrape_product, workers=num_workers, recycle_after=recycle_after) as pool:
+            for batch_number in range(num_batches):
+                start_index = batch_number * batch_size
+                end_index = min((batch_number + 1) * batch_size, len(rows))
+                urls_batch = rows[start_index:end_index]
+
+                print(f"\n--- Processing batch {batch_number + 1}/{num_batches} ---")
+                process_batch(urls_batch, batch_number + 1, pool, journal, cache, scheduler, metrics)
+        print("\nBrowser workers closed (if any were needed).")
+
+    except Exception as main_e:
+        print("An error occurred during the scraping process.")
+        print(f"Error: {main_e}")
+
+    finally:
+        # Write every URL recorded so far to one consolidated file
+        consolidated_path = os.path.join(output_dir, 'output_urls_all.xlsx')
+        journal.export(consolidated_path)
+        print(f"Consolidated results saved to: {consolidated_path}")
+        metrics.finish()
+        metrics_path = os.path.join(output_dir, 'metrics.json')
+        metrics.write(metrics_path)
+        print(f"Run metrics saved to: {metrics_path}")
+
+if __name__ == "__main__":
+    main()
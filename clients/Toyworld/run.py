@@ -1,17 +1,12 @@
-# clients/client1/run.py
+# clients/Toyworld/run.py
 import os
+import sys
 
-def run():
-    input_path = os.path.join(os.path.dirname(__file__), "input")
-    output_path = os.path.join(os.path.dirname(__file__), "output")
-
-    # Example logic: copy input file to output
-    for filename in os.listdir(input_path):
-        if filename.endswith(".txt"):
-            with open(os.path.join(input_path, filename)) as f:
-                data = f.read()
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from scraping.plugins import run_client
 
-            with open(os.path.join(output_path, f"processed_{filename}"), "w") as f:
-                f.write(data.upper())
+def run():
+    # Every sheet in input/ is run through this client's spec.json and written to output/
+    run_client(os.path.dirname(os.path.abspath(__file__)))
 
-    print("Client1 script completed.")
+    print("Toyworld script completed.")
@@ -1,15 +1,23 @@
-import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import urljoin, urlparse
-import time
 import math
-import openpyxl
-from bs4 import BeautifulSoup
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from scraping.journal import Journal
+from scraping.workqueue import open_queue, default_worker_name
+from scraping.browser import BrowserPool, NetworkPolicy, apply_policy, install_policy, ready, render, SNAPSHOT_STATS
+from scraping.cache import ResponseCache
+from scraping.ratelimit import Scheduler
+from scraping.metrics import RunMetrics
+from scraping.tiered import scrape_tiered
+from scraping.plugins import load_client
+from scraping.page import Page
+from scraping.sheets import iter_rows, is_blank
+from scraping.canonical import Canonicalizer
 
 # ---------------------------- Configuration ---------------------------- #
 options = Options()
@@ -19,154 +27,211 @@ options.add_argument('--no-sandbox')
 options.add_argument('--disable-dev-shm-usage')
 
 chromedriver_path = "D:\\SOWMYA\\python script\\extract Title_ID\\Input\\CHROMDRIVE\\chromedriver-win64\\chromedriver.exe"
-service = Service(chromedriver_path)
-driver = webdriver.Chrome(service=service, options=options)
-wait = WebDriverWait(driver, 30)
+
+# Only DOM text and href/src attributes are read, so images, fonts, video and trackers are not downloaded.
+# Stylesheets stay on so layout-dependent scripts such as the image carousel behave normally.
+network_policy = NetworkPolicy(block_images=True, block_fonts=True, block_media=True, block_trackers=True)
+apply_policy(options, network_policy)
+
+output_dir = 'D:\\SOWMYA\\python script\\extract Title_ID\\Input\\Toyworld\\Final Output'
+
+# Title, description and image selectors live in spec.json next to this script
+product_spec = load_client(os.path.dirname(os.path.abspath(__file__)))
+
+# Browser workers rendering pages in parallel, and pages per driver before it is replaced
+num_workers = 4
+recycle_after = 100
+
+# The page is ready once the title is rendered; the image carousel is waited for
+# briefly because products with a single image do not have one
+ready_conditions = [
+    ready(By.CLASS_NAME, 'product-title-details', timeout=30),
+    ready(By.CSS_SELECTOR, "div.slick-track a[data-variants]", timeout=5, required=False),
+]
+
+# Plain HTTP requests per second sent to the site; throttled requests slow this down further
+requests_per_second = 4
+
+# Rows pointing at the same page (tracking parameters, http/https, trailing slash) are scraped once;
+# pass rules={host: HostRule(keep=(...))} for query parameters that select a different product
+canonicalizer = Canonicalizer()
+
+# Pages are fetched with plain HTTP first; URLs containing any of these are always rendered in Chrome
+browser_only_patterns = []
+
+# To split the job across processes or machines, point every copy of this script at one shared
+# queue: a queue file on a local disk, or the http:// address of `python -m scraping queue serve`.
+# Fill it once with `python -m scraping queue add <queue> URLS.xlsx`; each copy then claims leased
+# batches of queue_batch_size rows until the queue is drained. requests_per_second applies per copy.
+queue_address = None
+queue_batch_size = 20
 
 # ---------------------------- Functions ---------------------------- #
 
-def extract_image_urls(url):
+def make_driver():
+    """
+    Starts a headless Chrome driver; each pool worker calls this for its own browser.
+    """
+    service = Service(chromedriver_path)
+    return install_policy(webdriver.Chrome(service=service, options=options), network_policy)
+
+def scrape_static(html, url):
     """
-    Extracts image URLs from a product page, filtering out 'medium' or 'large' sizes.
+    Extracts product details from the server HTML without a browser.
     Args:
-        url (str): The URL of the product page.
+        html (str): The page HTML fetched over plain HTTP.
+        url (str): The product page URL.
     Returns:
-        list: A list of full-resolution image URLs.
+        dict: The extracted fields.
     """
-    driver.get(url)
-    time.sleep(3)  # Allow time for the page to load
+    return product_spec(Page(url, html))
 
-    # Find all <a> tags with image URLs
-    image_elements = driver.find_elements(By.CSS_SELECTOR, "div.slick-track a[data-variants]")
-    image_urls = []
+def scrape_product(driver, url):
+    """
+    Renders one product page and extracts its details; runs inside a pool worker.
+    Args:
+        driver (WebDriver): The worker's browser.
+        url (str): The product page URL.
+    Returns:
+        dict: The extracted fields plus the page's bytes downloaded and time to readiness.
+    """
+    # Render the page once and wait until the title and image carousel are loaded
+    snapshot = render(driver, url, ready_conditions)
+    fields = product_spec(snapshot)
+    fields.update(snapshot.stats)
+    return fields
 
-    for element in image_elements:
-        img_url = element.get_attribute('href')
-        # Only include URLs that do not contain "medium" or "large"
-        if "medium" not in img_url and "large" not in img_url:
-            image_urls.append(img_url)
+def is_complete(fields):
+    """
+    Returns True when the static HTML produced everything a browser render would.
 
-    return image_urls
+    Single-image products have no carousel, so their zoom image is enough.
+    """
+    has_images = (fields['Product Image URLs'] != 'No product images found'
+                  or fields['Zoom Image URLs'] != 'No zoom images found')
+    return fields['Product Title'] != 'Product title not found' and has_images
 
-def extract_zoom_image_urls(soup, base_url):
+def needs_browser(url):
     """
-    Extracts zoom image URLs from the page's HTML content.
-    Args:
-        soup (BeautifulSoup): Parsed HTML content.
-        base_url (str): The base URL for resolving relative URLs.
-    Returns:
-        list: A list of zoom image URLs.
+    Per-client rule: pages matching browser_only_patterns skip the static attempt.
     """
-    image_urls = []
-    zoom_image_tags = soup.find_all('li', class_=lambda c: 'zoom' in c if c else False)
-    
-    for tag in zoom_image_tags:
-        img = tag.find('img')
-        if img:
-            src = img.get('src')
-            if src:
-                full_url = urljoin(base_url, src)
-                image_urls.append(full_url)
-    
-    return list(set(image_urls))  # Remove duplicates
-
-def process_batch(urls_batch, batch_number):
+    return any(pattern in url for pattern in browser_only_patterns)
+
+def process_batch(urls_batch, batch_number, pool, journal, cache, scheduler, metrics):
     """
-    Processes a batch of URLs to extract product details and image URLs.
+    Processes a batch of URLs to extract product details and image URLs, using plain HTTP
+    where possible and the browser pool otherwise.
+    Each URL is committed to the journal as soon as it completes.
     Args:
-        urls_batch (DataFrame): The batch of URLs to process.
+        urls_batch (list): The batch of (row number, row dict) pairs to process.
         batch_number (int): The current batch number.
+        pool (BrowserPool): The browser workers.
+        journal (Journal): The job journal, or a LeasedBatch when working from a queue.
+        cache (ResponseCache): On-disk cache for the plain HTTP fetches.
+        scheduler (Scheduler): Per-host rate limit and retries for the plain HTTP fetches.
+        metrics (RunMetrics): Collects the per-URL timings for the run report.
     """
-    results = []
-
-    for index, row in urls_batch.iterrows():
-        url = row['URL']
-        if pd.isna(url):  # Skip empty rows
-            continue
+    rows = urls_batch
+    duplicates = {}
+    scraped = scrape_tiered([row['URL'] for index, row in rows], scrape_static, is_complete, pool,
+                            needs_browser=needs_browser, cache=cache, scheduler=scheduler, metrics=metrics,
+                            canonicalizer=canonicalizer, report=duplicates)
 
+    for (index, row), (url, fields, error, tier) in zip(rows, scraped):
         page_no = row.get('Page No.', 'N/A')
-        print(f"\nProcessing URL: {url} (Page No.: {page_no})")
-
-        try:
-            driver.get(url)
-            print("URL opened successfully")
-
-            # Wait until the product title is loaded
-            wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'product-title-details')))
-            print("Product title loaded")
-
-            # Get page source and parse it with BeautifulSoup
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-
-            # Extract product title
-            product_title = soup.find('h1', class_='product-title-details').get_text(strip=True) if soup.find('h1', class_='product-title-details') else 'Product title not found'
-
-            # Extract description
-            description = 'Description not found'
-            description_div = soup.find('div', id='product-description')
-            if description_div:
-                tab_content = description_div.find('div', class_='tab-content attributedescription')
-                if tab_content:
-                    for tag in tab_content(['script', 'style', 'video', 'iframe', 'noscript']):
-                        tag.decompose()
-                    for br in tab_content.find_all('br'):
-                        br.replace_with('\n')
-                    description = tab_content.get_text(separator="\n", strip=True)
-
-            # Extract image URLs
-            parsed_url = urlparse(url)
-            base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-            zoom_image_urls = extract_zoom_image_urls(soup, base_url)
-            product_image_urls = extract_image_urls(url)
-
-            # Append results to the list
-            results.append({
-                'Page No.': page_no,
-                'URL': url,
-                'Product Title': product_title,
-                'Description': description,
-                'Zoom Image URLs': ', '.join(zoom_image_urls) if zoom_image_urls else 'No zoom images found',
-                'Product Image URLs': ', '.join(product_image_urls) if product_image_urls else 'No product images found'
-            })
-
-        except Exception as e:
-            print(f"Error processing {url}: {e}")
-            results.append({
-                'Page No.': page_no,
-                'URL': url,
+        result = {'Page No.': page_no, 'URL': url}
+
+        if error is None:
+            print(f"Processed URL: {url} (Page No.: {page_no}, {tier})")
+            result.update(fields)
+            result['Fetch Tier'] = tier
+            journal.record_done(index, result)
+        else:
+            print(f"Error processing {url}: {error}")
+            result.update({
                 'Product Title': 'Error',
                 'Description': 'Error',
                 'Zoom Image URLs': 'Error',
                 'Product Image URLs': 'Error'
             })
+            result.update(dict.fromkeys(SNAPSHOT_STATS))
+            result['Fetch Tier'] = tier
+            journal.record_failed(index, result, error)
 
-    # Save results to Excel
-    results_df = pd.DataFrame(results)
-    output_excel_path = f'D:\\SOWMYA\\python script\\extract Title_ID\\Input\\Toyworld\\Final Output\\output_urls_batch_{batch_number}.xlsx'
-    results_df.to_excel(output_excel_path, index=False)
-    print(f"Batch {batch_number} scraping complete. Results saved to {output_excel_path}")
+    # Results go to the journal; the consolidated file is written from it at the end
+    print(f"Batch {batch_number} scraping complete. {len(rows)} URLs recorded in the journal, "
+          f"{duplicates['saved']} duplicate fetches saved")
 
 # ---------------------------- Main Execution ---------------------------- #
 
-try:
-    excel_path = r'D:\SOWMYA\python script\extract Title_ID\Input\Toyworld\URLS.xlsx'
-    urls_df = pd.read_excel(excel_path)
-    urls_df.dropna(subset=['URL'], inplace=True)
-
-    batch_size = 50
-    num_batches = math.ceil(len(urls_df) / batch_size)
-
-    for batch_number in range(num_batches):
-        start_index = batch_number * batch_size
-        end_index = min((batch_number + 1) * batch_size, len(urls_df))
-        urls_batch = urls_df.iloc[start_index:end_index]
-        print(f"\n--- Processing batch {batch_number + 1}/{num_batches} ---")
-        process_batch(urls_batch, batch_number + 1)
-
-except Exception as e:
-    print(f"An error occurred: {e}")
-
-finally:
-    driver.quit()
-    print("\nWebDriver closed.")
+def work_from_queue():
+    """
+    Runs as one of many workers sharing the job through queue_address.
+    Each row is committed to the queue as soon as it completes; if this worker stops,
+    its unfinished rows are handed to another worker once their leases expire.
+    """
+    queue = open_queue(queue_address)
+    cache = ResponseCache()
+    scheduler = Scheduler(rate=requests_per_second)
+    metrics = RunMetrics()
+    worker = default_worker_name()
+    try:
+        with BrowserPool(make_driver, scrape_product, workers=num_workers, recycle_after=recycle_after) as pool:
+            for batch_number, batch in enumerate(queue.batches(queue_batch_size, worker), 1):
+                print(f"\n--- Processing batch {batch_number} (queue: {queue.counts()}) ---")
+                # The leased batch records rows the same way the journal does
+                process_batch(batch.rows, batch_number, pool, batch, cache, scheduler, metrics)
+        print(f"\nQueue drained: {queue.counts()}")
+        print(f"Export it with: python -m scraping queue export {queue_address} output_urls_all.xlsx")
+    finally:
+        queue.close()
+        metrics.finish()
+        metrics_path = os.path.join(output_dir, f'metrics-{worker}.json')
+        metrics.write(metrics_path)
+        print(f"Run metrics saved to {metrics_path}")
+
+def main():
+    if queue_address:
+        return work_from_queue()
+    journal = Journal(os.path.join(output_dir, 'journal.sqlite3'))
+    cache = ResponseCache()
+    scheduler = Scheduler(rate=requests_per_second)
+    metrics = RunMetrics()
+    try:
+        # Built by hand, or from category pages with `python -m scraping crawl <category URL>... -o URLS.xlsx`
+        excel_path = r'D:\SOWMYA\python script\extract Title_ID\Input\Toyworld\URLS.xlsx'
+        # Stream the sheet in read-only mode and skip empty rows
+        rows = [(index, row) for index, row in enumerate(iter_rows(excel_path)) if not is_blank(row.get('URL'))]
+
+        # Skip URLs finished by a previous run; failed ones are retried
+        journal.add((index, row['URL']) for index, row in rows)
+        pending = journal.pending()
+        rows = [(index, row) for index, row in rows if index in pending]
+        print(f"{len(rows)} URLs left to process (journal: {journal.counts()})")
+
+        batch_size = 50
+        num_batches = math.ceil(len(rows) / batch_size)
+
+        with BrowserPool(make_driver, scrape_product, workers=num_workers, recycle_after=recycle_after) as pool:
+            for batch_number in range(num_batches):
+                start_index = batch_number * batch_size
+                end_index = min((batch_number + 1) * batch_size, len(rows))
+                urls_batch = rows[start_index:end_index]
+                print(f"\n--- Processing batch {batch_number + 1}/{num_batches} ---")
+                process_batch(urls_batch, batch_number + 1, pool, journal, cache, scheduler, metrics)
+        print("\nBrowser workers closed (if any were needed).")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        consolidated_path = os.path.join(output_dir, 'output_urls_all.xlsx')
+        journal.export(consolidated_path)
+        print(f"Consolidated results saved to {consolidated_path}")
+        metrics.finish()
+        metrics_path = os.path.join(output_dir, 'metrics.json')
+        metrics.write(metrics_path)
+        print(f"Run metrics saved to {metrics_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared scraping engine used by the Streamlit dashboard and the client scripts."""
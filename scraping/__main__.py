@@ -0,0 +1,7 @@
+import sys
+
+from scraping.cli import main
+
+# Guarded so that `queue work --processes` children started with spawn do not rerun the CLI
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+"""
+A pool of headless Chrome workers for the Selenium client scrapers.
+
+Each worker is a separate process owning its own driver and pulling URLs from
+a shared queue. Before every page the worker checks that its browser still
+responds, and it replaces the driver after a fixed number of pages or after a
+crash. If a whole worker process dies, its in-flight URL is requeued and a new
+worker is started. Results are handed back in input order. Browsers are only
+launched on the first call to imap(), so a pool nobody ends up needing costs
+nothing.
+
+Pages are rendered once into a PageSnapshot: the worker navigates a single
+time, waits on the page's declared readiness conditions instead of sleeping,
+and both DOM-based and soup-based extractors then read from that render.
+
+Each client can also declare a NetworkPolicy listing the resource types and
+URL patterns the browser should not download (images, fonts, media,
+trackers). With the policy installed, every snapshot reports the bytes the
+page downloaded, its navigation time and its time to readiness.
+
+The driver factory and page function are pickled into the workers, so they
+must be module-level functions, and the calling script must keep its own
+start-up code under ``if __name__ == "__main__":``.
+"""
+import multiprocessing
+import os
+import queue
+import json
+import time
+from collections import namedtuple
+
+from scraping.page import Page
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_RECYCLE_AFTER = 100
+MAX_ATTEMPTS = 2
+# The per-page columns a render adds, in order; the network ones need performance logging
+SNAPSHOT_STATS = ("Ready Seconds", "Navigation Seconds", "Wait Seconds", "Bytes Downloaded", "Requests",
+                  "Blocked Requests")
+# Seconds with no message and no task in progress before tasks whose claim was
+# lost with a dead worker are retried
+STALL_SECONDS = 60
+
+Condition = namedtuple("Condition", ["by", "selector", "timeout", "required"])
+
+NetworkPolicy = namedtuple(
+    "NetworkPolicy",
+    ["block_images", "block_fonts", "block_media", "block_stylesheets", "block_trackers", "blocked_urls"],
+    defaults=(False, False, False, False, False, ()),
+)
+NetworkPolicy.__doc__ = """
+Resources a client's pages can be rendered without.
+
+Attributes:
+    block_images (bool): Do not download images; src/href attributes are still in the DOM.
+    block_fonts (bool): Do not download web fonts.
+    block_media (bool): Do not download audio and video.
+    block_stylesheets (bool): Do not download CSS. Only safe when no readiness
+        condition depends on styling.
+    block_trackers (bool): Block the analytics and ad hosts in TRACKER_URLS.
+    blocked_urls (tuple): Extra URL patterns to block, with * wildcards.
+"""
+
+FONT_URLS = ("*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot")
+MEDIA_URLS = ("*.mp4", "*.webm", "*.m3u8", "*.mp3", "*.ogg", "*.mov", "*youtube.com/embed*", "*player.vimeo.com*")
+IMAGE_URLS = ("*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico")
+STYLESHEET_URLS = ("*.css",)
+TRACKER_URLS = (
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googleadservices.com*",
+    "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*bat.bing.com*", "*clarity.ms*",
+    "*tiktok.com/i18n/pixel*", "*analytics.tiktok.com*", "*pinterest.com/ct*", "*snap.licdn.com*",
+    "*klaviyo.com*", "*newrelic.com*", "*nr-data.net*",
+)
+
+
+def blocked_url_patterns(policy):
+    """Expands a NetworkPolicy into the URL patterns passed to Chrome."""
+    patterns = list(policy.blocked_urls)
+    if policy.block_images:
+        patterns += IMAGE_URLS
+    if policy.block_fonts:
+        patterns += FONT_URLS
+    if policy.block_media:
+        patterns += MEDIA_URLS
+    if policy.block_stylesheets:
+        patterns += STYLESHEET_URLS
+    if policy.block_trackers:
+        patterns += TRACKER_URLS
+    return patterns
+
+
+def apply_policy(options, policy):
+    """
+    Configures Chrome options for a NetworkPolicy.
+
+    Images are switched off through Chrome content settings, and performance
+    logging is enabled so snapshots can account for downloaded bytes.
+
+    Returns:
+        Options: The same options object.
+    """
+    if policy.block_images:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return options
+
+
+def install_policy(driver, policy):
+    """
+    Blocks the policy's URL patterns on a running driver through the DevTools protocol.
+
+    Returns:
+        WebDriver: The same driver.
+    """
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_url_patterns(policy)})
+    return driver
+
+
+def _network_log(driver):
+    """
+    Drains the performance log and sums up the page's network traffic.
+
+    Returns:
+        dict: Bytes downloaded, finished and blocked requests; empty when
+        performance logging is not enabled.
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return {}
+    downloaded = finished = blocked = 0
+    for entry in entries:
+        message = json.loads(entry["message"])["message"]
+        if message["method"] == "Network.loadingFinished":
+            downloaded += message["params"].get("encodedDataLength", 0)
+            finished += 1
+        elif message["method"] == "Network.loadingFailed" and message["params"].get("blockedReason"):
+            blocked += 1
+    return {"Bytes Downloaded": int(downloaded), "Requests": finished, "Blocked Requests": blocked}
+
+
+def ready(by, selector, timeout=30, required=True):
+    """
+    Declares a readiness condition: an element matching selector is present.
+
+    Args:
+        by (str): A selenium By strategy, e.g. By.CSS_SELECTOR.
+        selector (str): The locator value.
+        timeout (float): Seconds to wait for it.
+        required (bool): Whether a timeout fails the page. Optional conditions
+            just stop waiting, e.g. for a carousel some products do not have.
+    """
+    return Condition(by, selector, timeout, required)
+
+
+class PageSnapshot(Page):
+    """
+    One rendered page, shared by every extractor that needs it.
+
+    A Page of the rendered HTML, so specs and extractors run on it exactly as
+    on a page fetched over HTTP (tree, meta and soup views included), plus
+    the live browser for DOM queries.
+
+    Attributes:
+        driver (WebDriver): The browser, still showing this page, for DOM queries.
+        url (str): The rendered URL.
+        html (str): driver.page_source once the conditions were met.
+        waits (dict): Seconds spent on each condition selector, None if it timed out.
+        stats (dict): "Ready Seconds" from navigation to readiness, split into
+            "Navigation Seconds" (driver.get) and "Wait Seconds" (the
+            conditions), and, when
+            performance logging is on, "Bytes Downloaded", "Requests" and
+            "Blocked Requests".
+    """
+
+    def __init__(self, driver, url, html, waits, stats=None):
+        super().__init__(url, html, parser="html.parser")
+        self.driver = driver
+        self.waits = waits
+        self.stats = stats or {}
+
+    def find_elements(self, by, selector):
+        """Queries the live DOM of this render without navigating again."""
+        return self.driver.find_elements(by, selector)
+
+
+def render(driver, url, conditions=()):
+    """
+    Navigates to url once and waits for its readiness conditions.
+
+    Args:
+        driver (WebDriver): The browser to use.
+        url (str): The page to render.
+        conditions (list): Condition tuples, waited on in order.
+
+    Returns:
+        PageSnapshot: The rendered page.
+
+    Raises:
+        TimeoutException: If a required condition is not met in time.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    _network_log(driver)  # discard traffic from before this page
+    navigated = time.time()
+    driver.get(url)
+    loaded = time.time()
+    waits = {}
+    for condition in conditions:
+        started = time.time()
+        try:
+            WebDriverWait(driver, condition.timeout).until(
+                EC.presence_of_element_located((condition.by, condition.selector))
+            )
+            waits[condition.selector] = time.time() - started
+        except TimeoutException:
+            if condition.required:
+                raise
+            waits[condition.selector] = None
+    done = time.time()
+    stats = {
+        "Ready Seconds": round(done - navigated, 3),
+        "Navigation Seconds": round(loaded - navigated, 3),
+        "Wait Seconds": round(done - loaded, 3),
+    }
+    stats.update(_network_log(driver))
+    return PageSnapshot(driver, url, driver.page_source, waits, stats)
+
+
+def _healthy(driver):
+    """Returns True if the browser behind driver still answers commands."""
+    try:
+        driver.execute_script("return 1")
+        return True
+    except Exception:
+        return False
+
+
+def _quit(driver):
+    if driver is not None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+def _worker(worker_id, make_driver, scrape, tasks, results, recycle_after):
+    """
+    Worker process loop: claim a task, make sure the driver is usable, scrape.
+    """
+    driver = None
+    pages = 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, payload = task
+        results.put(("claim", worker_id, seq, None))
+        try:
+            if driver is None or pages >= recycle_after or not _healthy(driver):
+                _quit(driver)
+                driver = None
+                driver = make_driver()
+                pages = 0
+            value = scrape(driver, payload)
+            results.put(("done", worker_id, seq, value))
+        except Exception as e:
+            results.put(("error", worker_id, seq, f"{type(e).__name__}: {e}"))
+        pages += 1
+    _quit(driver)
+
+
+class BrowserPool:
+    """
+    Renders pages on N browser worker processes.
+
+    Args:
+        make_driver (callable): Creates a new WebDriver; called inside the worker.
+        scrape (callable): scrape(driver, payload) -> picklable result.
+        workers (int): Number of browser processes.
+        recycle_after (int): Pages rendered before a driver is replaced.
+
+    Usage:
+        with BrowserPool(make_driver, scrape_product, workers=4) as pool:
+            for payload, result, error in pool.imap(urls):
+                ...
+    """
+
+    def __init__(self, make_driver, scrape, workers=DEFAULT_WORKERS, recycle_after=DEFAULT_RECYCLE_AFTER):
+        self.make_driver = make_driver
+        self.scrape = scrape
+        self.workers = max(1, int(workers))
+        self.recycle_after = max(1, int(recycle_after))
+        self._ctx = multiprocessing.get_context("spawn")
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._processes = {}
+        self._next_worker = 0
+        self._payloads = []
+        self._exit_codes = {}
+        self._unclaimed_deaths = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _spawn(self):
+        worker_id = self._next_worker
+        self._next_worker += 1
+        process = self._ctx.Process(
+            target=_worker,
+            args=(worker_id, self.make_driver, self.scrape, self._tasks, self._results, self.recycle_after),
+            daemon=True,
+        )
+        process.start()
+        self._processes[worker_id] = process
+
+    def start(self):
+        while len(self._processes) < self.workers:
+            self._spawn()
+
+    def _retry(self, seq, attempts, worker_id):
+        """
+        Counts a lost attempt at seq and requeues it.
+
+        Returns:
+            str: The error once seq has used up its attempts, else None.
+        """
+        attempts[seq] += 1
+        if attempts[seq] >= MAX_ATTEMPTS:
+            code = self._exit_codes.get(worker_id)
+            return "Worker process died" + (f" (exit code {code})" if code is not None else "")
+        self._tasks.put((seq, self._payloads[seq]))
+        return None
+
+    def _reap(self, claimed, attempts):
+        """
+        Replaces dead workers and requeues the task each one was working on.
+
+        Returns:
+            list: (seq, error) for tasks that have used up their attempts.
+        """
+        failed = []
+        for worker_id, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            del self._processes[worker_id]
+            self._exit_codes[worker_id] = process.exitcode
+            seq = claimed.pop(worker_id, None)
+            if seq is None:
+                # Its claim may still be unread, or lost with the process
+                self._unclaimed_deaths += 1
+            else:
+                error = self._retry(seq, attempts, worker_id)
+                if error:
+                    failed.append((seq, error))
+            self._spawn()
+        return failed
+
+    def _drain(self):
+        """Every message waiting on the results queue, waiting up to a second for the first."""
+        messages = []
+        try:
+            messages.append(self._results.get(timeout=1))
+            while True:
+                messages.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def imap(self, payloads):
+        """
+        Scrapes every payload and yields (payload, result, error) in input order.
+
+        error is None on success; otherwise result is None and error describes
+        what went wrong.
+        """
+        self._payloads = list(payloads)
+        self.start()
+        for seq, payload in enumerate(self._payloads):
+            self._tasks.put((seq, payload))
+
+        attempts = [0] * len(self._payloads)
+        claimed = {}
+        finished = {}
+        next_seq = 0
+        quiet_since = time.monotonic()
+        while next_seq < len(self._payloads):
+            # Read every pending claim before reaping, so a dead worker's task is known
+            messages = self._drain()
+            for kind, worker_id, seq, value in messages:
+                done = seq < next_seq or seq in finished
+                if kind == "claim":
+                    if worker_id in self._processes:
+                        claimed[worker_id] = seq
+                    else:
+                        # The worker was reaped before its claim was read
+                        self._unclaimed_deaths = max(0, self._unclaimed_deaths - 1)
+                        error = None if done else self._retry(seq, attempts, worker_id)
+                        if error:
+                            finished[seq] = (None, error)
+                else:
+                    if claimed.get(worker_id) == seq:
+                        del claimed[worker_id]
+                    # A requeued task can finish twice; keep the first result
+                    if not done:
+                        finished[seq] = (value, None) if kind == "done" else (None, value)
+            for seq, error in self._reap(claimed, attempts):
+                finished[seq] = (None, error)
+
+            now = time.monotonic()
+            if messages or claimed:
+                quiet_since = now
+            elif self._unclaimed_deaths and now - quiet_since > STALL_SECONDS:
+                # Nobody is working and a dead worker's claim never arrived: retry what is left
+                self._unclaimed_deaths = 0
+                quiet_since = now
+                for seq in range(next_seq, len(self._payloads)):
+                    if seq not in finished:
+                        error = self._retry(seq, attempts, None)
+                        if error:
+                            finished[seq] = (None, error)
+
+            while next_seq in finished:
+                result, error = finished.pop(next_seq)
+                yield self._payloads[next_seq], result, error
+                next_seq += 1
+
+    def close(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._processes = {}
@@ -0,0 +1,274 @@
+"""
+Persistent on-disk HTTP response cache.
+
+Bodies are stored content-addressed (by SHA-256) under the cache directory and
+indexed in SQLite by normalized URL, so the same sheet can be run through
+several cards without downloading every page again. Entries younger than the
+TTL are served directly; older ones are revalidated with a conditional GET
+using the stored ETag / Last-Modified. The total body size is bounded and the
+least recently used entries are evicted first.
+
+In offline mode the network is never touched: cached entries are served
+regardless of age and a miss raises CacheMiss.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SCRAPER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "web_scraping", "responses")
+)
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Response headers worth replaying; hop-by-hop and length headers are dropped
+# because the stored body is already decoded.
+KEPT_HEADERS = ("content-type", "etag", "last-modified", "date", "cache-control", "expires")
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a URL has never been cached."""
+
+
+def normalize_url(url):
+    """
+    Normalizes a URL for use as a cache key.
+
+    The scheme and host are lowercased, default ports and fragments dropped and
+    query parameters sorted, so trivially different spellings share an entry.
+    """
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class CacheEntry:
+    """
+    A cached response plus the metadata needed to revalidate it.
+    """
+
+    def __init__(self, url, status, headers, encoding, body, stored_at):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.encoding = encoding
+        self.body = body
+        self.stored_at = stored_at
+
+    def age(self):
+        return time.time() - self.stored_at
+
+    def validators(self):
+        """Request headers for a conditional GET against this entry."""
+        headers = {}
+        if self.headers.get("etag"):
+            headers["If-None-Match"] = self.headers["etag"]
+        if self.headers.get("last-modified"):
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+    def to_response(self):
+        """Rebuilds a requests.Response so callers cannot tell it was cached."""
+        response = Response()
+        response.url = self.url
+        response.status_code = self.status
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        response._content = self.body
+        response.from_cache = True
+        return response
+
+
+class ResponseCache:
+    """
+    A size-bounded, TTL-aware response cache shared across threads and processes.
+
+    Args:
+        directory (str): Where the index and bodies are stored.
+        ttl (float): Seconds an entry is served without revalidation.
+        max_bytes (int): Upper bound on the total size of stored bodies.
+        offline (bool): Serve only from the cache and never hit the network.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                encoding TEXT,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._db.commit()
+
+    def _body_path(self, body_hash):
+        return os.path.join(self.directory, "bodies", body_hash[:2], body_hash)
+
+    def is_fresh(self, entry):
+        return entry.age() < self.ttl
+
+    def lookup(self, url):
+        """
+        Returns the CacheEntry for url, or None. Stale entries are returned too.
+        """
+        key = normalize_url(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, status, headers, encoding, body_hash, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        cached_url, status, headers, encoding, body_hash, stored_at = row
+        try:
+            with open(self._body_path(body_hash), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            self.delete(url)
+            return None
+        return CacheEntry(cached_url, status, json.loads(headers), encoding, body, stored_at)
+
+    def store(self, url, response):
+        """
+        Stores a successful response and evicts old entries if over the size bound.
+        """
+        body = response.content
+        body_hash = hashlib.sha256(body).hexdigest()
+        path = self._body_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS}
+        headers = {k.lower(): v for k, v in headers.items()}
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), response.url or url, response.status_code, json.dumps(headers),
+                 response.encoding, body_hash, len(body), now, now),
+            )
+            self._db.commit()
+        self.evict()
+
+    def refresh(self, url, response):
+        """
+        Marks an entry fresh again after a 304 Not Modified revalidation.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT headers FROM entries WHERE key = ?", (normalize_url(url),)).fetchone()
+            if row is None:
+                return
+            headers = json.loads(row[0])
+            for name, value in response.headers.items():
+                if name.lower() in ("etag", "last-modified", "date", "cache-control", "expires"):
+                    headers[name.lower()] = value
+            self._db.execute(
+                "UPDATE entries SET headers = ?, stored_at = ?, accessed_at = ? WHERE key = ?",
+                (json.dumps(headers), now, now, normalize_url(url)),
+            )
+            self._db.commit()
+
+    def delete(self, url):
+        with self._lock:
+            self._delete_keys([normalize_url(url)])
+            self._db.commit()
+
+    def _delete_keys(self, keys):
+        for key in keys:
+            row = self._db.execute("SELECT body_hash FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if row is None:
+                continue
+            shared = self._db.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (row[0],)).fetchone()
+            if shared is None:
+                try:
+                    os.remove(self._body_path(row[0]))
+                except FileNotFoundError:
+                    pass
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """
+        Drops least recently used entries until the cache fits in max_bytes.
+        """
+        if self.total_bytes() <= self.max_bytes:
+            return
+        with self._lock:
+            total = 0
+            keep = True
+            victims = []
+            for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at DESC"):
+                total += size
+                if keep and total > self.max_bytes:
+                    keep = False
+                if not keep:
+                    victims.append(key)
+            self._delete_keys(victims)
+            self._db.commit()
+
+    def fetch(self, url, get):
+        """
+        Fetches url through the cache, revalidating stale entries.
+
+        Args:
+            url (str): The page to fetch.
+            get (callable): get(url, headers) -> requests.Response, used on a
+                miss or to revalidate.
+
+        Returns:
+            requests.Response: The live or cached response.
+
+        Raises:
+            CacheMiss: In offline mode when url is not cached.
+        """
+        entry = self.lookup(url)
+        if entry is not None and (self.offline or self.is_fresh(entry)):
+            return entry.to_response()
+        if self.offline:
+            raise CacheMiss(f"Not in cache (offline mode): {url}")
+
+        headers = entry.validators() if entry is not None else {}
+        response = get(url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.refresh(url, response)
+            return entry.to_response()
+        # A head-only read must not be replayed later as the whole page
+        if response.status_code == 200 and not getattr(response, "partial", False):
+            self.store(url, response)
+        response.from_cache = False
+        return response
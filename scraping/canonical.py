@@ -0,0 +1,175 @@
+"""
+URL canonicalisation and fetch de-duplication.
+
+Product sheets often list the same page several times: variants sharing a
+URL, tracking parameters, http vs https, trailing slashes. A Canonicalizer
+maps every spelling of a page to one key, so each page is fetched once and
+its extracted columns are fanned out to every ProductID that references it.
+
+Which query parameters identify a page is decided per host. By default the
+well-known tracking parameters are dropped and everything else is kept; a
+host rule can instead list the only parameters that matter ("keep") or
+extra ones to ignore ("drop"). Rules can be loaded from a JSON file:
+
+    {
+        "example.com": {"keep": ["variant"]},
+        "shop.example.org": {"drop": ["sort", "page_size"]}
+    }
+
+A rule for example.com also applies to www.example.com and other subdomains.
+"""
+import json
+from collections import Counter, namedtuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+TRACKING_PARAMS = (
+    "gclid", "gbraid", "wbraid", "dclid", "fbclid", "msclkid", "yclid", "twclid", "ttclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "srsltid", "epik", "pk_campaign", "pk_kwd",
+)
+TRACKING_PREFIXES = ("utm_",)
+MAX_VARIANTS = 5
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+HostRule = namedtuple("HostRule", ["keep", "drop"], defaults=(None, ()))
+HostRule.__doc__ = """
+Which query parameters identify a page on one host.
+
+Attributes:
+    keep (tuple): If set, the only parameters kept; all others are ignored.
+    drop (tuple): Parameters ignored in addition to the tracking ones.
+"""
+
+
+def load_rules(path):
+    """
+    Reads per-host rules from a JSON file mapping host to {"keep": [...]} / {"drop": [...]}.
+
+    Raises:
+        ValueError: If the file is not valid JSON or a rule has unknown keys.
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in {path}: {e}") from None
+    rules = {}
+    for host, rule in data.items():
+        unknown = set(rule) - {"keep", "drop"}
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in the URL rule for {host!r}")
+        keep = rule.get("keep")
+        rules[host.lower()] = HostRule(tuple(keep) if keep is not None else None, tuple(rule.get("drop", ())))
+    return rules
+
+
+class Canonicalizer:
+    """
+    Maps URLs to the canonical key used to de-duplicate fetches.
+
+    The scheme is unified to https (when prefer_https), the host lowercased,
+    default ports, fragments and trailing slashes dropped, query parameters
+    filtered by the host's rule and sorted.
+
+    Args:
+        rules (dict): Host to HostRule.
+        prefer_https (bool): Treat http:// and https:// as the same page.
+    """
+
+    def __init__(self, rules=None, prefer_https=True):
+        self.rules = rules or {}
+        self.prefer_https = prefer_https
+
+    def rule(self, host):
+        """Returns the HostRule for host or its closest parent domain."""
+        parts = host.split(".")
+        for i in range(len(parts)):
+            rule = self.rules.get(".".join(parts[i:]))
+            if rule is not None:
+                return rule
+        return HostRule()
+
+    def _keeps(self, name, rule):
+        if rule.keep is not None:
+            return name in rule.keep
+        lowered = name.lower()
+        return (lowered not in TRACKING_PARAMS and not lowered.startswith(TRACKING_PREFIXES)
+                and name not in rule.drop)
+
+    def __call__(self, url):
+        try:
+            parts = urlsplit(str(url).strip())
+            port = parts.port
+        except ValueError:
+            return str(url)
+        scheme = parts.scheme.lower()
+        if self.prefer_https and scheme == "http":
+            scheme = "https"
+        host = (parts.hostname or "").lower()
+        if port and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+            host = f"{host}:{port}"
+        path = parts.path.rstrip("/") or "/"
+        rule = self.rule(host.split(":")[0])
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if self._keeps(k, rule)]
+        return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+class DedupePlan:
+    """
+    The fetch plan for a list of (URL, ProductID) rows.
+
+    Attributes:
+        rows (list): The input rows.
+        keys (list): The canonical key of each row.
+        unique (list): The first row of each canonical URL, in input order;
+            these are the only rows fetched.
+    """
+
+    def __init__(self, rows, canonicalizer):
+        self.rows = list(rows)
+        self.keys = [canonicalizer(url) for url, _ in self.rows]
+        first = {}
+        for i, key in enumerate(self.keys):
+            first.setdefault(key, i)
+        self.unique = [self.rows[i] for i in first.values()]
+
+    def report(self):
+        """
+        Summarises the collapse: rows, unique pages, fetches saved and the
+        canonical URLs that absorbed duplicates, most duplicated first.
+        """
+        counts = Counter(self.keys)
+        variants = {}
+        for (url, _), key in zip(self.rows, self.keys):
+            if counts[key] > 1:
+                seen = variants.setdefault(key, [])
+                if url not in seen and len(seen) < MAX_VARIANTS:
+                    seen.append(url)
+        return {
+            "rows": len(self.rows),
+            "unique": len(self.unique),
+            "saved": len(self.rows) - len(self.unique),
+            "collapsed": [
+                {"canonical": key, "rows": count, "variants": variants[key]}
+                for key, count in counts.most_common() if count > 1
+            ],
+        }
+
+    def fan_out(self, results):
+        """
+        Yields (row, result) for every input row, in input order.
+
+        Args:
+            results (iterable): The result for each row of unique, in order;
+                consumed lazily, so it can be a streaming map. A result is
+                dropped once its last row has been yielded.
+        """
+        results = iter(results)
+        remaining = Counter(self.keys)
+        held = {}
+        for row, key in zip(self.rows, self.keys):
+            if key not in held:
+                held[key] = next(results)
+            yield row, held[key]
+            remaining[key] -= 1
+            if not remaining[key]:
+                del held[key]
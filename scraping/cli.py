@@ -0,0 +1,480 @@
+"""
+Headless batch entry point for the extractors.
+
+    python -m scraping list
+    python -m scraping run "Info Extractor" products.xlsx -o info.csv --workers 32
+    python -m scraping export-journal "Final Output/journal.sqlite3" all.xlsx
+    python -m scraping monitor "Total Tools Price" catalogue.xlsx -o price-changes.csv
+    python -m scraping crawl https://www.toyworld.com.au/lego -o URLS.xlsx --rules listing-rules.json
+    python -m scraping crawl https://www.example.com/sitemap.xml -o info.csv --extractor "Info Extractor"
+
+Several workers, on one machine or many, can share a job through a queue:
+
+    python -m scraping queue add jobs.sqlite3 products.xlsx --extractor "Info Extractor"
+    python -m scraping queue serve jobs.sqlite3 --host 0.0.0.0 --token s3cret
+    python -m scraping queue work http://10.0.0.5:8765 --token s3cret    # on each worker
+    python -m scraping queue export jobs.sqlite3 info.csv
+
+Only the modules the chosen extractor needs are imported: no Streamlit, no
+Selenium and no pandas; sheets are streamed in and out.
+"""
+import argparse
+import os
+import sys
+
+from scraping.fetch import DEFAULT_WORKERS, DEFAULT_PER_HOST
+from scraping.page import DEFAULT_PARSER, PARSERS
+from scraping.ratelimit import DEFAULT_RATE
+from scraping.monitor import DEFAULT_STATE_PATH
+from scraping.workqueue import DEFAULT_BATCH_SIZE, DEFAULT_LEASE_SECONDS, DEFAULT_PORT
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m scraping", description="Run the product extractors in batch.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List the available extractors.")
+
+    run = commands.add_parser("run", help="Run extractors over a product sheet.")
+    run.add_argument("extractors", nargs="+", metavar="EXTRACTOR",
+                     help="Extractor name(s) as shown on the dashboard cards; several run in one pass.")
+    run.add_argument("input", help="Sheet with URL and ProductID columns (.xlsx, .csv or .parquet).")
+    run.add_argument("-o", "--output", required=True, help="Output file (.csv, .parquet or .xlsx).")
+    run.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent requests.")
+    run.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST, help="Maximum concurrent requests per host.")
+    run.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                     help="Requests per second per host; transient errors are retried with backoff. 0 disables both.")
+    run.add_argument("--parser", default=DEFAULT_PARSER, choices=PARSERS, help="BeautifulSoup tree builder.")
+    run.add_argument("--cache-dir", help="Cache pages on disk in this directory.")
+    run.add_argument("--cache-ttl", type=float, help="Seconds a cached page is used without revalidation.")
+    run.add_argument("--offline", action="store_true", help="Serve only cached pages; requires --cache-dir.")
+    run.add_argument("--no-dedupe", dest="dedupe", action="store_false",
+                     help="Fetch every row even when several rows point at the same page.")
+    run.add_argument("--url-rules", help="JSON file of per-host query parameters that identify a page.")
+    run.add_argument("--timings", action="store_true",
+                     help="Add DNS/connect/TTFB/download, size, parse and extract time columns.")
+    run.add_argument("--metrics", help="Write p50/p95/p99 latency per host and per extractor to this JSON file.")
+    run.add_argument("--verify-images", nargs="?", const="range", choices=("range", "head"),
+                     help="Probe every image URL in the output and add a Check column after each image column; "
+                          "'head' skips the pixel dimensions.")
+    run.add_argument("--image-report", help="Write every probed image URL and its result to this file.")
+    run.add_argument("--progress-every", type=int, default=100, help="Print progress every N rows.")
+
+    monitor = commands.add_parser("monitor", help="Recheck a sheet and output only what changed since the last run.")
+    monitor.add_argument("extractors", nargs="+", metavar="EXTRACTOR", help="Extractor name(s) whose columns are monitored.")
+    monitor.add_argument("input", help="Sheet with URL and ProductID columns (.xlsx, .csv or .parquet).")
+    monitor.add_argument("-o", "--output", required=True, help="Change set file (.csv, .parquet or .xlsx).")
+    monitor.add_argument("--state", default=DEFAULT_STATE_PATH,
+                         help="Database of the last fields, validators and content hash per URL.")
+    monitor.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent requests.")
+    monitor.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST, help="Maximum concurrent requests per host.")
+    monitor.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                         help="Requests per second per host; transient errors are retried with backoff. 0 disables both.")
+    monitor.add_argument("--parser", default=DEFAULT_PARSER, choices=PARSERS, help="BeautifulSoup tree builder.")
+    monitor.add_argument("--progress-every", type=int, default=100, help="Print progress every N rows.")
+
+    crawl = commands.add_parser("crawl", help="Collect product URLs from category listings and sitemaps.")
+    crawl.add_argument("seeds", nargs="+", metavar="URL",
+                       help="Category listing or sitemap URLs, or a sheet with a URL column of them.")
+    crawl.add_argument("-o", "--output", required=True,
+                       help="URL sheet with ProductID, URL, Page No. and Category columns (.xlsx, .csv or .parquet); "
+                            "with --extractor, the extracted rows.")
+    crawl.add_argument("--rules", help="JSON file of per-host product and pagination patterns.")
+    crawl.add_argument("--extractor", dest="extractors", action="append", metavar="EXTRACTOR",
+                       help="Run this extractor over the products while they are found; repeat for several.")
+    crawl.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent requests.")
+    crawl.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST, help="Maximum concurrent requests per host.")
+    crawl.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                       help="Requests per second per host; transient errors are retried with backoff. 0 disables both.")
+    crawl.add_argument("--ignore-robots", dest="robots", action="store_false", help="Do not read robots.txt.")
+    crawl.add_argument("--parser", default=DEFAULT_PARSER, choices=PARSERS, help="BeautifulSoup tree builder.")
+    crawl.add_argument("--cache-dir", help="Cache pages on disk in this directory.")
+    crawl.add_argument("--progress-every", type=int, default=1000, help="Print progress every N products.")
+
+    queue = commands.add_parser("queue", help="Share a job between worker processes and machines.")
+    queue_commands = queue.add_subparsers(dest="queue_command", required=True)
+    address_help = "A queue database file, or the http:// address of `queue serve`."
+
+    add = queue_commands.add_parser("add", help="Queue the rows of a product sheet.")
+    add.add_argument("queue", help=address_help)
+    add.add_argument("input", help="Sheet with a URL column (.xlsx, .csv or .parquet); every column is queued.")
+    add.add_argument("--extractor", dest="extractors", action="append", metavar="EXTRACTOR",
+                     help="Extractor the `queue work` workers run; repeat for several.")
+    add.add_argument("--token", help="Token of a queue server; defaults to $SCRAPER_QUEUE_TOKEN.")
+
+    work = queue_commands.add_parser("work", help="Claim and process rows until the queue is drained.")
+    work.add_argument("queue", help=address_help)
+    work.add_argument("--processes", type=int, default=1, help="Worker processes started on this machine.")
+    work.add_argument("--batch", type=int, default=DEFAULT_BATCH_SIZE, help="Rows claimed at a time.")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                      help="Seconds before the rows of a silent worker are handed to another.")
+    work.add_argument("--token", help="Token of a queue server; defaults to $SCRAPER_QUEUE_TOKEN.")
+    work.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent requests per process.")
+    work.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST, help="Maximum concurrent requests per host.")
+    work.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                      help="Requests per second per host and process. 0 disables rate limiting and retries.")
+    work.add_argument("--parser", default=DEFAULT_PARSER, choices=PARSERS, help="BeautifulSoup tree builder.")
+    work.add_argument("--cache-dir", help="Cache pages on disk in this directory.")
+
+    serve = queue_commands.add_parser("serve", help="Serve a queue database to workers on other machines.")
+    serve.add_argument("queue", help="The queue database file.")
+    serve.add_argument("--host", default="127.0.0.1", help="Interface to listen on; 0.0.0.0 for every one.")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--token", help="Require this bearer token; defaults to $SCRAPER_QUEUE_TOKEN.")
+
+    for name, text in (("status", "Show how many rows are pending, leased, done and failed."),
+                       ("retry", "Put the rows that used up their attempts back in the queue.")):
+        command = queue_commands.add_parser(name, help=text)
+        command.add_argument("queue", help=address_help)
+        command.add_argument("--token", help="Token of a queue server; defaults to $SCRAPER_QUEUE_TOKEN.")
+
+    queue_export = queue_commands.add_parser("export", help="Export the queue's results to one file.")
+    queue_export.add_argument("queue", help=address_help)
+    queue_export.add_argument("output", help="Consolidated output file (.xlsx, .csv or .parquet).")
+    queue_export.add_argument("--token", help="Token of a queue server; defaults to $SCRAPER_QUEUE_TOKEN.")
+
+    export = commands.add_parser("export-journal", help="Export a client scraper journal to one file.")
+    export.add_argument("journal", help="The journal.sqlite3 written by a client script.")
+    export.add_argument("output", help="Consolidated output file (.xlsx, .csv or .parquet).")
+    return parser
+
+
+def list_extractors():
+    from scraping.extractors import EXTRACTORS
+    from scraping.plugins import discover
+
+    discover()
+    for name, extractor in EXTRACTORS.items():
+        print(f"{name}\t({extractor.needs}, {extractor.region})")
+    return 0
+
+
+def run(args):
+    from scraping.extractors import get_extractor
+    from scraping.metrics import RunMetrics
+    from scraping.plugins import discover
+    from scraping.pipeline import run_rows
+    from scraping.sheets import read_pairs
+    from scraping.sinks import RowSpool
+
+    discover()
+    for name in args.extractors:
+        get_extractor(name)
+
+    cache = None
+    if args.cache_dir:
+        from scraping.cache import ResponseCache, DEFAULT_TTL
+
+        ttl = DEFAULT_TTL if args.cache_ttl is None else args.cache_ttl
+        cache = ResponseCache(args.cache_dir, ttl=ttl, offline=args.offline)
+    elif args.offline:
+        raise ValueError("--offline needs --cache-dir")
+
+    scheduler = None
+    if args.rate > 0:
+        from scraping.ratelimit import Scheduler
+
+        scheduler = Scheduler(rate=args.rate, max_per_host=args.per_host)
+
+    canonicalizer = None
+    if args.dedupe:
+        from scraping.canonical import Canonicalizer, load_rules
+
+        canonicalizer = Canonicalizer(load_rules(args.url_rules) if args.url_rules else None)
+
+    verifier = None
+    if args.verify_images:
+        from scraping.images import ImageVerifier, ProbeCache
+
+        probe_cache = ProbeCache(os.path.join(args.cache_dir, "images.sqlite3")) if args.cache_dir else ProbeCache()
+        verifier = ImageVerifier(probe_cache, scheduler, max_workers=args.workers, per_host=args.per_host,
+                                 dimensions=args.verify_images == "range")
+    elif args.image_report:
+        raise ValueError("--image-report needs --verify-images")
+
+    pairs = read_pairs(args.input)
+    duplicates = {}
+
+    metrics = RunMetrics()
+    with RowSpool(preview_rows=0) as spool:
+        results = run_rows(args.extractors, pairs, max_workers=args.workers, per_host=args.per_host,
+                           parser=args.parser, cache=cache, scheduler=scheduler,
+                           metrics=metrics, timing_columns=args.timings,
+                           canonicalizer=canonicalizer, report=duplicates)
+        if verifier is not None:
+            results = verifier.verify(results)
+        for result in results:
+            spool.append(result)
+            if spool.count % args.progress_every == 0:
+                print(f"{spool.count}/{len(pairs)} rows", file=sys.stderr)
+        spool.save(args.output)
+
+    metrics.finish()
+    summary = metrics.summary()
+    print(f"Done: {spool.count} rows in {summary['elapsed_seconds']:.1f}s -> {args.output}", file=sys.stderr)
+    if duplicates.get("saved"):
+        print(f"  {duplicates['saved']} duplicate rows shared a fetch ({duplicates['unique']} unique pages); "
+              f"most collapsed: {duplicates['collapsed'][0]['canonical']} x{duplicates['collapsed'][0]['rows']}",
+              file=sys.stderr)
+    if verifier is not None:
+        print(f"  {len(verifier.probes)} image URLs probed, {len(verifier.broken())} broken", file=sys.stderr)
+        if args.image_report:
+            with RowSpool(preview_rows=0) as report:
+                for row in verifier.table():
+                    report.append(row)
+                report.save(args.image_report)
+    for host, stats in summary["hosts"].items():
+        print(f"  {host}: p50 {stats['p50']}s, p95 {stats['p95']}s, p99 {stats['p99']}s, {stats['errors']} errors",
+              file=sys.stderr)
+    for name, stats in summary["patterns"].items():
+        if stats["timeouts"]:
+            print(f"  {name}: {stats['timeouts']} of {stats['calls']} pages ran out of their CPU budget",
+                  file=sys.stderr)
+    if args.metrics:
+        metrics.write(args.metrics)
+    return 0
+
+
+def monitor(args):
+    from scraping.extractors import get_extractor
+    from scraping.monitor import MonitorStore, Outcomes, run_monitor, CHANGE_COLUMNS
+    from scraping.plugins import discover
+    from scraping.sheets import read_pairs
+    from scraping.sinks import RowSpool
+
+    discover()
+    for name in args.extractors:
+        get_extractor(name)
+    scheduler = None
+    if args.rate > 0:
+        from scraping.ratelimit import Scheduler
+
+        scheduler = Scheduler(rate=args.rate, max_per_host=args.per_host)
+
+    pairs = read_pairs(args.input)
+    store = MonitorStore(args.state)
+    outcomes = Outcomes()
+    checked = 0
+    with RowSpool(preview_rows=0, columns=CHANGE_COLUMNS) as spool:
+        for changes in run_monitor(store, args.extractors, pairs, max_workers=args.workers, per_host=args.per_host,
+                                   parser=args.parser, scheduler=scheduler, outcomes=outcomes):
+            for row in changes:
+                spool.append(row)
+            checked += 1
+            if checked % args.progress_every == 0:
+                print(f"{checked}/{len(pairs)} rows checked, {spool.count} changes", file=sys.stderr)
+        spool.save(args.output)
+    store.close()
+    print(f"Done: {checked} rows checked ({outcomes.summary()}), {spool.count} changes -> {args.output}",
+          file=sys.stderr)
+    return 0
+
+
+def crawl(args):
+    from collections import deque
+
+    from scraping.crawl import Crawler, load_listing_rules, CRAWL_COLUMNS
+    from scraping.sheets import iter_rows, is_blank, INPUT_FORMATS
+    from scraping.sinks import RowSpool
+
+    if args.extractors:
+        from scraping.extractors import get_extractor
+        from scraping.pipeline import run_rows
+        from scraping.plugins import discover
+
+        discover()
+        for name in args.extractors:
+            get_extractor(name)
+
+    seeds = []
+    for seed in args.seeds:
+        if seed.lower().endswith(INPUT_FORMATS):
+            seeds.extend(row["URL"] for row in iter_rows(seed) if not is_blank(row.get("URL")))
+        else:
+            seeds.append(seed)
+
+    cache = None
+    if args.cache_dir:
+        from scraping.cache import ResponseCache
+
+        cache = ResponseCache(args.cache_dir)
+    scheduler = None
+    if args.rate > 0:
+        from scraping.ratelimit import Scheduler
+
+        scheduler = Scheduler(rate=args.rate, max_per_host=args.per_host)
+
+    crawler = Crawler(load_listing_rules(args.rules) if args.rules else None, max_workers=args.workers,
+                      per_host=args.per_host, scheduler=scheduler, cache=cache, robots=args.robots)
+    rows = ({"ProductID": n, "URL": link.url, "Page No.": link.page_no, "Category": link.category}
+            for n, link in enumerate(crawler.crawl(seeds), 1))
+    with RowSpool(preview_rows=0, columns=() if args.extractors else CRAWL_COLUMNS) as spool:
+        if args.extractors:
+            # Rows come back in the order they were found, so the crawl columns are matched up in a queue
+            found = deque()
+
+            def pairs():
+                for row in rows:
+                    found.append(row)
+                    yield row["URL"], row["ProductID"]
+
+            for result in run_rows(args.extractors, pairs(), max_workers=args.workers, per_host=args.per_host,
+                                   parser=args.parser, cache=cache, scheduler=scheduler):
+                row = found.popleft()
+                spool.append({**row, **result})
+                if spool.count % args.progress_every == 0:
+                    print(f"{spool.count} products extracted ({crawler.summary()})", file=sys.stderr)
+        else:
+            for row in rows:
+                spool.append(row)
+                if spool.count % args.progress_every == 0:
+                    print(f"{spool.count} products ({crawler.summary()})", file=sys.stderr)
+        spool.save(args.output)
+    print(f"Done: {crawler.summary()} -> {args.output}", file=sys.stderr)
+    for url, error in crawler.errors[:10]:
+        print(f"  {url}: {error}", file=sys.stderr)
+    return 0
+
+
+def export_journal(args):
+    from scraping.journal import Journal
+
+    journal = Journal(args.journal)
+    journal.export(args.output)
+    print(f"Exported {journal.counts()} -> {args.output}", file=sys.stderr)
+    return 0
+
+
+def queue_command(args):
+    from scraping.workqueue import open_queue
+
+    if args.queue_command == "serve":
+        return serve_queue(args)
+    if args.queue_command == "work":
+        return work_queue(args)
+    queue = open_queue(args.queue, args.token)
+    try:
+        if args.queue_command == "add":
+            from scraping.sheets import iter_rows, sheet_columns, check_header, is_blank
+
+            check_header(sheet_columns(args.input), ("URL",))
+            rows = [(seq, row) for seq, row in enumerate(iter_rows(args.input)) if not is_blank(row.get("URL"))]
+            queue.add((seq, row["URL"], row) for seq, row in rows)
+            if args.extractors:
+                from scraping.extractors import get_extractor
+                from scraping.plugins import discover
+
+                discover()
+                for name in args.extractors:
+                    get_extractor(name)
+                queue.set_meta("extractors", args.extractors)
+            print(f"Queued {len(rows)} rows: {queue.counts()}", file=sys.stderr)
+        elif args.queue_command == "retry":
+            print(f"{queue.retry_failed()} failed rows queued again", file=sys.stderr)
+        elif args.queue_command == "export":
+            queue.export(args.output)
+            print(f"Exported {queue.counts()} -> {args.output}", file=sys.stderr)
+        else:
+            print(queue.counts())
+    finally:
+        queue.close()
+    return 0
+
+
+def serve_queue(args):
+    from scraping.workqueue import QueueServer, SQLiteQueue, TOKEN_ENV
+
+    token = args.token or os.environ.get(TOKEN_ENV)
+    if not token and args.host not in ("127.0.0.1", "localhost"):
+        print("warning: serving without --token; anyone who can reach the port can read and change the queue",
+              file=sys.stderr)
+    server = QueueServer(SQLiteQueue(args.queue), (args.host, args.port), token)
+    print(f"Serving {args.queue} at {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def work_queue(args):
+    """
+    Runs the queue's extractors over claimed batches, committing each row as it finishes.
+
+    With --processes N, N copies of this loop run as separate processes; more
+    machines scale out the same way by running `queue work` against a server.
+    """
+    if args.processes > 1:
+        import multiprocessing
+
+        count, args.processes = args.processes, 1
+        workers = [multiprocessing.Process(target=work_queue, args=(args,)) for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return max(worker.exitcode for worker in workers)
+
+    from scraping.extractors import get_extractor
+    from scraping.plugins import discover
+    from scraping.pipeline import run_rows
+    from scraping.workqueue import open_queue, default_worker_name
+
+    queue = open_queue(args.queue, args.token)
+    extractors = queue.meta("extractors")
+    if not extractors:
+        raise ValueError("the queue has no extractors; add the rows with `queue add ... --extractor NAME`")
+    discover()
+    for name in extractors:
+        get_extractor(name)
+
+    cache = None
+    if args.cache_dir:
+        from scraping.cache import ResponseCache
+
+        cache = ResponseCache(args.cache_dir)
+    scheduler = None
+    if args.rate > 0:
+        from scraping.ratelimit import Scheduler
+
+        scheduler = Scheduler(rate=args.rate, max_per_host=args.per_host)
+
+    worker = default_worker_name()
+    done = failed = 0
+    try:
+        for batch in queue.batches(args.batch, worker, args.lease):
+            pairs = [(payload["URL"], payload.get("ProductID")) for _, payload in batch.rows]
+            results = run_rows(extractors, pairs, max_workers=args.workers, per_host=args.per_host,
+                               parser=args.parser, cache=cache, scheduler=scheduler)
+            for (seq, _), result in zip(batch.rows, results):
+                if "Error" in result:
+                    batch.record_failed(seq, result, result["Error"])
+                    failed += 1
+                else:
+                    batch.record_done(seq, result)
+                    done += 1
+            print(f"{worker}: {done} done, {failed} failed; queue {queue.counts()}", file=sys.stderr)
+    finally:
+        queue.close()
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "list":
+            return list_extractors()
+        if args.command == "export-journal":
+            return export_journal(args)
+        if args.command == "monitor":
+            return monitor(args)
+        if args.command == "crawl":
+            return crawl(args)
+        if args.command == "queue":
+            return queue_command(args)
+        return run(args)
+    except (KeyError, ValueError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
@@ -0,0 +1,425 @@
+"""
+Discovery: product URL sheets from category listings and sitemaps.
+
+The client scripts read a URLS.xlsx of product URLs and the listing page
+each was found on ("Page No."). A Crawler builds that sheet from seeds:
+
+    category listings - product links are collected from the page and its
+                        pagination is followed: rel="next" links, links
+                        matching the host's "next" pattern (e.g. ?page=3),
+                        or, with a "page_param", pages generated ahead so
+                        several pages of one category are fetched at once
+    sitemaps          - <urlset> entries are product URLs, <sitemapindex>
+                        entries further sitemaps; .xml.gz is decompressed
+
+The pages of every seed are fetched on one thread pool, with at most
+per_host requests in flight per host and, through a Scheduler, its rate
+limit, retries and backoff. robots.txt is honoured: disallowed listings and
+sitemaps are not fetched and a Crawl-delay caps the host's rate. Product URLs
+are de-duplicated by their canonical form (see scraping.canonical), so a
+product listed in several categories or with tracking parameters comes out
+once. Products are yielded as soon as they are found, so a catalogue can be
+fed to the extractors while it is still being crawled.
+
+Which links are products and which are further pages is decided per host,
+by rules loaded from a JSON file:
+
+    {
+        "toyworld.com.au": {"product": "/products/", "page_param": "page"},
+        "shop.example.org": {"product": "-p\\\\d+\\\\.html$", "next": "[?&]pg=(\\\\d+)", "max_pages": 200}
+    }
+
+"product" and "next" are regexes searched in absolute URLs; the first group
+of "next", if any, is the page number. Without a rule, links with /p/,
+/product/ or /products/ in their path are products, pages are rel="next"
+links and ?page=N or /page/N links below the category's path, and every
+sitemap entry is kept. A rule for example.com also applies to its
+subdomains.
+"""
+import gzip
+import io
+import json
+import re
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
+
+from scraping.canonical import Canonicalizer
+from scraping.fetch import fetch, host_of, HostLimiter, DEFAULT_HEADERS, DEFAULT_WORKERS, DEFAULT_PER_HOST
+from scraping.page import parse_attributes
+
+DEFAULT_PRODUCT = r"/(?:p|products?)/[^/?#]+"
+DEFAULT_NEXT = r"[?&](?:page|p|pg)=(\d+)|/page/(\d+)"
+DEFAULT_MAX_PAGES = 500
+
+LISTING = "listing"
+SITEMAP = "sitemap"
+BLOCKED = "disallowed by robots.txt"
+
+# The columns of a crawled URL sheet; URL and Page No. are what the client scripts read
+CRAWL_COLUMNS = ("ProductID", "URL", "Page No.", "Category")
+
+LINK_SCAN = re.compile(r'''<!--[\s\S]*?-->|<(a|link)\s((?:"[^"]*"|'[^']*'|[^'">])*)>''', re.IGNORECASE)
+
+ListingRule = namedtuple("ListingRule", ["product", "next", "page_param", "max_pages"],
+                         defaults=(None, None, None, DEFAULT_MAX_PAGES))
+ListingRule.__doc__ = """
+How the listings of one host are crawled.
+
+Attributes:
+    product (re.Pattern): Matches product URLs; None for the default.
+    next (re.Pattern): Matches the URLs of further listing pages; None for the default.
+    page_param (str): Query parameter holding the page number; pages are
+        then generated instead of followed.
+    max_pages (int): Pages crawled per category at most.
+"""
+
+ProductLink = namedtuple("ProductLink", ["url", "page_no", "category"])
+ProductLink.__doc__ = """
+A product found by the crawl.
+
+Attributes:
+    url (str): The product URL, as linked.
+    page_no (int): The listing page number it was first found on; None from a sitemap.
+    category (str): The seed it was found under.
+"""
+
+Task = namedtuple("Task", ["kind", "url", "page_no", "category"])
+
+
+def load_listing_rules(path):
+    """
+    Reads per-host listing rules from a JSON file, see the module docstring.
+
+    Raises:
+        ValueError: If the file is not valid JSON, a rule has unknown keys or a bad pattern.
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in {path}: {e}") from None
+    rules = {}
+    for host, rule in data.items():
+        unknown = set(rule) - set(ListingRule._fields)
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in the listing rule for {host!r}")
+        try:
+            rules[host.lower()] = ListingRule(
+                re.compile(rule["product"]) if rule.get("product") else None,
+                re.compile(rule["next"]) if rule.get("next") else None,
+                rule.get("page_param"),
+                int(rule.get("max_pages", DEFAULT_MAX_PAGES)),
+            )
+        except re.error as e:
+            raise ValueError(f"Bad pattern in the listing rule for {host!r}: {e}") from None
+    return rules
+
+
+def with_param(url, name, value):
+    """url with the query parameter name set to value."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != name]
+    query.append((name, str(value)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _site(host):
+    return host[4:] if host.startswith("www.") else host
+
+
+def scan_links(html, base_url):
+    """
+    The links of a listing page, without building a tree.
+
+    Returns:
+        list: (absolute URL without fragment, is rel="next") of every <a> and
+        <link> href, in document order.
+    """
+    links = []
+    for match in LINK_SCAN.finditer(html):
+        if not match.group(1):
+            continue
+        attrs = parse_attributes(match.group(2))
+        href = attrs.get("href", "").strip()
+        if not href or href.startswith(("#", "javascript:", "mailto:", "tel:")):
+            continue
+        links.append((urldefrag(urljoin(base_url, href))[0], "next" in attrs.get("rel", "").lower().split()))
+    return links
+
+
+def parse_sitemap(data):
+    """
+    Reads a sitemap or sitemap index, gzipped or not.
+
+    Returns:
+        tuple: (is an index, the <loc> URLs in document order).
+
+    Raises:
+        ValueError: If the document is not XML.
+    """
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    index = False
+    urls = []
+    try:
+        for event, element in ElementTree.iterparse(io.BytesIO(data), events=("start", "end")):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                index = index or tag == "sitemapindex"
+            elif tag == "loc" and element.text:
+                urls.append(element.text.strip())
+            elif tag in ("url", "sitemap"):
+                element.clear()
+    except ElementTree.ParseError as e:
+        raise ValueError(f"not a sitemap: {e}") from None
+    return index, urls
+
+
+class Robots:
+    """
+    The robots.txt of every host crawled, fetched once per host.
+
+    Args:
+        scheduler (Scheduler): Optional; a host's Crawl-delay caps its rate here.
+        user_agent (str): The agent the rules are read for.
+    """
+
+    def __init__(self, scheduler=None, user_agent=DEFAULT_HEADERS["User-Agent"]):
+        self.scheduler = scheduler
+        self.user_agent = user_agent
+        self._parsers = {}
+        self._lock = threading.Lock()
+        self._host_locks = {}
+
+    def _parser(self, url):
+        parts = urlsplit(url)
+        root = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            lock = self._host_locks.setdefault(root, threading.Lock())
+        with lock:
+            if root not in self._parsers:
+                self._parsers[root] = self._load(root)
+            return self._parsers[root]
+
+    def _load(self, root):
+        parser = RobotFileParser(root + "/robots.txt")
+        try:
+            r = fetch(root + "/robots.txt", scheduler=self.scheduler)
+        except Exception:
+            parser.allow_all = True
+            return parser
+        # As urllib.robotparser does: no access to the rules means no access, no rules means anything goes
+        if r.status_code in (401, 403):
+            parser.disallow_all = True
+        elif r.status_code != 200:
+            parser.allow_all = True
+        else:
+            parser.parse(r.text.splitlines())
+            delay = parser.crawl_delay(self.user_agent)
+            if delay and self.scheduler is not None:
+                self.scheduler.cap_rate(root, 1 / float(delay))
+        return parser
+
+    def allowed(self, url):
+        return self._parser(url).can_fetch(self.user_agent, url)
+
+
+class Crawler:
+    """
+    Crawls seeds concurrently into de-duplicated product links.
+
+    Args:
+        rules (dict): Host to ListingRule, see load_listing_rules().
+        max_workers (int): Pages fetched at once.
+        per_host (int): Maximum concurrent requests per host.
+        scheduler (Scheduler): Optional per-host rate limiter that also
+            retries transient failures.
+        cache (ResponseCache): Optional on-disk cache of the pages.
+        canonicalizer (Canonicalizer): Decides which URLs are the same page.
+        robots (bool): Honour robots.txt.
+
+    Attributes:
+        stats (Counter): Listing pages, sitemaps, products, duplicates,
+            robots-blocked and failed fetches so far.
+        errors (list): (URL, message) of every page that failed.
+    """
+
+    def __init__(self, rules=None, max_workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, scheduler=None,
+                 cache=None, canonicalizer=None, robots=True):
+        self.rules = rules or {}
+        self.max_workers = max(1, int(max_workers))
+        self.scheduler = scheduler
+        self.cache = cache
+        self.canonicalizer = canonicalizer or Canonicalizer()
+        self.robots = Robots(scheduler) if robots else None
+        self.stats = Counter()
+        self.errors = []
+        self._limiter = HostLimiter(per_host)
+        self._default_product = re.compile(DEFAULT_PRODUCT)
+        self._default_next = re.compile(DEFAULT_NEXT)
+
+    def rule(self, url):
+        """The ListingRule for url's host or its closest parent domain."""
+        parts = host_of(url).split(":")[0].split(".")
+        for i in range(len(parts)):
+            rule = self.rules.get(".".join(parts[i:]))
+            if rule is not None:
+                return rule
+        return ListingRule()
+
+    def page_number(self, url):
+        """The page number in a listing URL, or None."""
+        rule = self.rule(url)
+        if rule.page_param:
+            value = dict(parse_qsl(urlsplit(url).query)).get(rule.page_param, "")
+            return int(value) if value.isdigit() else None
+        match = (rule.next or self._default_next).search(url)
+        if match is None:
+            return None
+        number = next((group for group in match.groups() if group is not None), None)
+        return int(number) if number is not None and number.isdigit() else None
+
+    def _visit(self, task):
+        """Fetches one page; returns (task, products, further tasks) or (task, error, None)."""
+        try:
+            if self.robots is not None and not self.robots.allowed(task.url):
+                return task, BLOCKED, None
+            with self._limiter.slot(task.url):
+                r = fetch(task.url, cache=self.cache, scheduler=self.scheduler)
+            if r.status_code != 200:
+                return task, f"HTTP {r.status_code}", None
+            if task.kind == SITEMAP:
+                return (task,) + self._read_sitemap(task, r.content)
+            return (task,) + self._read_listing(task, r.text, getattr(r, "url", None) or task.url)
+        except Exception as e:
+            return task, str(e) or type(e).__name__, None
+
+    def _read_sitemap(self, task, data):
+        index, urls = parse_sitemap(data)
+        if index:
+            return [], [Task(SITEMAP, url, None, task.category) for url in urls]
+        product = self.rule(task.url).product
+        return [url for url in urls if product is None or product.search(url)], []
+
+    def _read_listing(self, task, html, base_url):
+        rule = self.rule(task.url)
+        site = _site(host_of(task.url))
+        category_path = urlsplit(task.category).path.rstrip("/")
+        product = rule.product or self._default_product
+        pages = []
+        products = []
+        for url, is_next in scan_links(html, base_url):
+            if _site(host_of(url)) != site:
+                continue
+            if product.search(url):
+                products.append(url)
+            elif rule.page_param:
+                continue
+            elif is_next:
+                pages.append(Task(LISTING, url, task.page_no + 1, task.category))
+            elif (rule.next or self._default_next).search(url) and urlsplit(url).path.startswith(category_path):
+                pages.append(Task(LISTING, url, self.page_number(url) or task.page_no + 1, task.category))
+        return list(dict.fromkeys(products)), pages
+
+    def _generated(self, task, new):
+        """
+        The pages to queue after a page of a page_param category: the next
+        per_host ones while it had new products, none after the last. So
+        per_host pages of a category are in flight, per_host are fetched past
+        its end, and that many pages in a row without new products end it.
+        """
+        if not new:
+            return []
+        rule = self.rule(task.url)
+        return [Task(LISTING, with_param(task.category, rule.page_param, n), n, task.category)
+                for n in range(task.page_no + 1, task.page_no + 1 + self._limiter.per_host)]
+
+    def crawl(self, seeds):
+        """
+        Crawls the seed URLs, category listings or sitemaps.
+
+        Args:
+            seeds (iterable): Listing or sitemap URLs; URLs ending in .xml or
+                .xml.gz, or with "sitemap" in their path, are read as sitemaps.
+
+        Yields:
+            ProductLink: Every distinct product, as soon as it is found.
+        """
+        seen_pages = set()
+        seen_products = set()
+        running = set()
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        # The pages of a page_param category are taken in page order, so a page past the end that repeats
+        # the last one cannot claim its products: {category: [next page number, {page number: visit}]}
+        ordered = {}
+
+        def in_order(visit):
+            task = visit[0]
+            if task.kind != LISTING or not self.rule(task.url).page_param:
+                return [visit]
+            state = ordered.setdefault(task.category, [task.page_no, {}])
+            state[1][task.page_no] = visit
+            ready = []
+            while state[0] in state[1]:
+                ready.append(state[1].pop(state[0]))
+                state[0] += 1
+            return ready
+
+        def submit(task):
+            key = self.canonicalizer(task.url)
+            if key in seen_pages or (task.page_no or 0) > self.rule(task.url).max_pages:
+                return
+            seen_pages.add(key)
+            running.add(pool.submit(self._visit, task))
+
+        try:
+            for seed in seeds:
+                seed = str(seed).strip()
+                path = urlsplit(seed).path.lower()
+                if path.endswith((".xml", ".xml.gz")) or "sitemap" in path:
+                    submit(Task(SITEMAP, seed, None, seed))
+                else:
+                    submit(Task(LISTING, seed, self.page_number(seed) or 1, seed))
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.discard(future)
+                    for task, products, pages in in_order(future.result()):
+                        yield from self._take(task, products, pages, seen_products, submit)
+        finally:
+            # A consumer that stops early should not wait for the pages in flight
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def _take(self, task, products, pages, seen_products, submit):
+        """Yields the new products of a visited page and queues the pages it leads to."""
+        if pages is None:
+            self.stats["robots" if products == BLOCKED else "errors"] += 1
+            self.errors.append((task.url, products))
+            return
+        self.stats["sitemaps" if task.kind == SITEMAP else "pages"] += 1
+        new = 0
+        for url in products:
+            key = self.canonicalizer(url)
+            if key in seen_products:
+                self.stats["duplicates"] += 1
+                continue
+            seen_products.add(key)
+            new += 1
+            self.stats["products"] += 1
+            yield ProductLink(url, task.page_no, task.category)
+        if task.kind == LISTING and self.rule(task.url).page_param:
+            pages = self._generated(task, new)
+        for page in pages:
+            submit(page)
+
+    def summary(self):
+        """e.g. "412 listing pages, 2 sitemaps, 9830 products (1211 duplicates), 0 blocked, 3 failed"."""
+        return (f"{self.stats['pages']} listing pages, {self.stats['sitemaps']} sitemaps, "
+                f"{self.stats['products']} products ({self.stats['duplicates']} duplicates), "
+                f"{self.stats['robots']} blocked by robots.txt, {self.stats['errors']} failed")
@@ -0,0 +1,240 @@
+"""
+Registry of the site extractors behind the dashboard cards.
+
+Each extractor is a callable taking a Page and returning the columns it adds
+to the output row. Most sites are declarative specs in scraping/sites (see
+scraping.specs); the few that need real logic are functions below. Every
+extractor declares the input it needs:
+
+    TEXT  - regexes over the raw HTML only
+    META  - <meta property=...> tags, with the tree only as a fallback
+    TREE  - the full BeautifulSoup tree
+
+The registry key is the card name used in the scripts table of app.py.
+An extractor can also declare its own RetryPolicy, e.g. a bigger budget for
+price columns that must not come back empty, and the region of the document
+it reads: HEAD extractors (og: tags, <title>) let the page be downloaded only
+up to </head>, or up to the last of the meta tags they list.
+
+Every extractor runs within a budget of CPU seconds per page (see
+scraping.patterns); one that runs out fails its row with a timeout error
+instead of holding up the worker.
+"""
+import os
+import re
+import time
+from collections import namedtuple
+
+from scraping.page import fragment_text, TEXT, META, TREE, HEAD, BODY
+from scraping.patterns import Pattern, cpu_budget, DEFAULT_BUDGET
+from scraping.ratelimit import RetryPolicy, DEFAULT_RETRY
+from scraping.regions import Target
+from scraping.specs import load_specs
+
+SITES_DIR = os.path.join(os.path.dirname(__file__), "sites")
+
+Extractor = namedtuple("Extractor", ["name", "func", "needs", "retry", "region", "tags", "budget"],
+                       defaults=(DEFAULT_RETRY, BODY, (), DEFAULT_BUDGET))
+
+EXTRACTORS = {}
+
+
+def register(name, needs=TEXT, retry=DEFAULT_RETRY, region=BODY, tags=(), budget=DEFAULT_BUDGET):
+    """
+    Decorator adding an extractor function to the registry under name.
+    """
+    def decorator(func):
+        EXTRACTORS[name] = Extractor(name, func, needs, retry, region, tags, budget)
+        return func
+    return decorator
+
+
+def register_spec(spec):
+    """
+    Adds a compiled SpecExtractor to the registry under its name.
+
+    Returns:
+        Extractor: The registry entry.
+    """
+    retry = DEFAULT_RETRY if spec.retries is None else RetryPolicy(retries=spec.retries)
+    budget = DEFAULT_BUDGET if spec.budget is None else spec.budget
+    EXTRACTORS[spec.name] = Extractor(spec.name, spec, spec.needs, retry, spec.region, spec.tags, budget)
+    return EXTRACTORS[spec.name]
+
+
+def get_extractor(name):
+    """
+    Looks up an extractor by its card name.
+
+    Raises:
+        KeyError: If no extractor is registered under that name.
+    """
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise KeyError(f"Unknown extractor: {name!r}") from None
+
+
+def retry_policy(names):
+    """
+    Returns the most generous retry budget among the named extractors, since
+    they all share one download of the page.
+    """
+    return max((get_extractor(name).retry for name in names), key=lambda policy: policy.retries)
+
+
+def fetch_region(names):
+    """
+    The part of the page the named extractors need together.
+
+    Returns:
+        tuple: (region, tags) - HEAD only if every extractor reads the head,
+        with the meta properties that end the download early when each of
+        them lists its tags.
+    """
+    extractors = [get_extractor(name) for name in names]
+    if not extractors or any(e.region != HEAD for e in extractors):
+        return BODY, ()
+    if any(not e.tags for e in extractors):
+        return HEAD, ()
+    return HEAD, tuple(dict.fromkeys(tag for e in extractors for tag in e.tags))
+
+
+def run_extractor(name, page):
+    """
+    Runs the named extractor over a page within its CPU budget.
+
+    Args:
+        name (str): The card name of the extractor.
+        page (Page): The downloaded page.
+
+    Returns:
+        dict: The output columns produced by the extractor.
+
+    Raises:
+        ExtractionTimeout: If the extractor ran out of its budget.
+    """
+    extractor = get_extractor(name)
+    with cpu_budget(extractor.budget):
+        return extractor.func(page)
+
+
+def merge_columns(result, columns, name):
+    """
+    Merges one extractor's columns into a combined output row.
+
+    The first extractor to produce a column keeps the plain name; later ones
+    with the same column get it suffixed with their extractor name.
+    """
+    for column, value in columns.items():
+        if column in result:
+            column = f"{column} ({name})"
+        result[column] = value
+
+
+def run_extractors(names, page, durations=None):
+    """
+    Runs several extractors over the same page and merges their columns.
+
+    A failing extractor does not stop the others; its message is collected in
+    the "Error" column prefixed with the extractor name.
+
+    Args:
+        names (list): Card names of the extractors, in output column order.
+        page (Page): The downloaded page, fetched and parsed once for all of them.
+        durations (dict): Optional dict filled with the seconds each extractor
+            took, including building the tree if it was the first to need it.
+
+    Returns:
+        dict: The merged output columns.
+    """
+    durations = {} if durations is None else durations
+    if len(names) == 1:
+        started = time.perf_counter()
+        try:
+            return run_extractor(names[0], page)
+        finally:
+            durations[names[0]] = time.perf_counter() - started
+    result = {}
+    errors = []
+    for name in names:
+        started = time.perf_counter()
+        try:
+            merge_columns(result, run_extractor(name, page), name)
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+        durations[name] = time.perf_counter() - started
+    if errors:
+        result["Error"] = "; ".join(errors)
+    return result
+
+
+# ---------------------------- Extractors ---------------------------- #
+
+@register("Info Extractor", needs=META, region=HEAD, tags=("og:title", "og:image", "og:description"))
+def info_extractor(page):
+    title = page.meta("og:title")
+    image = page.meta("og:image")
+    desc = page.meta("og:description")
+    soup_title = page.soup.title if not title else None
+    return {
+        "Title": title['content'] if title else (soup_title.string if soup_title else "N/A"),
+        "Image": image['content'] if image else "N/A",
+        "Description": desc['content'] if desc else "N/A",
+    }
+
+
+GEARWRENCH_ZIP = Pattern(r'<span class="download-images-link">[\s\S]*?<a\s+href="([^"]+)"',
+                         name="GearWrench ZIP Link: ZIP URL", anchor="download-images-link")
+
+
+@register("GearWrench ZIP Link")
+def gearwrench_zip_link(page):
+    match = GEARWRENCH_ZIP.search(page.html)
+    base = re.match(r'https://(www\.[^/]+)', page.url)
+    domain = f'https://{base[1]}' if base else ''
+    return {"ZIP URL": domain + match.group(1) if match else "Not found"}
+
+
+NZSBW_TARGETS = (
+    Target(attrs={"data-component-id": "product-description-content"}),
+    Target("li", {"data-component-id": re.compile("product-description-features-")}),
+)
+
+
+@register("NZSBW Full Extractor", needs=TREE)
+def nzsbw_full_extractor(page):
+    soup = page.tree(NZSBW_TARGETS)
+    title = page.meta("og:title")
+    image = page.meta("og:image")
+    desc = soup.find(attrs={"data-component-id": "product-description-content"})
+    features = soup.find_all("li", attrs={"data-component-id": re.compile("product-description-features-")})
+    return {
+        "Title": title['content'] if title else "N/A",
+        "Image": image['content'] if image else "N/A",
+        "Description": desc.get_text(strip=True) if desc else "N/A",
+        "Features": '\n'.join("• " + f.get_text(strip=True) for f in features)
+    }
+
+
+MITRE10_DESCRIPTION = Pattern(r'<div[^>]*class=["\']value["\'][^>]*>([\s\S]*?)</div>',
+                              name="Mitre10 Description Extractor: Description",
+                              anchor=('class="value"', "class='value'"))
+LIST_ITEM = re.compile(r'<li>([\s\S]*?)</li>')
+
+
+@register("Mitre10 Description Extractor")
+def mitre10_description_extractor(page):
+    match = MITRE10_DESCRIPTION.search(page.html)
+    if not match:
+        return {"Description": "Not found"}
+    raw = match.group(1)
+    bullets = ["• " + fragment_text(li, strip=True) for li in LIST_ITEM.findall(raw)]
+    clean = fragment_text(raw, separator=" ", strip=True)
+    return {"Description": clean + ("\n" + "\n".join(bullets) if bullets else "")}
+
+
+# ---------------------------- Site specs ---------------------------- #
+
+for _spec in load_specs(SITES_DIR):
+    register_spec(_spec)
@@ -0,0 +1,225 @@
+"""
+Shared HTTP session and bounded-concurrency fetching.
+
+Every extractor spends nearly all of its time waiting on the network, so rows
+are fetched on a thread pool that reuses one pooled keep-alive session. The
+number of in-flight requests is capped both overall and per host, and results
+are always handed back in input order.
+
+Extractors that only read the document head are served by a streamed fetch:
+the (compressed) body is read a chunk at a time and the connection closed as
+soon as the head, or every meta tag they asked for, has arrived.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+from scraping.metrics import TimedHTTPAdapter, recording, time_response, DNS, CONNECT, FROM_CACHE
+from scraping.page import head_end, HEAD, BODY
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+DEFAULT_TIMEOUT = 20
+DEFAULT_WORKERS = 16
+DEFAULT_PER_HOST = 4
+HEAD_CHUNK_BYTES = 16 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def make_session(pool_size=DEFAULT_WORKERS):
+    """
+    Builds a requests session with a connection pool large enough for the workers.
+
+    Args:
+        pool_size (int): Number of keep-alive connections kept per host.
+
+    Returns:
+        requests.Session: A session sending the default headers.
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session():
+    """
+    Returns the process-wide shared session, creating it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def read_head(response, tags=(), chunk_size=HEAD_CHUNK_BYTES):
+    """
+    Reads a streamed response only up to the end of its head, then closes it.
+
+    The body is decompressed as it arrives, and the connection is dropped
+    rather than drained once head_end() is satisfied. Afterwards the response
+    behaves like a normal one whose content is the prefix.
+
+    Args:
+        response (requests.Response): A response requested with stream=True.
+        tags (tuple): Meta properties that end the read early once all are seen.
+        chunk_size (int): Bytes read per step.
+
+    Returns:
+        requests.Response: The same response, with partial=True if the body
+        was cut short.
+    """
+    prefix = bytearray()
+    end = None
+    try:
+        for chunk in response.iter_content(chunk_size):
+            # Resume the </head> search just before the new chunk in case the tag straddles it
+            start = max(0, len(prefix) - 8)
+            prefix += chunk
+            end = head_end(bytes(prefix), tags, start)
+            if end is not None:
+                break
+    finally:
+        response.close()
+    response._content = bytes(prefix[:end] if end is not None else prefix)
+    response._content_consumed = True
+    response.partial = end is not None
+    return response
+
+
+def fetch(url, session=None, timeout=DEFAULT_TIMEOUT, cache=None, scheduler=None, retry=None, timings=None,
+          region=BODY, tags=(), headers=None):
+    """
+    Downloads a page through the shared session.
+
+    Args:
+        url (str): The page to download.
+        session (requests.Session): Optional session, defaults to the shared one.
+        timeout (float): Seconds to wait for the server.
+        cache (ResponseCache): Optional on-disk cache to serve and store the page.
+        scheduler (Scheduler): Optional per-host rate limiter that also retries
+            transient failures.
+        retry (RetryPolicy): Retry budget used with the scheduler.
+        timings (dict): Optional dict filled with the DNS, connect, TTFB and
+            download time and size of the response (of the last attempt when
+            retried) and whether it came from the cache.
+        region (str): HEAD to download only the document head (see read_head);
+            a cached full page is still served as is.
+        tags (tuple): With HEAD, the meta properties that are enough to stop.
+        headers (dict): Extra request headers, such as the validators of a
+            conditional request.
+
+    Returns:
+        requests.Response: The server response.
+    """
+    session = session or get_session()
+    extra_headers = headers
+
+    def send(url, headers=None, **kwargs):
+        if extra_headers:
+            headers = {**extra_headers, **(headers or {})}
+        if region == HEAD:
+            kwargs["stream"] = True
+        if scheduler is not None:
+            response = scheduler.request(session, url, retry=retry, timeout=timeout, headers=headers, **kwargs)
+        else:
+            response = session.get(url, timeout=timeout, headers=headers, **kwargs)
+        return read_head(response, tags) if region == HEAD else response
+
+    def get(url, headers=None):
+        if timings is None:
+            return send(url, headers)
+        received = []
+        timings.update({DNS: 0.0, CONNECT: 0.0})
+        with recording(timings):
+            response = send(url, headers, hooks={"response": lambda r, **kw: received.append(time.perf_counter())})
+        time_response(timings, received[-1], response)
+        return response
+
+    response = cache.fetch(url, get) if cache is not None else get(url)
+    if timings is not None:
+        timings[FROM_CACHE] = bool(getattr(response, "from_cache", False))
+    return response
+
+
+def host_of(url):
+    """
+    Returns the lowercase host of a URL, or an empty string for junk input.
+    """
+    try:
+        return urlparse(str(url)).netloc.lower()
+    except ValueError:
+        return ""
+
+
+class HostLimiter:
+    """
+    Caps the number of requests in flight against any single host.
+    """
+
+    def __init__(self, per_host=DEFAULT_PER_HOST):
+        self.per_host = max(1, int(per_host))
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[host]
+
+    @contextmanager
+    def slot(self, url):
+        semaphore = self._semaphore(host_of(url))
+        with semaphore:
+            yield
+
+
+def imap_ordered(func, items, max_workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, url_of=None):
+    """
+    Runs func over items on a thread pool and yields the results in input order.
+
+    Only a bounded window of items is submitted ahead of the consumer, so memory
+    does not grow with the number of items.
+
+    Args:
+        func (callable): Called once per item.
+        items (iterable): The work items.
+        max_workers (int): Number of worker threads.
+        per_host (int): Maximum concurrent calls per host.
+        url_of (callable): Maps an item to its URL for the per-host cap.
+            Defaults to treating the item itself as the URL.
+
+    Yields:
+        The return value of func for each item, in the order of items.
+    """
+    max_workers = max(1, int(max_workers))
+    url_of = url_of or (lambda item: item)
+    limiter = HostLimiter(per_host)
+
+    def run(item):
+        with limiter.slot(url_of(item)):
+            return func(item)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for item in items:
+                pending.append(pool.submit(run, item))
+                if len(pending) >= max_workers * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # A consumer that stops early (e.g. a cancelled job) should not wait for the window
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,376 @@
+"""
+Bulk verification of the image URLs extractors emit.
+
+Broken image links otherwise only show up once the sheet is opened in Google
+Sheets. Every image URL in the output is probed without downloading the
+image: a Range request for the first few KiB is enough to read the status,
+content type, total size (from Content-Range) and the pixel dimensions, which
+PNG, GIF and WebP store in their first bytes and JPEG in its frame header.
+Only when a JPEG's frame header sits behind a large EXIF block is a second,
+bigger range read. A HEAD-only mode skips the dimensions entirely.
+
+Probes run concurrently, each distinct URL is probed once per run, and
+results can be kept in a SQLite cache so re-running a sheet only probes
+new images.
+"""
+import json
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+from scraping.fetch import get_session, imap_ordered, DEFAULT_TIMEOUT, DEFAULT_WORKERS, DEFAULT_PER_HOST
+
+PROBE_BYTES = 16 * 1024
+MAX_PROBE_BYTES = 256 * 1024
+DEFAULT_PROBE_TTL = 7 * 24 * 60 * 60
+OK_STATUSES = (200, 206)
+# Error statuses that say the image is gone; any other (429, 5xx, 403...) may be transient
+GONE_STATUSES = (404, 410)
+# Output columns whose values are image URLs, e.g. "Image", "Image 2", "Zoom Image URLs", "ImageFormula"
+IMAGE_COLUMN = re.compile(r"image", re.IGNORECASE)
+URL_IN_CELL = re.compile(r"""https?://[^\s,"'<>]+""")
+CONTENT_RANGE_TOTAL = re.compile(r"/(\d+)\s*$")
+JPEG_FRAME_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_BARE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+ImageProbe = namedtuple(
+    "ImageProbe",
+    ["url", "status", "content_type", "bytes", "format", "width", "height", "error"],
+    defaults=(None, None, None, None, None, None, None),
+)
+ImageProbe.__doc__ = """
+What a probe learned about one image URL; unknown values are None.
+
+Attributes:
+    url (str): The probed URL.
+    status (int): The HTTP status (206 for a served range).
+    content_type (str): The Content-Type without parameters.
+    bytes (int): The full size of the image.
+    format (str): "png", "jpeg", "gif" or "webp" when recognised.
+    width (int): Pixel width.
+    height (int): Pixel height.
+    error (str): The exception type, e.g. "ConnectionError", if the request failed.
+"""
+
+
+def probe_ok(probe):
+    """True when the URL serves an image."""
+    if probe.error or probe.status not in OK_STATUSES:
+        return False
+    return probe.content_type is None or probe.content_type.startswith("image/")
+
+
+def describe(probe):
+    """One short line for the output sheet, e.g. "OK 800x600 jpeg 54 KB" or "BROKEN (404)"."""
+    if probe.error:
+        return f"BROKEN ({probe.error})"
+    if probe.status not in OK_STATUSES:
+        return f"BROKEN ({probe.status})"
+    if not probe_ok(probe):
+        return f"NOT AN IMAGE ({probe.content_type})"
+    parts = ["OK"]
+    if probe.width and probe.height:
+        parts.append(f"{probe.width}x{probe.height}")
+    if probe.format or probe.content_type:
+        parts.append(probe.format or probe.content_type)
+    if probe.bytes is not None:
+        parts.append(f"{max(1, round(probe.bytes / 1024))} KB")
+    return " ".join(parts)
+
+
+def _jpeg_size(data):
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return False
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in JPEG_BARE_MARKERS:
+            i += 2
+            continue
+        if marker in JPEG_FRAME_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return "jpeg", width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def image_size(data):
+    """
+    Reads the format and pixel dimensions from the first bytes of an image.
+
+    Returns:
+        tuple: (format, width, height); None if more bytes are needed, or
+        False if the data is not a PNG, JPEG, GIF or WebP.
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(data) < 24:
+            return None
+        width, height = struct.unpack(">II", data[16:24])
+        return "png", width, height
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        if len(data) < 10:
+            return None
+        width, height = struct.unpack("<HH", data[6:10])
+        return "gif", width, height
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_size(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        if len(data) < 30:
+            return None
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = struct.unpack("<I", data[21:25])[0]
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return "webp", int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return False
+    return None if len(data) < 12 else False
+
+
+def _total_bytes(response):
+    content_range = response.headers.get("Content-Range", "")
+    match = CONTENT_RANGE_TOTAL.search(content_range)
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    if response.status_code == 200 and length and not response.headers.get("Content-Encoding"):
+        return int(length)
+    return None
+
+
+def probe_image(url, session=None, scheduler=None, timeout=DEFAULT_TIMEOUT, dimensions=True):
+    """
+    Probes one image URL without downloading the whole image.
+
+    Args:
+        url (str): The image URL.
+        session (requests.Session): Optional session, defaults to the shared one.
+        scheduler (Scheduler): Optional per-host rate limiter.
+        timeout (float): Seconds to wait for the server.
+        dimensions (bool): Read the first bytes for the pixel size; False
+            sends a HEAD request only.
+
+    Returns:
+        ImageProbe: The result; connection errors are reported in it, not raised.
+    """
+    session = session or get_session()
+
+    def send(method, headers=None):
+        kwargs = {"timeout": timeout, "headers": headers, "stream": True, "allow_redirects": True}
+        if scheduler is not None:
+            return scheduler.request(session, url, method=method, **kwargs)
+        return session.request(method, url, **kwargs)
+
+    def read(response, limit):
+        # A served range is small and read to the end so the connection is reused;
+        # a server ignoring Range sends the whole image, so that read stops early
+        data = bytearray()
+        whole = response.status_code == 200
+        try:
+            for chunk in response.iter_content(PROBE_BYTES):
+                data += chunk
+                if len(data) >= limit or (whole and image_size(bytes(data)) is not None):
+                    break
+        finally:
+            response.close()
+        return bytes(data)
+
+    try:
+        if not dimensions:
+            response = send("HEAD")
+            response.close()
+            return ImageProbe(url, response.status_code, _content_type(response), _total_bytes(response))
+        response = send("GET", {"Range": f"bytes=0-{PROBE_BYTES - 1}", "Accept-Encoding": "identity"})
+        status, content_type, total = response.status_code, _content_type(response), _total_bytes(response)
+        if status not in OK_STATUSES:
+            response.close()
+            return ImageProbe(url, status, content_type, total)
+        data = read(response, MAX_PROBE_BYTES)
+        size = image_size(data)
+        if size is None and status == 206 and (total is None or total > len(data)):
+            # A JPEG whose frame header is behind a big EXIF block or thumbnail
+            more = send("GET", {"Range": f"bytes={len(data)}-{MAX_PROBE_BYTES - 1}", "Accept-Encoding": "identity"})
+            if more.status_code == 206:
+                data += read(more, MAX_PROBE_BYTES - len(data))
+                size = image_size(data)
+            else:
+                more.close()
+    except Exception as e:
+        return ImageProbe(url, error=type(e).__name__)
+    if total is None and status == 200 and len(data) < MAX_PROBE_BYTES and size is None:
+        # Nothing stopped the read early, so this was the whole body
+        total = len(data)
+    fmt, width, height = size if size else (None, None, None)
+    return ImageProbe(url, status, content_type, total, fmt, width, height)
+
+
+def _content_type(response):
+    content_type = response.headers.get("Content-Type")
+    return content_type.split(";")[0].strip().lower() if content_type else None
+
+
+class ProbeCache:
+    """
+    Probe results kept by URL in SQLite, shared across threads.
+
+    Args:
+        path (str): The database file; ":memory:" keeps results for the
+            lifetime of the object only.
+        ttl (float): Seconds a result is reused before the URL is probed again.
+    """
+
+    def __init__(self, path=":memory:", ttl=DEFAULT_PROBE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS probes (
+                url TEXT PRIMARY KEY,
+                probe TEXT NOT NULL,
+                probed_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def get(self, url):
+        """Returns the cached ImageProbe for url, or None if missing or expired."""
+        with self._lock:
+            row = self._db.execute("SELECT probe, probed_at FROM probes WHERE url = ?", (url,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return ImageProbe(*json.loads(row[0]))
+
+    def put(self, probe):
+        """
+        Stores a definitive probe: a 2xx, 404 or 410. Connection errors and
+        other statuses, such as a 429 or 503 left after the retries, are not
+        cached, so the URL is probed again next run instead of being reported
+        broken until the result expires.
+        """
+        if not cacheable(probe):
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?)",
+                             (probe.url, json.dumps(list(probe)), time.time()))
+            self._db.commit()
+
+
+def cacheable(probe):
+    """True when a probe's outcome will not change on a retry soon."""
+    return not probe.error and probe.status is not None and (
+        200 <= probe.status < 300 or probe.status in GONE_STATUSES)
+
+
+def image_urls(value):
+    """The image URLs in one output cell: plain, comma-joined or inside =IMAGE("...")."""
+    return URL_IN_CELL.findall(value) if isinstance(value, str) else []
+
+
+class ImageVerifier:
+    """
+    Probes the image URLs of output rows and annotates the rows.
+
+    For every column whose name mentions "image" a "<column> Check" column is
+    added, holding describe() of each of its URLs in the same order.
+
+    Args:
+        cache (ProbeCache): Optional cache of earlier results.
+        scheduler (Scheduler): Optional per-host rate limiter.
+        max_workers (int): Image URLs probed concurrently.
+        per_host (int): Maximum concurrent probes per image host.
+        dimensions (bool): False probes with HEAD only.
+
+    Attributes:
+        probes (dict): URL to ImageProbe for every image seen this run.
+    """
+
+    def __init__(self, cache=None, scheduler=None, max_workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST,
+                 dimensions=True):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.dimensions = dimensions
+        self.probes = {}
+        self._lock = threading.Lock()
+
+    def probe(self, url):
+        """Probes url unless it was already probed this run or is cached."""
+        with self._lock:
+            probe = self.probes.get(url)
+        if probe is None and self.cache is not None:
+            probe = self.cache.get(url)
+        if probe is None:
+            probe = probe_image(url, scheduler=self.scheduler, dimensions=self.dimensions)
+            if self.cache is not None:
+                self.cache.put(probe)
+        with self._lock:
+            self.probes[url] = probe
+        return probe
+
+    def annotate(self, row):
+        """Returns the row with a Check column after each image column."""
+        annotated = {}
+        for column, value in row.items():
+            annotated[column] = value
+            urls = image_urls(value) if IMAGE_COLUMN.search(column) else []
+            if urls:
+                annotated[f"{column} Check"] = ", ".join(describe(self.probe(url)) for url in urls)
+        return annotated
+
+    def verify(self, rows):
+        """
+        Annotates a stream of output rows, probing them concurrently.
+
+        The URLs of all rows are probed as one stream, so the images of one
+        row are probed in parallel too, and each row is put back together
+        once its last probe is done.
+
+        Yields:
+            dict: Each row with its Check columns, in input order.
+        """
+        waiting = deque()
+
+        def row_urls(rows):
+            for row in rows:
+                urls = [url for column, value in row.items() if IMAGE_COLUMN.search(column)
+                        for url in image_urls(value)]
+                waiting.append([row, len(urls)])
+                # A row without images still takes one slot so it comes back in order
+                yield from urls or [""]
+
+        def probe(url):
+            return self.probe(url) if url else None
+
+        for _ in imap_ordered(probe, row_urls(rows), max_workers=self.max_workers, per_host=self.per_host):
+            entry = waiting[0]
+            entry[1] -= 1
+            if entry[1] <= 0:
+                waiting.popleft()
+                yield self.annotate(entry[0])
+
+    def broken(self):
+        """The probes of this run that did not return an image."""
+        return [probe for probe in self.probes.values() if not probe_ok(probe)]
+
+    def table(self, only_broken=False):
+        """The probes as rows for a report sheet."""
+        probes = self.broken() if only_broken else self.probes.values()
+        return [
+            {"URL": p.url, "Status": p.status, "Content Type": p.content_type, "Bytes": p.bytes,
+             "Format": p.format, "Width": p.width, "Height": p.height, "Result": describe(p)}
+            for p in probes
+        ]
@@ -0,0 +1,247 @@
+"""
+Background jobs for the dashboard.
+
+Streamlit reruns the whole script on every interaction, so a scrape started
+inside a button handler dies with the rerun that started it. Instead, runs
+are submitted to a JobManager, which lives for the whole server process
+(app.py keeps one in st.cache_resource) and executes them on a thread pool;
+the page only polls a job's progress and renders what it has so far.
+
+Every job has a key built from the uploaded file's hash, the extractors and
+the options that change the output. Submitting a key that is already running
+reattaches to that job, and a key that already finished returns its result
+straight away, so re-clicking Run or reopening the page never redoes work.
+Threads rather than processes are used because the work is network-bound and
+the jobs share the response cache, the rate limiter and the HTTP session.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_KEEP_RESULTS = 20
+PREVIEW_ROWS = 50
+
+
+def file_hash(data):
+    """The SHA-256 of an uploaded file's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def job_key(file_digest, extractors, options):
+    """
+    The cache key of a run: same file, extractors and options, same output.
+
+    Args:
+        file_digest (str): file_hash() of the input sheet.
+        extractors (list): The extractor names, in column order.
+        options (dict): JSON-serialisable options that change the output.
+    """
+    payload = json.dumps([file_digest, list(extractors), options], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function by Job.check() once cancel() was called."""
+
+
+class Job:
+    """
+    One background run, updated by its worker thread and read by the page.
+
+    Attributes:
+        id (str): Short unique ID shown on the dashboard.
+        key (str): The job_key() it was submitted under.
+        label (str): What is being run, for the jobs list.
+        status (str): QUEUED, RUNNING, DONE, FAILED or CANCELLED.
+        total (int): Rows to process, if known.
+        done (int): Rows processed so far.
+        result (dict): What the work function returned, once DONE.
+        error (str): The failure message, once FAILED.
+        files (list): Files owned by the job, deleted when it is evicted.
+    """
+
+    def __init__(self, key, label="", total=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.key = key
+        self.label = label
+        self.status = QUEUED
+        self.total = total
+        self.done = 0
+        self.result = None
+        self.error = None
+        self.files = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._preview = deque(maxlen=PREVIEW_ROWS)
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Asks the job to stop; it does so the next time it calls check()."""
+        self._cancel.set()
+        with self._lock:
+            if self.status == QUEUED:
+                self.status = CANCELLED
+                self.finished_at = time.time()
+
+    def check(self):
+        """
+        Called by the work function between units of work.
+
+        Raises:
+            JobCancelled: If cancel() was called.
+        """
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def advance(self, row=None, count=1):
+        """Records progress, optionally with the latest output row for the preview."""
+        with self._lock:
+            self.done += count
+            if row is not None:
+                self._preview.append(row)
+
+    def preview(self):
+        """A copy of the most recent output rows."""
+        with self._lock:
+            return list(self._preview)
+
+    def progress(self):
+        """Fraction done, or None when the total is unknown."""
+        if self.status == DONE:
+            return 1.0
+        return min(1.0, self.done / self.total) if self.total else None
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def _run(self, work):
+        with self._lock:
+            if self.status != QUEUED:
+                return
+            self.status = RUNNING
+            self.started_at = time.time()
+        try:
+            self.check()
+            result = work(self)
+        except JobCancelled:
+            status, result, error = CANCELLED, None, None
+        except Exception as e:
+            status, result, error = FAILED, None, str(e) or type(e).__name__
+        else:
+            status, error = DONE, None
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.status = status
+            self.finished_at = time.time()
+
+    def _remove_files(self):
+        for path in self.files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class JobManager:
+    """
+    Runs jobs on a thread pool and keeps finished ones as a result cache.
+
+    Args:
+        max_workers (int): Jobs running at the same time; further jobs queue.
+        keep_results (int): Finished jobs kept for reattaching and as cached
+            results; the oldest are evicted and their files deleted.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, keep_results=DEFAULT_KEEP_RESULTS):
+        self.keep_results = keep_results
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, work, label="", total=None, rerun=False):
+        """
+        Starts work(job) in the background, unless the key is already running or done.
+
+        A key whose last job failed or was cancelled is run again, and so is a
+        finished one when rerun is set.
+
+        Args:
+            key (str): The job_key() of the run.
+            work (callable): Called with the Job on a worker thread; it should
+                call job.check() and job.advance() as it goes and return the
+                result dict.
+            label (str): What is being run, for the jobs list.
+            total (int): Rows to process, if known.
+            rerun (bool): Ignore a finished result for key and run it afresh.
+
+        Returns:
+            Job: The new job, or the existing one for key.
+        """
+        with self._lock:
+            existing = self._by_key.get(key)
+            if existing is not None and existing.status in (QUEUED, RUNNING, DONE):
+                if not (rerun and existing.status == DONE):
+                    return existing
+            job = Job(key, label, total)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            self._evict()
+        self._pool.submit(job._run, work)
+        return job
+
+    def get(self, job_id):
+        """Returns the job with that ID, or None if unknown or evicted."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, key):
+        """Returns the running or finished job for key, or None."""
+        with self._lock:
+            job = self._by_key.get(key)
+        return job if job is not None and job.status in (QUEUED, RUNNING, DONE) else None
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def jobs(self):
+        """Every known job, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _evict(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.keep_results)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            job._remove_files()
@@ -0,0 +1,126 @@
+"""
+Durable per-URL job journal for the long-running client scrapers.
+
+Each input row is registered under its position in the sheet. As soon as a
+URL finishes, its status and extracted fields are committed to SQLite, so a
+browser crash loses at most the page in flight. A rerun skips every finished
+row and retries only the failed and never-started ones, and the journal can
+export the consolidated output at any time.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from scraping.sinks import json_default, RowSpool
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+EXPORT_BATCH_ROWS = 1000
+
+
+class Journal:
+    """
+    A SQLite-backed record of every URL in one scraping job.
+
+    Args:
+        path (str): The journal database file; created if missing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                seq INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                fields TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def add(self, rows):
+        """
+        Registers input rows, leaving rows already in the journal untouched.
+
+        A row whose URL changed since the last run (the sheet was edited) is
+        reset to pending.
+
+        Args:
+            rows (iterable): (seq, url) pairs, where seq is the row's stable
+                position in the input sheet.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.executemany("""
+                INSERT INTO urls (seq, url, status, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (seq) DO UPDATE SET
+                    url = excluded.url, status = excluded.status, fields = NULL,
+                    error = NULL, attempts = 0, updated_at = excluded.updated_at
+                WHERE urls.url != excluded.url
+            """, ((int(seq), str(url), PENDING, now) for seq, url in rows))
+            self._db.commit()
+
+    def pending(self):
+        """
+        Returns the seqs that still need scraping (never run or failed).
+        """
+        with self._lock:
+            return {seq for (seq,) in self._db.execute("SELECT seq FROM urls WHERE status != ?", (DONE,))}
+
+    def _record(self, seq, status, fields, error):
+        with self._lock:
+            self._db.execute(
+                "UPDATE urls SET status = ?, fields = ?, error = ?, attempts = attempts + 1, updated_at = ? WHERE seq = ?",
+                (status, json.dumps(fields, default=json_default, ensure_ascii=False), error, time.time(), int(seq)),
+            )
+            self._db.commit()
+
+    def record_done(self, seq, fields):
+        """Commits the extracted fields of a finished URL."""
+        self._record(seq, DONE, fields, None)
+
+    def record_failed(self, seq, fields, error):
+        """Commits a failed URL; it will be retried on the next run."""
+        self._record(seq, FAILED, fields, str(error))
+
+    def counts(self):
+        """Returns a {status: number of rows} summary."""
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM urls GROUP BY status"))
+
+    def rows(self):
+        """
+        Iterates over the recorded output rows in input order.
+        """
+        last = None
+        while True:
+            with self._lock:
+                records = self._db.execute(
+                    "SELECT seq, fields FROM urls WHERE fields IS NOT NULL AND (? IS NULL OR seq > ?) "
+                    "ORDER BY seq LIMIT ?", (last, last, EXPORT_BATCH_ROWS)
+                ).fetchall()
+            if not records:
+                return
+            for last, fields in records:
+                yield json.loads(fields)
+
+    def export(self, path):
+        """
+        Writes every recorded row to one consolidated .xlsx, .csv or .parquet file,
+        streaming the rows instead of building a DataFrame.
+        """
+        with RowSpool(preview_rows=0) as spool:
+            for row in self.rows():
+                spool.append(row)
+            spool.save(path)
+
+    def close(self):
+        self._db.close()
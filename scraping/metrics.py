@@ -0,0 +1,240 @@
+"""
+Per-URL timing instrumentation and the run performance report.
+
+Requests made inside ``recording(timings)`` fill the timings dict with where
+the time went: DNS lookup and connection set-up (both zero when a keep-alive
+connection is reused), time to first byte, download time and response size.
+The pipeline adds parse and extract time, and browser renders report their
+navigation and wait time. These can be added to the output rows as columns.
+
+RunMetrics collects the timings of a whole run and summarises them as
+p50/p95/p99 latencies per host and per extractor, plus the CPU time of each
+extraction pattern (see scraping.patterns), for the dashboard and as a JSON
+metrics file.
+"""
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from scraping.patterns import PATTERN_STATS
+
+DNS = "DNS Seconds"
+CONNECT = "Connect Seconds"
+TTFB = "TTFB Seconds"
+DOWNLOAD = "Download Seconds"
+RESPONSE_BYTES = "Response Bytes"
+FROM_CACHE = "From Cache"
+FETCH = "Fetch Seconds"
+PARSE = "Parse Seconds"
+EXTRACT = "Extract Seconds"
+TOTAL = "Total Seconds"
+NAVIGATION = "Navigation Seconds"
+WAIT = "Wait Seconds"
+
+TIMING_COLUMNS = (DNS, CONNECT, TTFB, DOWNLOAD, RESPONSE_BYTES, FROM_CACHE, FETCH, PARSE, EXTRACT, TOTAL)
+PERCENTILES = (50, 95, 99)
+
+_local = threading.local()
+
+
+@contextmanager
+def recording(timings):
+    """
+    Records the network timings of requests made on this thread into timings.
+    """
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def _current():
+    return getattr(_local, "timings", None)
+
+
+class _TimedConnectionMixin:
+    """Times DNS resolution and connection set-up (TCP plus TLS) of new connections."""
+
+    def _new_conn(self):
+        timings = _current()
+        if timings is None:
+            return super()._new_conn()
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            return super()._new_conn()  # let urllib3 raise its usual error
+        timings[DNS] = time.perf_counter() - started
+
+        # Connect to the resolved addresses so the name is not looked up twice
+        host = self._dns_host
+        error = None
+        for address in addresses:
+            self._dns_host = address[4][0]
+            try:
+                return super()._new_conn()
+            except OSError as e:
+                error = e
+            finally:
+                self._dns_host = host
+        raise error
+
+    def connect(self):
+        timings = _current()
+        started = time.perf_counter()
+        super().connect()
+        if timings is not None:
+            timings[CONNECT] = time.perf_counter() - started - timings.get(DNS, 0.0)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter whose connections report DNS and connect time to recording().
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+def time_response(timings, headers_at, response):
+    """
+    Fills in TTFB, download time and size once a response has been read.
+
+    Args:
+        timings (dict): The dict being filled.
+        headers_at (float): time.perf_counter() when the response headers
+            arrived, e.g. from a requests "response" hook.
+        response (requests.Response): The fully read response.
+    """
+    timings[TTFB] = response.elapsed.total_seconds()
+    timings[DOWNLOAD] = time.perf_counter() - headers_at
+    timings[RESPONSE_BYTES] = len(response.content)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _host(url):
+    try:
+        return (urlsplit(str(url)).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def _latency(values):
+    stats = {"count": len(values)}
+    for pct in PERCENTILES:
+        value = percentile(values, pct)
+        stats[f"p{pct}"] = round(value, 4) if value is not None else None
+    return stats
+
+
+class RunMetrics:
+    """
+    Collects per-URL timings for one run and summarises them.
+
+    record() may be called from any worker thread.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._extractors = {}
+        self._errors = {}
+        self._cache_hits = 0
+        self._rows = 0
+        # The pattern counters are process-wide; the run reports what was added since it started
+        self._patterns = PATTERN_STATS.snapshot()
+
+    def record(self, url, timings, durations=None, error=None):
+        """
+        Adds one URL to the run.
+
+        Args:
+            url (str): The page URL.
+            timings (dict): Its timing columns; TOTAL is used as the host latency.
+            durations (dict): Seconds spent in each extractor, by name.
+            error (str): The row's error, if it failed.
+        """
+        host = _host(url)
+        with self._lock:
+            self._rows += 1
+            if timings.get(TOTAL) is not None:
+                self._hosts.setdefault(host, []).append(timings[TOTAL])
+            for name, seconds in (durations or {}).items():
+                self._extractors.setdefault(name, []).append(seconds)
+            if error:
+                self._errors[host] = self._errors.get(host, 0) + 1
+            if timings.get(FROM_CACHE):
+                self._cache_hits += 1
+
+    def finish(self):
+        self.finished = time.time()
+
+    def summary(self):
+        """
+        Returns the run report as a JSON-serialisable dict.
+        """
+        with self._lock:
+            elapsed = (self.finished or time.time()) - self.started
+            hosts = {}
+            for host, values in sorted(self._hosts.items()):
+                hosts[host] = _latency(values)
+                hosts[host]["errors"] = self._errors.get(host, 0)
+            return {
+                "rows": self._rows,
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(self._rows / elapsed, 3) if elapsed > 0 else None,
+                "cache_hits": self._cache_hits,
+                "hosts": hosts,
+                "extractors": {name: _latency(values) for name, values in sorted(self._extractors.items())},
+                "patterns": PATTERN_STATS.since(self._patterns),
+            }
+
+    def table(self, section):
+        """
+        Flattens the "hosts", "extractors" or "patterns" section of the summary into rows for display.
+        """
+        return [{"Name": name, **stats} for name, stats in self.summary()[section].items()]
+
+    def write(self, path):
+        """Writes the summary to path as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
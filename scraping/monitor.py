@@ -0,0 +1,304 @@
+"""
+Incremental recrawls that report only what changed.
+
+Price cards such as Total Tools Price and MikkoShoes Price are run over the
+same catalogue every day just to spot changes. A MonitorStore keeps, per URL
+and set of extractors, the page's validators (ETag / Last-Modified), the
+SHA-256 of its body and the extracted fields. The next run then:
+
+    1. sends a conditional GET with the stored validators; a 304 Not Modified
+       means nothing to download, parse or extract
+    2. otherwise hashes the body; an identical body is not parsed either
+    3. otherwise runs the extractors and compares the fields with the stored ones
+
+and emits a change set: one row per field that is new or differs, with the
+old and new value, when the URL was first seen and when the old value was
+last changed. Unchanged URLs produce no output at all. Pages with volatile
+markup (session tokens, timestamps) defeat step 2 and are re-extracted, but
+still only produce rows when the extracted values change.
+
+A failed fetch or an HTTP error is reported as an "error" row and leaves the
+stored state alone, so the next run compares against the last good values.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, namedtuple
+
+from scraping.cache import normalize_url, DEFAULT_CACHE_DIR
+from scraping.extractors import run_extractors, retry_policy, fetch_region
+from scraping.fetch import fetch, imap_ordered, DEFAULT_WORKERS, DEFAULT_PER_HOST
+from scraping.page import Page, DEFAULT_PARSER
+from scraping.sinks import json_default
+
+DEFAULT_STATE_PATH = os.path.join(DEFAULT_CACHE_DIR, "monitor.sqlite3")
+
+NEW = "new"
+CHANGED = "changed"
+ERROR = "error"
+
+# Outcomes counted in the run report
+NOT_MODIFIED = "not_modified"
+SAME_CONTENT = "same_content"
+EXTRACTED = "extracted"
+
+# Columns of the run's identity rather than page content; never compared
+IDENTITY_COLUMNS = ("ProductID", "URL", "Error")
+CHANGE_COLUMNS = ("ProductID", "URL", "Field", "Change", "Old Value", "New Value", "First Seen", "Last Changed",
+                  "Checked At", "Error")
+
+PageState = namedtuple("PageState", "url etag last_modified content_hash fields changed_at first_seen")
+
+
+def format_time(timestamp):
+    """Local time as YYYY-MM-DD HH:MM:SS, or "" for None."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else ""
+
+
+def extractor_signature(script_names):
+    """The state key part that keeps runs of different extractors apart."""
+    return "|".join(sorted(script_names))
+
+
+class MonitorStore:
+    """
+    The last known state of every monitored URL, in SQLite.
+
+    Args:
+        path (str): The state database; created if missing.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT NOT NULL,
+                extractors TEXT NOT NULL,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                fields TEXT NOT NULL,
+                changed_at TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_checked REAL NOT NULL,
+                PRIMARY KEY (key, extractors)
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                key TEXT NOT NULL,
+                extractors TEXT NOT NULL,
+                field TEXT NOT NULL,
+                old TEXT,
+                new TEXT,
+                changed_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def get(self, url, extractors):
+        """Returns the PageState of url for that extractor signature, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, etag, last_modified, content_hash, fields, changed_at, first_seen FROM pages "
+                "WHERE key = ? AND extractors = ?", (normalize_url(url), extractors)
+            ).fetchone()
+        if row is None:
+            return None
+        url, etag, last_modified, content_hash, fields, changed_at, first_seen = row
+        return PageState(url, etag, last_modified, content_hash, json.loads(fields), json.loads(changed_at),
+                         first_seen)
+
+    def touch(self, url, extractors, etag=None, last_modified=None):
+        """Records an unchanged check, keeping any newer validators the server sent."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET last_checked = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE key = ? AND extractors = ?",
+                (time.time(), etag, last_modified, normalize_url(url), extractors),
+            )
+            self._db.commit()
+
+    def save(self, extractors, state, changes, checked_at):
+        """
+        Stores the new state of a page and appends its changes to the history.
+
+        Args:
+            extractors (str): extractor_signature() of the run.
+            state (PageState): The page's new state.
+            changes (list): (field, old, new) tuples.
+            checked_at (float): When the page was fetched.
+        """
+        key = normalize_url(state.url)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, extractors, state.url, state.etag, state.last_modified, state.content_hash,
+                 json.dumps(state.fields, default=json_default, ensure_ascii=False),
+                 json.dumps(state.changed_at), state.first_seen, checked_at),
+            )
+            self._db.executemany(
+                "INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?)",
+                ((key, extractors, field, _text(old), _text(new), checked_at) for field, old, new in changes),
+            )
+            self._db.commit()
+
+    def history(self, url, extractors):
+        """Every recorded (field, old, new, changed_at) of url, oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT field, old, new, changed_at FROM changes WHERE key = ? AND extractors = ? ORDER BY rowid",
+                (normalize_url(url), extractors),
+            ).fetchall()
+
+    def close(self):
+        self._db.close()
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def diff_fields(old, new):
+    """
+    The (field, old value, new value) of every content column that differs.
+
+    Fields that disappeared are reported with a new value of None.
+    """
+    changes = []
+    for field in list(new) + [f for f in old if f not in new]:
+        if field in IDENTITY_COLUMNS:
+            continue
+        if old.get(field) != new.get(field):
+            changes.append((field, old.get(field), new.get(field)))
+    return changes
+
+
+class Outcomes:
+    """Counts of check outcomes, updated by the worker threads of a run."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def summary(self):
+        """e.g. "812 not modified, 40 same content, 148 extracted, 2 errors"."""
+        with self._lock:
+            return ", ".join(f"{self.counts[key]} {label}" for key, label in (
+                (NOT_MODIFIED, "not modified"), (SAME_CONTENT, "same content"), (EXTRACTED, "extracted"),
+                (ERROR, "errors")))
+
+
+def check_page(store, script_names, url, pid, parser=DEFAULT_PARSER, scheduler=None, outcomes=None):
+    """
+    Rechecks one URL against its stored state and returns its change rows.
+
+    Args:
+        store (MonitorStore): The state of the previous runs.
+        script_names (list): The extractors whose columns are monitored.
+        url (str): The product page URL.
+        pid: The ProductID from the uploaded sheet.
+        parser (str): BeautifulSoup tree builder for extractors that need a tree.
+        scheduler (Scheduler): Optional per-host rate limiter and retries.
+        outcomes (Outcomes): Optional counter of NOT_MODIFIED, SAME_CONTENT,
+            EXTRACTED and ERROR checks.
+
+    Returns:
+        list: Rows with the CHANGE_COLUMNS, empty when nothing changed.
+    """
+    signature = extractor_signature(script_names)
+    outcome = ERROR
+    try:
+        state = store.get(url, signature)
+        headers = {}
+        if state is not None and state.etag:
+            headers["If-None-Match"] = state.etag
+        if state is not None and state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+        region, tags = fetch_region(script_names)
+        r = fetch(url, scheduler=scheduler, retry=retry_policy(script_names), region=region, tags=tags,
+                  headers=headers)
+        checked_at = time.time()
+        etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if r.status_code == 304 and state is not None:
+            outcome = NOT_MODIFIED
+            store.touch(url, signature, etag, last_modified)
+            return []
+        if r.status_code != 200:
+            return [_error_row(pid, url, f"HTTP {r.status_code}", state, checked_at)]
+
+        content_hash = hashlib.sha256(r.content).hexdigest()
+        if state is not None and content_hash == state.content_hash:
+            outcome = SAME_CONTENT
+            store.touch(url, signature, etag, last_modified)
+            return []
+
+        fields = run_extractors(script_names, Page(url, r.text, parser=parser))
+        if fields.get("Error"):
+            return [_error_row(pid, url, fields["Error"], state, checked_at)]
+        outcome = EXTRACTED
+        # Round-tripped through JSON so values compare equal to the stored ones (tuples become lists)
+        fields = json.loads(json.dumps({k: v for k, v in fields.items() if k not in IDENTITY_COLUMNS},
+                                       default=json_default))
+        old_fields = state.fields if state is not None else {}
+        changed_at = dict(state.changed_at) if state is not None else {}
+        changes = diff_fields(old_fields, fields)
+        rows = []
+        for field, old, new in changes:
+            rows.append({
+                "ProductID": pid, "URL": url, "Field": field,
+                "Change": CHANGED if field in old_fields else NEW,
+                "Old Value": old, "New Value": new,
+                "First Seen": format_time(state.first_seen if state is not None else checked_at),
+                "Last Changed": format_time(changed_at.get(field)),
+                "Checked At": format_time(checked_at),
+            })
+            changed_at[field] = checked_at
+        store.save(signature, PageState(url, etag, last_modified, content_hash, fields, changed_at,
+                                        state.first_seen if state is not None else checked_at),
+                   changes, checked_at)
+        return rows
+    except Exception as e:
+        return [_error_row(pid, url, str(e), None, time.time())]
+    finally:
+        if outcomes is not None:
+            outcomes.add(outcome)
+
+
+def _error_row(pid, url, error, state, checked_at):
+    return {
+        "ProductID": pid, "URL": url, "Field": "", "Change": ERROR, "Old Value": None, "New Value": None,
+        "First Seen": format_time(state.first_seen) if state is not None else "", "Last Changed": "",
+        "Checked At": format_time(checked_at), "Error": error,
+    }
+
+
+def run_monitor(store, script_names, rows, max_workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST,
+                parser=DEFAULT_PARSER, scheduler=None, outcomes=None):
+    """
+    Rechecks (URL, ProductID) pairs concurrently.
+
+    Args:
+        outcomes (Outcomes): Optional counter filled as rows are checked.
+
+    Yields:
+        list: The change rows of each input pair, in input order; empty for
+            unchanged pages, so callers can count progress per input row.
+    """
+    def check(row):
+        return check_page(store, script_names, *row, parser=parser, scheduler=scheduler, outcomes=outcomes)
+
+    return imap_ordered(check, rows, max_workers=max_workers, per_host=per_host, url_of=lambda row: row[0])
@@ -0,0 +1,183 @@
+"""
+A downloaded page with lazily built views.
+
+Most extractors only run regexes over the raw HTML, so the BeautifulSoup tree
+is built the first time an extractor asks for it and never otherwise. Meta
+tags get their own cheap scan because several extractors need nothing else.
+
+Extractors that need a tree but only read a few elements can ask for
+tree(targets) instead of soup: only the targeted elements are cut out of the
+HTML and parsed (see scraping.regions).
+
+Extractors also declare the region of the document they read. For HEAD-only
+extractors the download is cut short as soon as the head has been received
+(see head_end), so only that prefix is transferred and parsed.
+"""
+import html as htmllib
+import re
+import time
+
+# The views of a page an extractor can declare it needs, cheapest first
+TEXT = "text"
+META = "meta"
+TREE = "tree"
+VIEWS = (TEXT, META, TREE)
+
+# The regions of the document an extractor can declare it reads
+HEAD = "head"
+BODY = "body"
+REGIONS = (HEAD, BODY)
+
+DEFAULT_PARSER = "html.parser"
+PARSERS = ("html.parser", "lxml", "html5lib")
+
+# Comments, scripts and styles are matched whole so <meta> text inside them is skipped
+META_SCAN = re.compile(
+    r'''<!--[\s\S]*?-->|<script\b[\s\S]*?</script\s*>|<style\b[\s\S]*?</style\s*>'''
+    r'''|<meta\b((?:"[^"]*"|'[^']*'|[^'">])*)>''',
+    re.IGNORECASE,
+)
+RAW_TEXT_DELIMITERS = (("<!--", "-->"), ("<script", "</script"), ("<style", "</style"))
+HEAD_END = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+ATTRIBUTE = re.compile(r'''([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?''')
+
+
+def available_parsers():
+    """
+    Lists the BeautifulSoup tree builders installed in this environment.
+
+    Returns:
+        list: Parser names usable as the parser argument of Page.
+    """
+    from bs4.builder import builder_registry
+
+    return [name for name in PARSERS if builder_registry.lookup(name)]
+
+
+def fragment_text(markup, **kwargs):
+    """
+    Returns the visible text of a small HTML fragment, as BeautifulSoup renders it.
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(markup, 'html.parser').get_text(**kwargs)
+
+
+def parse_attributes(raw):
+    """
+    Parses the attribute string of a start tag into a dict.
+
+    Names are lowercased and values unescaped, matching html.parser. When an
+    attribute repeats, the last value wins.
+    """
+    attrs = {}
+    for name, double, single, bare in ATTRIBUTE.findall(raw):
+        attrs[name.lower()] = htmllib.unescape(double or single or bare)
+    return attrs
+
+
+def meta_properties(html):
+    """
+    Returns the attributes of each <meta property=...> tag in html, first occurrence wins.
+
+    Tags inside comments, scripts and styles are not markup and are skipped.
+    """
+    found = {}
+    for match in META_SCAN.finditer(html):
+        if match.group(1) is None:
+            continue
+        attrs = parse_attributes(match.group(1))
+        if "property" in attrs:
+            found.setdefault(attrs["property"], attrs)
+    return found
+
+
+def head_end(prefix, tags=(), start=0):
+    """
+    Finds where a downloaded prefix holds everything a HEAD extractor needs.
+
+    Args:
+        prefix (bytes): The start of the document received so far.
+        tags (tuple): Meta properties the extractors read; once all of them
+            have been seen the rest of the head is not needed either.
+        start (int): Offset to resume the </head> search from.
+
+    Returns:
+        int: The length of the prefix to keep, or None to keep reading.
+    """
+    match = HEAD_END.search(prefix, start)
+    if match:
+        return match.end() if match.group().startswith(b"</") else match.start()
+    if tags:
+        # latin-1 maps every byte to one character, so offsets stay byte offsets
+        text = prefix.decode("latin-1")
+        lowered = text.lower()
+        if any(lowered.rfind(opener) > lowered.rfind(closer) for opener, closer in RAW_TEXT_DELIMITERS):
+            return None
+        if all(tag in meta_properties(text) for tag in tags):
+            return len(prefix)
+    return None
+
+
+class Page:
+    """
+    The HTML of one product page plus the views extractors can ask for.
+
+    Attributes:
+        url (str): The page URL.
+        html (str): The raw HTML text.
+        parser (str): The BeautifulSoup tree builder used for the soup view.
+        parse_seconds (float): Time spent building trees, 0 if none was built.
+    """
+
+    def __init__(self, url, html, parser=DEFAULT_PARSER):
+        self.url = url
+        self.html = html
+        self.parser = parser or DEFAULT_PARSER
+        self.parse_seconds = 0.0
+        self._soup = None
+        self._meta = None
+        self._trees = {}
+
+    @property
+    def soup(self):
+        """The full BeautifulSoup tree, built on first access."""
+        if self._soup is None:
+            from bs4 import BeautifulSoup
+
+            started = time.perf_counter()
+            self._soup = BeautifulSoup(self.html, self.parser)
+            self.parse_seconds += time.perf_counter() - started
+        return self._soup
+
+    def tree(self, targets):
+        """
+        A BeautifulSoup tree of only the targeted elements, built on first access.
+
+        Args:
+            targets (tuple): scraping.regions.Target objects; the same tuple
+                returns the same tree.
+
+        Returns:
+            BeautifulSoup: The full soup if it was already built, otherwise
+            a tree of the targeted windows in document order.
+        """
+        if self._soup is not None:
+            return self._soup
+        key = id(targets)
+        if key not in self._trees:
+            from bs4 import BeautifulSoup
+            from scraping.regions import extract_windows
+
+            started = time.perf_counter()
+            self._trees[key] = BeautifulSoup(extract_windows(self.html, targets), self.parser)
+            self.parse_seconds += time.perf_counter() - started
+        return self._trees[key]
+
+    def meta(self, prop):
+        """
+        Returns the attributes of the first <meta property=prop> tag, or None.
+        """
+        if self._meta is None:
+            self._meta = meta_properties(self.html)
+        return self._meta.get(prop)
@@ -0,0 +1,209 @@
+"""
+Guarded regex extraction: anchored patterns, CPU budgets and timing counters.
+
+Several extractors run lazy ``[\\s\\S]*?`` patterns over the raw HTML. Where
+the pattern does not match, every candidate start tag makes re scan on to
+the end of the document, and on a multi-megabyte page with many candidates
+one row can burn seconds of CPU while the other workers wait. Three guards
+keep one bad page from stalling a batch:
+
+    anchors   - a Pattern can name a literal that every match has in its
+                first tag, e.g. "product-title-container", or a list of
+                alternatives such as both quotings of an attribute. The
+                pattern is then only tried at the start of the tags
+                containing the anchor, found with a cheap literal scan, and
+                each try may span at most window characters. An anchor should
+                be specific to the element: a common one such as "value"
+                turns every tag carrying it into a candidate.
+    budgets   - run_extractor() gives every extractor a budget of CPU
+                seconds per page. Patterns and spec fields check it between
+                steps and raise ExtractionTimeout, which ends up in the row's
+                "Error" column like any other failure. re cannot be
+                interrupted in the middle of a search, so unanchored
+                patterns are checked before and after each search only;
+                anchored ones between candidates, which the window bounds.
+    counters  - every Pattern adds its calls, CPU time, candidates tried
+                and timeouts to PATTERN_STATS, reported per pattern in the
+                run metrics.
+
+A pattern with an anchor finds the same matches as a plain search as long
+as each match starts at the "<" of the tag holding the anchor and ends
+within window characters of it. The default window is 64 KiB; a pattern
+whose match can legitimately span more, e.g. from a container tag to a
+section deep inside it on a large page, must set a wider one or will miss it.
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# CPU seconds an extractor may spend on one page; a normal page takes milliseconds
+DEFAULT_BUDGET = 5.0
+# The most an anchored match may span; bounds the cost of every candidate tried
+DEFAULT_WINDOW = 64 * 1024
+
+_local = threading.local()
+
+
+class ExtractionTimeout(Exception):
+    """An extractor ran out of its CPU budget on a page."""
+
+
+@contextmanager
+def cpu_budget(seconds=DEFAULT_BUDGET):
+    """
+    Gives the code inside the block seconds of CPU time of this thread.
+
+    Args:
+        seconds (float): The budget; None or 0 for no limit.
+    """
+    previous = getattr(_local, "budget", None)
+    _local.budget = (seconds, time.thread_time() + seconds) if seconds else None
+    try:
+        yield
+    finally:
+        _local.budget = previous
+
+
+def check_budget(where=""):
+    """
+    Raises ExtractionTimeout if the current cpu_budget() is spent.
+
+    Args:
+        where (str): What was running, for the message.
+    """
+    budget = getattr(_local, "budget", None)
+    if budget is not None and time.thread_time() > budget[1]:
+        raise ExtractionTimeout(f"timed out after {budget[0]:g}s of CPU" + (f" in {where}" if where else ""))
+
+
+class PatternStats:
+    """
+    Process-wide counters of every named Pattern, updated by all threads.
+
+    Each entry holds calls, CPU seconds, candidates tried (anchored
+    patterns only) and timeouts.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, candidates=0, timeout=False):
+        with self._lock:
+            counts = self._counts.setdefault(name, [0, 0.0, 0, 0])
+            counts[0] += 1
+            counts[1] += seconds
+            counts[2] += candidates
+            counts[3] += timeout
+
+    def snapshot(self):
+        """{name: [calls, cpu_seconds, candidates, timeouts]}, a copy."""
+        with self._lock:
+            return {name: list(counts) for name, counts in self._counts.items()}
+
+    def since(self, snapshot):
+        """
+        The counters accumulated since snapshot(), as a summary section.
+
+        Returns:
+            dict: {name: {"calls", "cpu_seconds", "mean_ms", "candidates",
+            "timeouts"}} of the patterns used since, slowest first.
+        """
+        stats = {}
+        for name, counts in self.snapshot().items():
+            before = snapshot.get(name, [0, 0.0, 0, 0])
+            calls, seconds, candidates, timeouts = (now - then for now, then in zip(counts, before))
+            if calls:
+                stats[name] = {"calls": calls, "cpu_seconds": round(seconds, 4),
+                               "mean_ms": round(seconds / calls * 1000, 3), "candidates": candidates,
+                               "timeouts": timeouts}
+        return dict(sorted(stats.items(), key=lambda item: -item[1]["cpu_seconds"]))
+
+
+PATTERN_STATS = PatternStats()
+
+
+class Pattern:
+    """
+    A precompiled regex over page HTML, optionally anchored, counted in PATTERN_STATS.
+
+    Args:
+        regex (str): The pattern.
+        flags (int): re flags.
+        name (str): Its label in the counters, e.g. "Shiels Meta Details: Title".
+        anchor (str | list): A literal that every match has in its first tag,
+            or a list of alternatives; see the module docstring. Matched
+            case-insensitively with re.IGNORECASE.
+        window (int): With an anchor, the most characters a match may span.
+
+    Raises:
+        re.error: If regex does not compile.
+    """
+
+    def __init__(self, regex, flags=0, name=None, anchor=None, window=DEFAULT_WINDOW):
+        self.regex = re.compile(regex, flags)
+        self.name = name or regex
+        self.anchor = anchor
+        self.window = window
+        anchors = [anchor] if isinstance(anchor, str) else list(anchor or ())
+        self._anchor = re.compile("|".join(map(re.escape, anchors)), flags & re.IGNORECASE) if anchors else None
+
+    @property
+    def pattern(self):
+        return self.regex.pattern
+
+    def _candidates(self, html):
+        """Offsets of the "<" of every tag holding the anchor, in document order."""
+        last = -1
+        for found in self._anchor.finditer(html):
+            start = html.rfind("<", 0, found.start())
+            if start > last:
+                last = start
+                yield start
+
+    def _run(self, html, first):
+        started = time.thread_time()
+        matches = []
+        tried = 0
+        timeout = False
+        try:
+            check_budget(self.name)
+            if self._anchor is None:
+                if first:
+                    match = self.regex.search(html)
+                    matches = [match] if match else []
+                else:
+                    matches = list(self.regex.finditer(html))
+                check_budget(self.name)
+                return matches
+            end = -1
+            for start in self._candidates(html):
+                if start < end:
+                    continue
+                check_budget(self.name)
+                tried += 1
+                match = self.regex.match(html, start, start + self.window)
+                if match:
+                    matches.append(match)
+                    if first:
+                        break
+                    end = max(match.end(), start + 1)
+            return matches
+        except ExtractionTimeout:
+            timeout = True
+            raise
+        finally:
+            PATTERN_STATS.add(self.name, time.thread_time() - started, tried, timeout)
+
+    def search(self, html):
+        """The first match, or None."""
+        matches = self._run(html, first=True)
+        return matches[0] if matches else None
+
+    def findall(self, html):
+        """Every non-overlapping match, as match objects in document order."""
+        return self._run(html, first=False)
+
+    def __repr__(self):
+        return f"Pattern({self.name!r})"
@@ -0,0 +1,98 @@
+"""
+The fetch-and-extract pipeline shared by the dashboard and the batch CLI.
+"""
+import time
+
+from scraping.canonical import DedupePlan
+from scraping.extractors import run_extractors, retry_policy, fetch_region
+from scraping.fetch import fetch, imap_ordered, DEFAULT_WORKERS, DEFAULT_PER_HOST
+from scraping.metrics import TIMING_COLUMNS, FETCH, PARSE, EXTRACT, TOTAL
+from scraping.page import Page, DEFAULT_PARSER
+
+
+def extract_product(script_names, url, pid, parser=DEFAULT_PARSER, cache=None, scheduler=None,
+                    metrics=None, timing_columns=False):
+    """
+    Downloads one product page once and runs the named extractors over it.
+
+    When every extractor reads only the document head, only the head is
+    downloaded and parsed.
+
+    Args:
+        script_names (list): Keys of the extractors in the scripts table.
+        url (str): The product page URL.
+        pid: The ProductID from the uploaded sheet.
+        parser (str): BeautifulSoup tree builder for extractors that need a tree.
+        cache (ResponseCache): Optional on-disk response cache.
+        scheduler (Scheduler): Optional per-host rate limiter; transient
+            failures are then retried within the extractors' retry budget.
+        metrics (RunMetrics): Optional collector the row's timings are recorded in.
+        timing_columns (bool): Add the TIMING_COLUMNS to the row.
+
+    Returns:
+        dict: The output row, with an "Error" column if anything failed.
+    """
+    result = {"ProductID": pid, "URL": url}
+    timings = {}
+    durations = {}
+    started = time.perf_counter()
+    page = None
+    try:
+        region, tags = fetch_region(script_names)
+        r = fetch(url, cache=cache, scheduler=scheduler, retry=retry_policy(script_names), timings=timings,
+                  region=region, tags=tags)
+        timings[FETCH] = time.perf_counter() - started
+        page = Page(url, r.text, parser=parser)
+        result.update(run_extractors(script_names, page, durations))
+    except Exception as e:
+        result["Error"] = str(e)
+
+    timings[TOTAL] = time.perf_counter() - started
+    if page is not None:
+        timings[PARSE] = page.parse_seconds
+        timings[EXTRACT] = sum(durations.values()) - page.parse_seconds
+    if metrics is not None:
+        metrics.record(url, timings, durations, result.get("Error"))
+    if timing_columns:
+        for column in TIMING_COLUMNS:
+            value = timings.get(column)
+            result[column] = round(value, 4) if isinstance(value, float) else value
+    return result
+
+
+def run_rows(script_names, rows, max_workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST,
+             parser=DEFAULT_PARSER, cache=None, scheduler=None, metrics=None, timing_columns=False,
+             canonicalizer=None, report=None):
+    """
+    Runs the extractors over (URL, ProductID) pairs concurrently.
+
+    With a canonicalizer, rows whose URLs are the same page are fetched once
+    and the extracted columns are copied to each of them.
+
+    Args:
+        canonicalizer (Canonicalizer): Optional; enables de-duplication.
+        report (dict): Optional dict filled with the DedupePlan report
+            (rows, unique, saved, collapsed) before the first row is yielded.
+
+    Yields:
+        dict: One output row per input pair, in input order.
+    """
+    def extract(row):
+        return extract_product(script_names, *row, parser=parser, cache=cache, scheduler=scheduler,
+                               metrics=metrics, timing_columns=timing_columns)
+
+    if canonicalizer is None:
+        return imap_ordered(extract, rows, max_workers=max_workers, per_host=per_host, url_of=lambda row: row[0])
+    return _run_deduplicated(extract, DedupePlan(rows, canonicalizer), max_workers, per_host, report)
+
+
+def _run_deduplicated(extract, plan, max_workers, per_host, report):
+    if report is not None:
+        report.update(plan.report())
+    fetched = imap_ordered(extract, plan.unique, max_workers=max_workers, per_host=per_host,
+                           url_of=lambda row: row[0])
+    for (url, pid), result in plan.fan_out(fetched):
+        # The fetched row's URL and ProductID are replaced by this row's own
+        row = {"ProductID": pid, "URL": url}
+        row.update((k, v) for k, v in result.items() if k not in row)
+        yield row
@@ -0,0 +1,105 @@
+"""
+Client plugins.
+
+Every folder under clients/ that holds a spec.json (or spec.yaml / spec.yml
+when PyYAML is installed) is a client plugin: its spec is compiled and added
+to the extractor registry under the spec's name, so it shows up on the
+dashboard and in the CLI like any built-in site. A client's run.py only has
+to call run_client() to push the sheets in its input/ folder through the
+shared pipeline.
+"""
+import os
+
+from scraping.extractors import register_spec
+from scraping.sheets import INPUT_FORMATS
+from scraping.specs import load_specs
+
+CLIENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "clients")
+SPEC_NAMES = ("spec.json", "spec.yaml", "spec.yml")
+
+
+def spec_path(client_dir):
+    """Returns the spec file of a client folder, or None if it has none."""
+    for name in SPEC_NAMES:
+        path = os.path.join(client_dir, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_client(client_dir):
+    """
+    Compiles a client's spec and registers it.
+
+    Returns:
+        SpecExtractor: The client's extractor.
+
+    Raises:
+        ValueError: If the folder has no spec, or the spec is invalid.
+    """
+    path = spec_path(client_dir)
+    if path is None:
+        raise ValueError(f"No {' / '.join(SPEC_NAMES)} in {client_dir}")
+    specs = load_specs(path)
+    if len(specs) != 1:
+        raise ValueError(f"{path} must hold exactly one spec")
+    register_spec(specs[0])
+    return specs[0]
+
+
+def discover(clients_dir=CLIENTS_DIR):
+    """
+    Loads every client plugin under clients_dir.
+
+    Returns:
+        list: The registered SpecExtractor objects, by folder name.
+    """
+    if not os.path.isdir(clients_dir):
+        return []
+    return [
+        load_client(os.path.join(clients_dir, name))
+        for name in sorted(os.listdir(clients_dir))
+        if spec_path(os.path.join(clients_dir, name))
+    ]
+
+
+def run_client(client_dir, input_dir=None, output_dir=None, output_format="csv", **options):
+    """
+    Runs a client's extractor over every product sheet in its input folder.
+
+    Each sheet (with URL and ProductID columns) is written to the output folder
+    as <sheet>_output.<output_format>.
+
+    Args:
+        client_dir (str): The client folder holding the spec.
+        input_dir (str): Defaults to <client_dir>/input.
+        output_dir (str): Defaults to <client_dir>/output.
+        output_format (str): "csv", "parquet" or "xlsx".
+        **options: Passed to run_rows (max_workers, per_host, cache, scheduler, canonicalizer...).
+
+    Returns:
+        list: The output files written.
+    """
+    from scraping.pipeline import run_rows
+    from scraping.sheets import read_pairs
+    from scraping.sinks import RowSpool
+
+    spec = load_client(client_dir)
+    input_dir = input_dir or os.path.join(client_dir, "input")
+    output_dir = output_dir or os.path.join(client_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    written = []
+    for filename in sorted(os.listdir(input_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in INPUT_FORMATS:
+            continue
+        pairs = read_pairs(os.path.join(input_dir, filename))
+        output_path = os.path.join(output_dir, f"{stem}_output.{output_format}")
+        with RowSpool(preview_rows=0) as spool:
+            for result in run_rows([spec.name], pairs, **options):
+                spool.append(result)
+            spool.save(output_path)
+        print(f"{spec.name}: {spool.count} rows -> {output_path}")
+        written.append(output_path)
+    return written
@@ -0,0 +1,216 @@
+"""
+Adaptive per-host request scheduling with retries.
+
+Each host gets a token bucket (requests per second) and a concurrency limit
+that adapts to what the site tells us: it grows by one slot per window of
+fast successful responses and is halved on 429/503 responses, timeouts or
+connection errors (AIMD), and the request rate is halved on throttling and
+slowly recovered. Transient failures are retried with exponential backoff and
+full jitter, and a Retry-After header pauses the whole host for the time the
+server asked for.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from scraping.fetch import host_of
+
+DEFAULT_RATE = 4.0
+DEFAULT_BURST = 8
+DEFAULT_MAX_PER_HOST = 8
+SLOW_FACTOR = 3.0
+MAX_RETRY_AFTER = 300
+
+RetryPolicy = namedtuple(
+    "RetryPolicy",
+    ["retries", "backoff", "max_backoff", "statuses"],
+    defaults=(3, 0.5, 30.0, (429, 500, 502, 503, 504)),
+)
+RetryPolicy.__doc__ = """
+How hard to retry one request.
+
+Attributes:
+    retries (int): Extra attempts after the first one.
+    backoff (float): Base delay in seconds, doubled on every attempt.
+    max_backoff (float): Cap on a single delay.
+    statuses (tuple): HTTP statuses worth retrying.
+"""
+
+DEFAULT_RETRY = RetryPolicy()
+THROTTLE_STATUSES = (429, 503)
+
+
+def retry_after_seconds(response):
+    """
+    Parses a Retry-After header (delta-seconds or HTTP date) into seconds, or None.
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def backoff_delay(policy, attempt):
+    """Exponential backoff with full jitter for the given attempt (0-based)."""
+    return random.uniform(0, min(policy.max_backoff, policy.backoff * 2 ** attempt))
+
+
+class HostState:
+    """
+    Token bucket, adaptive concurrency limit and latency estimate for one host.
+    """
+
+    def __init__(self, rate, burst, max_concurrency):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(1, max_concurrency // 2))
+        self.inflight = 0
+        self.paused_until = 0.0
+        self.baseline = None
+        self.condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def acquire(self):
+        """Blocks until the host is not paused, has a free slot and a token."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.inflight >= int(self.limit):
+                    wait = None
+                elif self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.inflight += 1
+                    return
+                self.condition.wait(wait)
+
+    def release(self, latency=None, throttled=False, failed=False, retry_after=None):
+        """Frees the slot and adapts the limits to the outcome of the request."""
+        with self.condition:
+            self.inflight -= 1
+            if throttled or failed:
+                self.limit = max(1.0, self.limit / 2)
+                if throttled:
+                    self.rate = max(self.max_rate / 16, self.rate / 2)
+            elif latency is not None:
+                self.baseline = latency if self.baseline is None else min(self.baseline * 1.01, latency)
+                if latency > self.baseline * SLOW_FACTOR:
+                    self.limit = max(1.0, self.limit * 0.8)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                    self.rate = min(self.max_rate, self.rate * 1.05)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.condition.notify_all()
+
+
+class Scheduler:
+    """
+    Shares per-host limits between every thread fetching through it.
+
+    Args:
+        rate (float): Maximum requests per second per host.
+        burst (int): Requests a host may receive back to back.
+        max_per_host (int): Ceiling for the adaptive concurrency limit.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_per_host=DEFAULT_MAX_PER_HOST):
+        self.rate = rate
+        self.burst = burst
+        self.max_per_host = max_per_host
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url):
+        name = host_of(url)
+        with self._lock:
+            if name not in self._hosts:
+                self._hosts[name] = HostState(self.rate, self.burst, self.max_per_host)
+            return self._hosts[name]
+
+    def cap_rate(self, url, rate):
+        """Limits url's host to at most rate requests per second, one at a time, e.g. for a Crawl-delay."""
+        state = self.host(url)
+        with state.condition:
+            state.max_rate = min(state.max_rate, rate)
+            state.rate = min(state.rate, rate)
+            state.burst = 1
+            state.tokens = min(state.tokens, 1.0)
+
+    @contextmanager
+    def slot(self, url):
+        """Holds one request slot for url's host; the caller reports the outcome."""
+        state = self.host(url)
+        state.acquire()
+        outcome = {}
+        try:
+            yield outcome
+        finally:
+            state.release(**outcome)
+
+    def request(self, session, url, retry=None, method="GET", **kwargs):
+        """
+        Sends a request for url under the host's limits, retrying transient failures.
+
+        Args:
+            session (requests.Session): The session to send the request with.
+            url (str): The URL to fetch.
+            retry (RetryPolicy): Retry budget; defaults to DEFAULT_RETRY.
+            method (str): The HTTP method, GET unless only the headers are wanted.
+            **kwargs: Passed to session.request (timeout, headers, stream...).
+
+        Returns:
+            requests.Response: The final response, which may still be an error
+            status once the retries are used up.
+
+        Raises:
+            requests.RequestException: If the last attempt failed to connect or timed out.
+        """
+        retry = retry or DEFAULT_RETRY
+        for attempt in range(retry.retries + 1):
+            last = attempt == retry.retries
+            with self.slot(url) as outcome:
+                started = time.monotonic()
+                try:
+                    response = session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    outcome["failed"] = True
+                    if last:
+                        raise
+                    response = None
+                else:
+                    outcome["latency"] = time.monotonic() - started
+                    if response.status_code in THROTTLE_STATUSES:
+                        outcome["throttled"] = True
+                        outcome["retry_after"] = retry_after_seconds(response)
+                    elif response.status_code >= 500:
+                        outcome["failed"] = True
+            if response is not None and (last or response.status_code not in retry.statuses):
+                return response
+            if response is not None:
+                response.close()
+            delay = backoff_delay(retry, attempt)
+            time.sleep(max(delay, retry_after_seconds(response) or 0))
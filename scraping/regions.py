@@ -0,0 +1,173 @@
+"""
+Target regions: the parts of a page an extractor's tree is built from.
+
+A full BeautifulSoup tree of a 1-3 MB product page costs far more time and
+memory than the few nodes an extractor reads. An extractor can instead
+declare Targets, and Page.tree(targets) then finds each targeted element
+with a cheap regex scan over the raw HTML, cuts out the byte window from its
+start tag to its matching end tag, and parses only those windows.
+
+A target names the element by tag and attribute filters, or by an anchor
+regex matching the start of its start tag:
+
+    Target("h1", {"class": "product-title-details"})
+    Target(attrs={"data-component-id": re.compile("^product-description-features-")})
+    Target(anchor=r'<div[^>]+id="product-description"')
+
+Attribute values match exactly ("class" matches one of the classes), True
+only requires the attribute, and a compiled pattern is searched in the value.
+Windows nested in another window are dropped, so targeting a container and
+its children parses the container once. Comments, scripts and styles are
+skipped by the scan; an element that is never closed extends to the end of
+the document, which parses more than needed but never less.
+"""
+import re
+
+from scraping.page import parse_attributes
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+TAG_NAME = re.compile(r"<([a-zA-Z][^\s/>]*)")
+START_ATTRS = r'''((?:"[^"]*"|'[^']*'|[^'">])*)>'''
+
+
+RAW_TEXT = r"<!--[\s\S]*?-->|<script\b[\s\S]*?</script\s*>|<style\b[\s\S]*?</style\s*>"
+
+
+def _tag_scan(name):
+    """
+    Matches start/end tags of name (any tag when name is None), plus comments,
+    scripts and styles so that tags inside them are skipped.
+    """
+    if name in ("script", "style"):
+        return re.compile(rf"<!--[\s\S]*?-->|<(/?)({name})(?=[\s/>])" + START_ATTRS, re.IGNORECASE)
+    name = re.escape(name) if name else r"[a-zA-Z][^\s/>]*"
+    return re.compile(rf"{RAW_TEXT}|<(/?)({name})(?=[\s/>])" + START_ATTRS, re.IGNORECASE)
+
+
+class Target:
+    """
+    One kind of element whose subtree an extractor needs.
+
+    Args:
+        tag (str): The tag name, or None for any tag.
+        attrs (dict): Attribute filters, see the module docstring.
+        anchor (str): Instead of tag/attrs, a regex matching the start of the
+            element's start tag.
+    """
+
+    def __init__(self, tag=None, attrs=None, anchor=None):
+        if anchor is None and tag is None and not attrs:
+            raise ValueError("A target needs a tag, attrs or an anchor")
+        self.tag = tag.lower() if tag else None
+        self.attrs = dict(attrs or {})
+        self.anchor = re.compile(anchor, re.IGNORECASE) if isinstance(anchor, str) else anchor
+        self._scan = None if self.anchor is not None else _tag_scan(self.tag)
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Builds a target from its JSON form, e.g. {"tag": "li", "attrs": {"class": {"regex": "zoom"}}}.
+
+        Raises:
+            ValueError: On unknown keys or a bad pattern.
+        """
+        if not isinstance(spec, dict) or set(spec) - {"tag", "attrs", "anchor"}:
+            raise ValueError(f"targets take tag, attrs and anchor keys, got {spec!r}")
+        attrs = {}
+        for name, value in spec.get("attrs", {}).items():
+            if isinstance(value, dict):
+                if set(value) != {"regex"}:
+                    raise ValueError(f"attribute filter {name!r} must be a string, true or {{\"regex\": ...}}")
+                value = re.compile(value["regex"])
+            attrs[name] = value
+        try:
+            return cls(spec.get("tag"), attrs, spec.get("anchor"))
+        except re.error as e:
+            raise ValueError(f"bad anchor pattern: {e}") from None
+
+    def _matches(self, raw_attrs):
+        if not self.attrs:
+            return True
+        lowered = raw_attrs.lower()
+        # Most tags lack the attributes entirely; skip parsing those
+        if not all(name.lower() in lowered for name in self.attrs):
+            return False
+        attrs = parse_attributes(raw_attrs)
+        for name, wanted in self.attrs.items():
+            value = attrs.get(name.lower())
+            if value is None:
+                return False
+            if wanted is True:
+                continue
+            if hasattr(wanted, "search"):
+                if not wanted.search(value):
+                    return False
+            elif name.lower() == "class":
+                if wanted not in value.split():
+                    return False
+            elif value != wanted:
+                return False
+        return True
+
+    def starts(self, html):
+        """Yields (offset, tag name) of every element start tag this target matches."""
+        if self.anchor is not None:
+            for match in self.anchor.finditer(html):
+                name = TAG_NAME.match(html, match.start())
+                if name:
+                    yield match.start(), name.group(1).lower()
+            return
+        for match in self._scan.finditer(html):
+            if match.group(2) and not match.group(1) and self._matches(match.group(3)):
+                yield match.start(), match.group(2).lower()
+
+    def __repr__(self):
+        if self.anchor is not None:
+            return f"Target(anchor={self.anchor.pattern!r})"
+        return f"Target({self.tag!r}, {self.attrs!r})"
+
+
+def element_end(html, start, name):
+    """
+    Returns the offset just past the end of the element whose start tag is at start.
+
+    Nested elements of the same name are counted; void and self-closing
+    elements end with their start tag.
+    """
+    scan = _tag_scan(name)
+    first = scan.match(html, start)
+    if first is None:
+        return len(html)
+    if name in VOID_ELEMENTS or first.group(0).endswith("/>"):
+        return first.end()
+    depth = 1
+    for match in scan.finditer(html, first.end()):
+        if not match.group(2):
+            continue
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.end()
+    return len(html)
+
+
+def find_windows(html, targets):
+    """
+    The (start, end) byte windows of every targeted element, in document order.
+
+    Windows starting inside an earlier window are dropped, since that window
+    already holds them.
+    """
+    starts = sorted({start: name for target in targets for start, name in target.starts(html)}.items())
+    windows = []
+    for start, name in starts:
+        if windows and start < windows[-1][1]:
+            continue
+        windows.append((start, element_end(html, start, name)))
+    return windows
+
+
+def extract_windows(html, targets):
+    """The markup of the targeted elements, concatenated in document order."""
+    return "".join(html[start:end] for start, end in find_windows(html, targets))
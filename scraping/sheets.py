@@ -0,0 +1,163 @@
+"""
+Streaming readers for the product sheets fed to the extractors.
+
+Rows are yielded one at a time instead of loading the whole sheet: CSV with
+the csv module, xlsx with openpyxl in read-only mode (which iterates over the
+worksheet XML rather than building the workbook in memory) and Parquet one
+record batch at a time with pyarrow. None of them goes through pandas.
+"""
+import csv
+import io
+import itertools
+import math
+import os
+
+INPUT_FORMATS = (".xlsx", ".csv", ".parquet")
+REQUIRED_COLUMNS = ("URL", "ProductID")
+PARQUET_BATCH_ROWS = 10_000
+
+
+def sheet_format(path):
+    """Returns the lowercase extension of path, checked against INPUT_FORMATS."""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext not in INPUT_FORMATS:
+        raise ValueError(f"Unsupported input file {path!r}; expected one of {', '.join(INPUT_FORMATS)}")
+    return ext
+
+
+# Each reader yields the list of column names first, then the rows
+
+
+def _read_csv(f):
+    reader = csv.DictReader(f)
+    yield reader.fieldnames or []
+    yield from reader
+
+
+def _iter_csv(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            yield from _read_csv(f)
+    else:
+        yield from _read_csv(io.TextIOWrapper(source, encoding="utf-8-sig", newline=""))
+
+
+def _iter_xlsx(source):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        values = workbook.active.iter_rows(values_only=True)
+        header = next(values, None)
+        # Blank header cells are named like pandas does
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header or ())]
+        yield columns
+        for row in values:
+            if all(value is None for value in row):
+                continue
+            yield dict(zip(columns, row))
+    finally:
+        workbook.close()
+
+
+def _iter_parquet(source, batch_rows=PARQUET_BATCH_ROWS):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(source)
+    yield parquet.schema_arrow.names
+    for batch in parquet.iter_batches(batch_size=batch_rows):
+        yield from batch.to_pylist()
+
+
+def _iter_sheet(source, name=None):
+    """The column names of a sheet, then its rows."""
+    ext = sheet_format(name or getattr(source, "name", source))
+    if ext == ".csv":
+        return _iter_csv(source)
+    if ext == ".xlsx":
+        return _iter_xlsx(source)
+    return _iter_parquet(source)
+
+
+def iter_rows(source, name=None):
+    """
+    Streams the rows of a product sheet as dicts keyed by column name.
+
+    Args:
+        source: A path, or a binary file object such as a Streamlit upload.
+        name (str): File name used to pick the format; defaults to the path or
+            the file object's name.
+
+    Yields:
+        dict: One row at a time.
+    """
+    return itertools.islice(_iter_sheet(source, name), 1, None)
+
+
+def sheet_columns(source, name=None):
+    """
+    Reads only the column names of a product sheet.
+
+    Args:
+        source: A path, or a binary file object such as a Streamlit upload.
+        name (str): File name used to pick the format.
+
+    Returns:
+        list: The column names, empty for an empty sheet.
+    """
+    rows = _iter_sheet(source, name)
+    try:
+        return list(next(rows))
+    finally:
+        rows.close()
+
+
+def read_rows(path):
+    """
+    Reads a product sheet as a list of dicts, one per row.
+
+    Args:
+        path (str): An .xlsx, .csv or .parquet file.
+
+    Returns:
+        list: The rows, keyed by column name.
+    """
+    return list(iter_rows(path))
+
+
+def check_columns(rows, required=REQUIRED_COLUMNS):
+    """
+    Raises ValueError when the sheet lacks any of the required columns.
+    """
+    if rows:
+        check_header(rows[0], required)
+
+
+def check_header(columns, required=REQUIRED_COLUMNS):
+    """
+    Raises ValueError when the column names lack any of the required columns.
+    """
+    missing = [c for c in required if c not in set(columns)]
+    if missing:
+        raise ValueError(f"Input must contain {' and '.join(repr(c) for c in required)} columns")
+
+
+def is_blank(value):
+    """True for the empty cells of any reader: None, "" or NaN."""
+    return value is None or value == "" or (isinstance(value, float) and math.isnan(value))
+
+
+def read_pairs(source, name=None, required=REQUIRED_COLUMNS):
+    """
+    Streams a sheet into the (URL, ProductID) pairs the pipeline runs over.
+
+    Only the two columns are kept, so a 100k-row catalogue costs a list of
+    tuples rather than a DataFrame.
+
+    Raises:
+        ValueError: If the sheet lacks the required columns, even when it has
+            no data rows.
+    """
+    rows = _iter_sheet(source, name)
+    check_header(next(rows), required)
+    return [tuple(row[column] for column in required) for row in rows]
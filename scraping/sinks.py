@@ -0,0 +1,171 @@
+"""
+Streaming result sinks.
+
+Rows are appended to a JSON-lines spool file on disk as soon as they complete,
+so memory stays flat no matter how large the input sheet is. The set of
+columns is only known at the end (some extractors emit "Video 1..n" or
+"Image 1..n"), so the spool is converted in a second streaming pass once
+the run has finished into one consolidated file: CSV written row by row,
+Parquet one row group per batch, or xlsx through openpyxl's write-only
+workbook, which streams rows to disk instead of keeping the sheet in memory.
+"""
+import csv
+import json
+import math
+import os
+import tempfile
+from collections import deque
+
+SPOOL_DIR = os.path.join(tempfile.gettempdir(), "web_scraping")
+FORMATS = ("csv", "parquet", "xlsx")
+MIME_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+PARQUET_BATCH_ROWS = 10_000
+
+
+def json_default(value):
+    """json default hook turning numpy scalars into plain Python values."""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _csv_value(value):
+    """Formats a value the way DataFrame.to_csv does for missing data."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value
+
+
+class RowSpool:
+    """
+    An append-only on-disk buffer of output rows.
+
+    Args:
+        preview_rows (int): How many of the most recent rows to keep in memory
+            for a partial preview.
+        columns (iterable): Columns that come first and are written even if
+            no row has them, so an empty output still has its header.
+
+    Attributes:
+        columns (list): Every column seen so far, in first-seen order.
+        count (int): Number of rows appended.
+        tail (deque): The most recent rows, for display.
+    """
+
+    def __init__(self, preview_rows=50, columns=()):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl", dir=SPOOL_DIR)
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self.columns = list(columns)
+        self._seen = set(self.columns)
+        self.count = 0
+        self.tail = deque(maxlen=preview_rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, row):
+        """Writes one row to the spool."""
+        for column in row:
+            if column not in self._seen:
+                self._seen.add(column)
+                self.columns.append(column)
+        self._file.write(json.dumps(row, default=json_default, ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
+        self.tail.append(row)
+
+    def rows(self):
+        """Iterates over the spooled rows without loading them all."""
+        self._file.flush()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def write_csv(self, path):
+        """Streams the spool out as a CSV file with every column seen."""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns, restval="")
+            writer.writeheader()
+            for row in self.rows():
+                writer.writerow({k: _csv_value(v) for k, v in row.items()})
+
+    def write_parquet(self, path, batch_rows=PARQUET_BATCH_ROWS):
+        """Streams the spool out as Parquet, one row group per batch."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Extractors emit mixed types (e.g. "N/A" in a numeric column), so every
+        # column is stored as a string, like the CSV output.
+        schema = pa.schema([(column, pa.string()) for column in self.columns])
+        with pq.ParquetWriter(path, schema) as writer:
+            batch = []
+            for row in self.rows():
+                batch.append({k: None if _csv_value(v) == "" else str(v) for k, v in row.items()})
+                if len(batch) >= batch_rows:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+    def write_xlsx(self, path):
+        """Streams the spool out as an xlsx workbook in openpyxl write-only mode."""
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(self.columns)
+        for row in self.rows():
+            values = []
+            for column in self.columns:
+                value = _csv_value(row.get(column))
+                if isinstance(value, str):
+                    value = ILLEGAL_CHARACTERS_RE.sub("", value)
+                elif not isinstance(value, (int, float)):
+                    value = str(value)
+                values.append(None if value == "" else value)
+            sheet.append(values)
+        workbook.save(path)
+
+    def export(self, fmt="csv"):
+        """
+        Writes the spool to a temporary CSV, Parquet or xlsx file.
+
+        Returns:
+            str: Path of the written file.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported output format: {fmt!r}")
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}", dir=SPOOL_DIR)
+        os.close(fd)
+        self.save(path)
+        return path
+
+    def save(self, path):
+        """Writes the spool to path, choosing CSV, Parquet or xlsx by its extension."""
+        fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported output format: {fmt!r}")
+        if fmt == "parquet":
+            self.write_parquet(path)
+        elif fmt == "xlsx":
+            self.write_xlsx(path)
+        else:
+            self.write_csv(path)
+
+    def close(self):
+        """Closes and deletes the spool file."""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
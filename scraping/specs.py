@@ -0,0 +1,363 @@
+"""
+Declarative site extractors.
+
+A spec describes the output columns of one site as data instead of code:
+
+    {
+        "name": "Image Extractor",
+        "description": "Fetches the hero image of the product.",
+        "retries": 3,
+        "fields": {
+            "ImageFormula": {"meta": "og:image", "template": "=IMAGE(\"{value}\")", "default": "No image"}
+        }
+    }
+
+Each field takes its values from exactly one source:
+
+    regex   - a pattern over the raw HTML ("group", default 1; "flags";
+              "anchor" and "window", see scraping.patterns)
+    meta    - the <meta property=...> tag ("attr", default "content")
+    css     - a CSS selector over the tree ("attr", or its text; "text" holds
+              get_text() options and "drop" tags to leave out). With "each",
+              a selector of containers, only the first match inside each
+              container is taken.
+    parts   - a list of nested field specs whose values are joined
+
+and is then post-processed in this order: "html_text" (render a captured HTML
+fragment as text), "strip", "replace" ([old, new] pairs), "absolute" (true to
+resolve against the page URL, "origin" for its scheme://host, or a base URL), "exclude" (drop values
+containing any of these substrings), "unique", "template" (a format string
+with {value}). With "all" every match is kept and either joined with "join"
+or spread over numbered "columns" such as "Image {n}"; otherwise the first
+match is used. "default" is the value when nothing was found; a field with
+"within", a selector of the section it reads, keeps an empty value instead
+when that section exists but holds nothing.
+
+Specs are compiled once: patterns are precompiled on load and selectors on
+first use (so loading a spec does not import BeautifulSoup), and the
+extractor declares the cheapest page view (TEXT, META or TREE) its fields
+need, so every site gets the shared fetch-once, parse-lazily path.
+
+A spec whose CSS fields only read a few elements can list them as "targets"
+(see scraping.regions), e.g. [{"tag": "h1"}, {"tag": "div", "attrs": {"id":
+"product-description"}}]; its selectors then run over a tree of just those
+elements instead of the whole page. A spec whose fields all live in the
+document head can say "region": "head" so only the head is downloaded; if
+every field is a meta field, the download stops once those tags have been
+seen. A spec can set its own "budget" of CPU seconds per page (see
+scraping.patterns); lazy patterns such as [\s\S]*? should name an "anchor",
+a literal in the first tag of every match (or a list of them), so they are
+only tried where it occurs, and a "window" in characters when a match can
+span more than 64 KiB. Specs are JSON files, or YAML when PyYAML is installed.
+"""
+import copy
+import json
+import os
+import re
+from urllib.parse import urljoin, urlsplit
+
+from scraping.page import fragment_text, TEXT, META, TREE, VIEWS, BODY, REGIONS
+from scraping.patterns import Pattern, check_budget, DEFAULT_WINDOW
+from scraping.regions import Target
+
+SPEC_SUFFIXES = (".json", ".yaml", ".yml")
+SOURCES = ("regex", "meta", "css", "parts")
+FIELD_KEYS = set(SOURCES) | {
+    "group", "flags", "anchor", "window", "attr", "text", "drop", "each", "all", "html_text", "strip", "replace",
+    "absolute", "exclude", "unique", "template", "join", "columns", "default",
+    "within",
+}
+SPEC_KEYS = {"name", "description", "retries", "budget", "region", "targets", "fields"}
+
+
+def _fail(where, message):
+    raise ValueError(f"Invalid spec {where}: {message}")
+
+
+class Field:
+    """
+    One compiled output column of a spec.
+
+    Args:
+        name (str): The output column name.
+        spec (dict): The field spec, see the module docstring.
+        where (str): Location used in error messages.
+        targets (tuple): The spec's Target objects; CSS selectors run over a
+            tree of only those elements when set.
+        owner (str): The spec's name, labelling its patterns in the timing counters.
+    """
+
+    def __init__(self, name, spec, where="", targets=(), owner=""):
+        where = f"{where} field {name!r}"
+        if not isinstance(spec, dict):
+            _fail(where, "must be an object")
+        unknown = set(spec) - FIELD_KEYS
+        if unknown:
+            _fail(where, f"unknown keys {sorted(unknown)}")
+        sources = [key for key in SOURCES if key in spec]
+        if len(sources) != 1:
+            _fail(where, f"needs exactly one of {', '.join(SOURCES)}")
+
+        self.name = name
+        self.source = sources[0]
+        self.targets = targets
+        self.all = bool(spec.get("all", False))
+        self.attr = spec.get("attr", "content" if self.source == "meta" else None)
+        self.group = spec.get("group", 1)
+        self.text = spec.get("text", {"strip": True})
+        self.drop = list(spec.get("drop", ()))
+        self.each = spec.get("each")
+        self.within = spec.get("within")
+        self.html_text = spec.get("html_text", False)
+        self.strip = bool(spec.get("strip", False))
+        self.replace = [tuple(pair) for pair in spec.get("replace", ())]
+        self.absolute = spec.get("absolute", False)
+        self.exclude = tuple(spec.get("exclude", ()))
+        self.unique = bool(spec.get("unique", False))
+        self.template = spec.get("template")
+        self.join = spec.get("join")
+        self.columns = spec.get("columns")
+        self.default = spec.get("default", "")
+
+        if self.source == "regex":
+            flags = 0
+            for flag in spec.get("flags", ()):
+                try:
+                    flags |= getattr(re, flag.upper())
+                except AttributeError:
+                    _fail(where, f"unknown regex flag {flag!r}")
+            try:
+                self.pattern = Pattern(spec["regex"], flags, name=f"{owner}: {name}" if owner else name,
+                                       anchor=spec.get("anchor"), window=spec.get("window", DEFAULT_WINDOW))
+            except re.error as e:
+                _fail(where, f"bad regex: {e}")
+            self.needs = TEXT
+        elif self.source == "meta":
+            self.prop = spec["meta"]
+            self.needs = META
+        elif self.source == "css":
+            self.css = spec["css"]
+            self.needs = TREE
+        else:
+            self.parts = [Field(name, part, where, targets, owner) for part in spec["parts"]]
+            self.join = "" if self.join is None else self.join
+            self.needs = max((part.needs for part in self.parts), key=VIEWS.index, default=TEXT)
+        if self.within:
+            self.needs = max(self.needs, TREE, key=VIEWS.index)
+        self.where = where
+        self._selectors = {}
+
+    def _select(self, css):
+        """A compiled CSS selector; compiled on first use so specs load without bs4."""
+        if css not in self._selectors:
+            import soupsieve
+
+            try:
+                self._selectors[css] = soupsieve.compile(css)
+            except Exception as e:
+                _fail(self.where, f"bad selector: {e}")
+        return self._selectors[css]
+
+    def _root(self, page):
+        return page.tree(self.targets) if self.targets else page.soup
+
+    def _empty(self, page):
+        """The value when nothing was found: "" inside an existing "within" section, else the default."""
+        if self.within and self._select(self.within).select_one(self._root(page)) is not None:
+            return ""
+        return self.default
+
+    def _raw(self, page):
+        """The matched strings, before post-processing."""
+        if self.source == "regex":
+            if self.all:
+                return [match.group(self.group) for match in self.pattern.findall(page.html)]
+            match = self.pattern.search(page.html)
+            return [match.group(self.group)] if match else []
+        if self.source == "meta":
+            attrs = page.meta(self.prop)
+            return [attrs[self.attr]] if attrs and self.attr in attrs else []
+        if self.source == "css":
+            root = self._root(page)
+            selector = self._select(self.css)
+            if self.each:
+                tags = [selector.select_one(container) for container in self._select(self.each).select(root)]
+                tags = tags if self.all else tags[:1]
+            else:
+                tags = selector.select(root) if self.all else [selector.select_one(root)]
+            values = []
+            for tag in tags:
+                if tag is None:
+                    continue
+                if self.attr:
+                    if tag.get(self.attr):
+                        values.append(tag[self.attr])
+                    continue
+                if self.drop:
+                    # The tree is shared by every field and cached on the page, so drop from a copy
+                    tag = copy.copy(tag)
+                    for child in tag(self.drop):
+                        child.decompose()
+                values.append(tag.get_text(**self.text))
+            return values
+        return [part.value(page) for part in self.parts]
+
+    def _clean(self, value, page):
+        if self.html_text:
+            options = self.html_text if isinstance(self.html_text, dict) else {"strip": True}
+            value = fragment_text(value, **options)
+        if self.strip:
+            value = value.strip()
+        for old, new in self.replace:
+            value = value.replace(old, new)
+        if self.absolute:
+            base = self.absolute
+            if base is True:
+                base = page.url
+            elif base == "origin":
+                parts = urlsplit(page.url)
+                base = f"{parts.scheme}://{parts.netloc}"
+            value = urljoin(base, value)
+        return value
+
+    def values(self, page):
+        """The post-processed values of every match."""
+        values = [self._clean(value, page) for value in self._raw(page)]
+        if self.exclude:
+            values = [value for value in values if not any(part in value for part in self.exclude)]
+        if self.unique:
+            values = list(dict.fromkeys(values))
+        if self.template is not None:
+            values = [self.template.format(value=value) for value in values]
+        return values
+
+    def value(self, page):
+        """The field as one string: the first value, or all of them joined."""
+        values = self.values(page)
+        if self.source == "parts":
+            return self.join.join(values).strip() or self._empty(page)
+        if not values:
+            return self._empty(page)
+        if self.join is not None:
+            return self.join.join(values)
+        return values[0]
+
+    def extract(self, page):
+        """The field's output columns."""
+        if self.columns:
+            values = self.values(page)
+            if not values:
+                return {self.name: self._empty(page)}
+            return {self.columns.format(n=i + 1): value for i, value in enumerate(values)}
+        return {self.name: self.value(page)}
+
+    def meta_tags(self):
+        """The meta properties the field reads, or None if it reads anything else."""
+        if self.source == "meta":
+            return [self.prop]
+        if self.source == "parts":
+            tags = [part.meta_tags() for part in self.parts]
+            return None if None in tags else [tag for part in tags for tag in part]
+        return None
+
+
+class SpecExtractor:
+    """
+    A compiled spec; called with a Page it returns the row's columns.
+
+    Attributes:
+        name (str): The registry name.
+        description (str): Shown on the dashboard card.
+        retries (int): Retry budget, or None for the default.
+        budget (float): CPU seconds per page, or None for the default.
+        needs (str): TEXT, META or TREE, the most any field needs.
+        region (str): HEAD or BODY, the part of the document the fields read.
+        tags (tuple): With HEAD, the meta properties that are enough to stop
+            the download; empty unless every field is a meta field.
+        targets (tuple): Target objects the CSS fields are limited to, if any.
+        fields (list): The compiled Field objects, in column order.
+    """
+
+    def __init__(self, spec, where="<spec>"):
+        if not isinstance(spec, dict):
+            _fail(where, "must be an object")
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            _fail(where, f"unknown keys {sorted(unknown)}")
+        if not spec.get("name"):
+            _fail(where, "needs a name")
+        if not spec.get("fields"):
+            _fail(where, "needs at least one field")
+        self.name = spec["name"]
+        self.description = spec.get("description", "")
+        self.retries = spec.get("retries")
+        self.budget = spec.get("budget")
+        self.region = spec.get("region", BODY)
+        if self.region not in REGIONS:
+            _fail(where, f"region must be one of {', '.join(REGIONS)}")
+        where = f"{where} ({self.name})"
+        try:
+            self.targets = tuple(Target.from_spec(target) for target in spec.get("targets", ()))
+        except ValueError as e:
+            _fail(where, f"bad target: {e}")
+        self.fields = [Field(name, field, where, self.targets, self.name) for name, field in spec["fields"].items()]
+        self.needs = max((field.needs for field in self.fields), key=VIEWS.index)
+        tags = [field.meta_tags() for field in self.fields]
+        self.tags = () if self.region == BODY or None in tags else tuple(
+            dict.fromkeys(tag for field in tags for tag in field))
+
+    def __call__(self, page):
+        result = {}
+        for field in self.fields:
+            check_budget(f"field {field.name!r}")
+            result.update(field.extract(page))
+        return result
+
+    def __repr__(self):
+        return f"SpecExtractor({self.name!r})"
+
+
+def read_spec_file(path):
+    """
+    Reads a JSON or YAML spec file.
+
+    Returns:
+        list: The specs in the file; a file may hold one spec or a list.
+
+    Raises:
+        ValueError: If the file cannot be parsed or is YAML without PyYAML installed.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8") as f:
+        if suffix == ".json":
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in {path}: {e}") from None
+        elif suffix in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"PyYAML is needed to read {path}; install it or use a .json spec") from None
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"Invalid YAML in {path}: {e}") from None
+        else:
+            raise ValueError(f"Unsupported spec file {path!r}; use one of {', '.join(SPEC_SUFFIXES)}")
+    return data if isinstance(data, list) else [data]
+
+
+def load_specs(path):
+    """
+    Compiles every spec in a file, or in every spec file of a directory.
+
+    Returns:
+        list: SpecExtractor objects.
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                 if name.lower().endswith(SPEC_SUFFIXES)]
+    else:
+        files = [path]
+    return [SpecExtractor(spec, os.path.basename(file)) for file in files for spec in read_spec_file(file)]
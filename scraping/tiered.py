@@ -0,0 +1,95 @@
+"""
+Static-HTML-first fetching with a browser fallback for the client scrapers.
+
+Every URL is first fetched with plain HTTP and run through the client's
+soup-based extractor. Only pages whose required fields come back missing, that
+fail to download, or that a client rule marks as needing JavaScript are sent
+to the Selenium browser pool. Each result records which tier produced it, and
+every row gets the browser's per-page stats columns, blank where no browser
+measured them, so the output has the same columns whichever tier ran.
+"""
+import time
+
+from scraping.browser import SNAPSHOT_STATS
+from scraping.canonical import DedupePlan
+from scraping.fetch import fetch, imap_ordered, DEFAULT_WORKERS, DEFAULT_PER_HOST
+from scraping.metrics import TOTAL
+
+STATIC = "static"
+BROWSER = "browser"
+
+
+def scrape_tiered(urls, scrape_static, is_complete, pool, needs_browser=None,
+                  max_workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, cache=None, scheduler=None,
+                  metrics=None, canonicalizer=None, report=None):
+    """
+    Scrapes URLs statically where possible and on the browser pool otherwise.
+
+    Args:
+        urls (list): The product page URLs.
+        scrape_static (callable): scrape_static(html, url) -> fields dict.
+        is_complete (callable): is_complete(fields) -> True when no browser is needed.
+        pool (BrowserPool): Browser workers for the pages that need rendering;
+            no browser is started if every page succeeds statically.
+        needs_browser (callable): Optional needs_browser(url) rule that skips
+            the static attempt for pages known to need JavaScript.
+        max_workers (int): Concurrent static requests.
+        per_host (int): Maximum concurrent static requests per host.
+        cache (ResponseCache): Optional on-disk response cache.
+        scheduler (Scheduler): Optional per-host rate limiter with retries for
+            the static requests.
+        metrics (RunMetrics): Optional collector; each URL is recorded with its
+            total time, and the time spent in each tier as the "extractor".
+        canonicalizer (Canonicalizer): Optional; URLs of the same page are then
+            scraped once and the result is repeated for each of them.
+        report (dict): Optional dict filled with the de-duplication report.
+
+    Returns:
+        list: (url, fields, error, tier) tuples in input order. error is None on
+        success; otherwise fields is None. fields always hold the SNAPSHOT_STATS
+        columns, None where the page was not rendered or not measured.
+    """
+    urls = list(urls)
+    if canonicalizer is not None:
+        plan = DedupePlan([(url, None) for url in urls], canonicalizer)
+        if report is not None:
+            report.update(plan.report())
+        scraped = scrape_tiered([url for url, _ in plan.unique], scrape_static, is_complete, pool,
+                                needs_browser=needs_browser, max_workers=max_workers, per_host=per_host,
+                                cache=cache, scheduler=scheduler, metrics=metrics)
+        return [(url, fields, error, tier) for (url, _), (_, fields, error, tier) in plan.fan_out(scraped)]
+
+    def try_static(url):
+        timings = {}
+        if needs_browser is not None and needs_browser(url):
+            return None, timings
+        started = time.perf_counter()
+        try:
+            r = fetch(url, cache=cache, scheduler=scheduler, timings=timings)
+            r.raise_for_status()
+            fields = scrape_static(r.text, url)
+        except Exception:
+            fields = None
+        timings[TOTAL] = time.perf_counter() - started
+        return (fields if fields is not None and is_complete(fields) else None), timings
+
+    static = list(imap_ordered(try_static, urls, max_workers=max_workers, per_host=per_host))
+    escalated = [url for url, (fields, timings) in zip(urls, static) if fields is None]
+    rendered = iter(pool.imap(escalated) if escalated else ())
+
+    results = []
+    for url, (fields, timings) in zip(urls, static):
+        durations = {STATIC: timings[TOTAL]} if TOTAL in timings else {}
+        if fields is not None:
+            results.append((url, fields, None, STATIC))
+        else:
+            _, fields, error = next(rendered)
+            results.append((url, fields, error, BROWSER))
+            durations[BROWSER] = (fields or {}).get("Ready Seconds") or 0.0
+            timings[TOTAL] = sum(durations.values())
+        if fields is not None:
+            for column in SNAPSHOT_STATS:
+                fields.setdefault(column, None)
+        if metrics is not None:
+            metrics.record(url, timings, durations, results[-1][2])
+    return results
@@ -0,0 +1,646 @@
+"""
+A lease-based work queue shared by many scraper processes and machines.
+
+The journal makes one scraper resumable; the queue lets any number of them
+split one job. Workers claim a batch of rows under a lease, renew the lease
+from a heartbeat thread while they work, and commit each row as it finishes.
+A worker that crashes or loses its network simply stops renewing: once its
+lease expires the rows are claimed again by someone else. Commits are
+idempotent, so when a row ends up processed twice (the original worker was
+only slow, not dead) the first result wins and the second is a no-op.
+
+Three interchangeable backends implement the same methods:
+
+    SQLiteQueue  - the journal's SQLite file with lease columns, for workers
+                   on one machine (or a local disk; SQLite over NFS/SMB is not
+                   safe, use the HTTP backend across machines)
+    HTTPQueue    - a client for QueueServer, which serves any backend as a
+                   small JSON API: `python -m scraping queue serve`
+    MemoryQueue  - an in-process stand-in for tests and single-process runs
+
+open_queue() picks one from an address: an http(s):// URL, ":memory:" or a
+file path. A LeasedBatch has the journal's record_done/record_failed
+methods, so a client script's process_batch works unchanged against it.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from scraping.journal import Journal, PENDING, DONE, FAILED, EXPORT_BATCH_ROWS
+from scraping.sinks import json_default, RowSpool
+
+LEASED = "leased"
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_SECONDS = 10
+# First wait before retrying pending rows another worker just claimed; doubles up to poll_seconds
+RETRY_SECONDS = 0.1
+DEFAULT_PORT = 8765
+TOKEN_ENV = "SCRAPER_QUEUE_TOKEN"
+
+Lease = namedtuple("Lease", "seq url payload token")
+
+
+def default_worker_name():
+    """host-pid, shown in the queue's worker column."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value, default=json_default, ensure_ascii=False)
+
+
+def _loads(value):
+    return None if value is None else json.loads(value)
+
+
+class LeasedBatch:
+    """
+    Rows claimed by one worker, with the journal's recording interface.
+
+    Attributes:
+        rows (list): (seq, payload) pairs, payload being the row registered
+            with the queue.
+        lost (set): Seqs whose lease was taken over by another worker; their
+            results are still committed if they finish first.
+    """
+
+    def __init__(self, queue, leases):
+        self.queue = queue
+        self.rows = [(lease.seq, lease.payload) for lease in leases]
+        self.lost = set()
+        self._leases = {lease.seq: lease for lease in leases}
+        self._lock = threading.Lock()
+
+    def _take(self, seq):
+        with self._lock:
+            return self._leases.pop(seq, None)
+
+    def record_done(self, seq, fields):
+        """Commits a finished row; False if another worker committed it first."""
+        lease = self._take(seq)
+        return lease is not None and self.queue.complete(seq, lease.token, fields)
+
+    def record_failed(self, seq, fields, error):
+        """Returns the row to the queue for another attempt, or fails it for good."""
+        lease = self._take(seq)
+        return lease is not None and self.queue.fail(seq, lease.token, fields, str(error))
+
+    def tokens(self):
+        """The lease tokens of rows not yet recorded."""
+        with self._lock:
+            return [lease.token for lease in self._leases.values()]
+
+    def renew(self, lease_seconds):
+        tokens = self.tokens()
+        if not tokens:
+            return
+        held = set(self.queue.heartbeat(tokens, lease_seconds))
+        with self._lock:
+            self.lost.update(seq for seq, lease in self._leases.items() if lease.token not in held)
+
+    def release(self):
+        """Hands unrecorded rows back to the queue without counting an attempt."""
+        with self._lock:
+            tokens = [lease.token for lease in self._leases.values()]
+            self._leases.clear()
+        if tokens:
+            self.queue.release(tokens)
+
+
+class Heartbeat:
+    """
+    Renews a batch's leases every lease_seconds / 3 on a daemon thread.
+
+    A renewal that fails (the queue server is briefly unreachable) is retried
+    on the next beat; two missed beats still leave a third of the lease.
+    """
+
+    def __init__(self, batch, lease_seconds):
+        self.batch = batch
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name="lease-heartbeat", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.batch.renew(self.lease_seconds)
+            except Exception:
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class QueueClient:
+    """
+    The worker loop, shared by every backend.
+
+    Backends provide add, claim, heartbeat, complete, fail, release, counts,
+    rows, set_meta and meta.
+    """
+
+    def batches(self, size=DEFAULT_BATCH_SIZE, worker=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+                poll_seconds=DEFAULT_POLL_SECONDS):
+        """
+        Claims batches until the queue is drained, renewing each batch's leases while it is worked on.
+
+        When nothing is claimable but other workers still hold leases, waits
+        poll_seconds and tries again, since those leases may expire. When
+        pending rows were claimed by another worker first, retries after a
+        short wait that doubles up to poll_seconds. Rows of
+        a batch that were not recorded by the time the next batch is asked
+        for are released.
+
+        Args:
+            size (int): Rows claimed at a time.
+            worker (str): Name recorded on the leases; default_worker_name().
+            lease_seconds (float): How long a lease lasts without a heartbeat.
+            poll_seconds (float): Wait between claims while others hold leases.
+
+        Yields:
+            LeasedBatch: The claimed rows.
+        """
+        worker = worker or default_worker_name()
+        retry = RETRY_SECONDS
+        while True:
+            leases = self.claim(worker, size, lease_seconds)
+            if not leases:
+                counts = self.counts()
+                if counts.get(PENDING):
+                    time.sleep(retry)
+                    retry = min(retry * 2, poll_seconds)
+                    continue
+                if not counts.get(LEASED):
+                    return
+                time.sleep(poll_seconds)
+                continue
+            retry = RETRY_SECONDS
+            batch = LeasedBatch(self, leases)
+            try:
+                with Heartbeat(batch, lease_seconds):
+                    yield batch
+            finally:
+                batch.release()
+
+    def export(self, path):
+        """Writes every recorded row to one .xlsx, .csv or .parquet file."""
+        with RowSpool(preview_rows=0) as spool:
+            for row in self.rows():
+                spool.append(row)
+            spool.save(path)
+
+
+class SQLiteQueue(Journal, QueueClient):
+    """
+    The journal's SQLite file, extended with leases.
+
+    Any number of processes can open the same file: claims run in a write
+    transaction (BEGIN IMMEDIATE), so two workers never lease the same row.
+    An existing journal.sqlite3 can be opened as a queue and the other way
+    round.
+
+    Args:
+        path (str): The database file; created if missing.
+        max_attempts (int): Claims after which a failing row is marked failed.
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        super().__init__(path)
+        self.max_attempts = max_attempts
+        with self._lock:
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(urls)")}
+            for column in ("payload TEXT", "lease TEXT", "lease_expires REAL", "worker TEXT"):
+                if column.split()[0] not in columns:
+                    self._db.execute(f"ALTER TABLE urls ADD COLUMN {column}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS urls_status ON urls (status, seq)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS urls_lease ON urls (lease)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.commit()
+
+    def add(self, rows):
+        """
+        Registers rows; rows already queued are left untouched unless their URL changed.
+
+        Args:
+            rows (iterable): (seq, url) or (seq, url, payload) tuples; the
+                payload is any JSON-serialisable value handed to the worker.
+        """
+        now = time.time()
+        records = ((int(row[0]), str(row[1]), _dumps(row[2] if len(row) > 2 else None), PENDING, now)
+                   for row in rows)
+        with self._lock:
+            self._db.executemany("""
+                INSERT INTO urls (seq, url, payload, status, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (seq) DO UPDATE SET
+                    url = excluded.url, payload = excluded.payload, status = excluded.status, fields = NULL,
+                    error = NULL, attempts = 0, lease = NULL, lease_expires = NULL, worker = NULL,
+                    updated_at = excluded.updated_at
+                WHERE urls.url != excluded.url
+            """, records)
+            self._db.commit()
+
+    def claim(self, worker, limit=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Leases up to limit pending rows, or rows whose lease has expired.
+
+        Returns:
+            list: Lease tuples, in seq order.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                records = self._db.execute("""
+                    SELECT seq, url, payload FROM urls
+                    WHERE status = ? OR (status = ? AND lease_expires < ?)
+                    ORDER BY seq LIMIT ?
+                """, (PENDING, LEASED, now, int(limit))).fetchall()
+                leases = [Lease(seq, url, _loads(payload), uuid.uuid4().hex) for seq, url, payload in records]
+                self._db.executemany("""
+                    UPDATE urls SET status = ?, lease = ?, lease_expires = ?, worker = ?,
+                        attempts = attempts + 1, updated_at = ?
+                    WHERE seq = ?
+                """, ((LEASED, lease.token, now + lease_seconds, worker, now, lease.seq) for lease in leases))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return leases
+
+    def heartbeat(self, tokens, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extends the given leases; returns the tokens still held."""
+        tokens = list(tokens)
+        marks = ",".join("?" * len(tokens))
+        with self._lock:
+            self._db.execute(f"UPDATE urls SET lease_expires = ? WHERE status = ? AND lease IN ({marks})",
+                             (time.time() + lease_seconds, LEASED, *tokens))
+            self._db.commit()
+            held = self._db.execute(f"SELECT lease FROM urls WHERE status = ? AND lease IN ({marks})",
+                                    (LEASED, *tokens)).fetchall()
+        return [token for (token,) in held]
+
+    def complete(self, seq, token, fields):
+        """
+        Commits a finished row. The first commit wins, whoever holds the lease now.
+
+        Returns:
+            bool: False when the row was already done.
+        """
+        with self._lock:
+            cursor = self._db.execute("""
+                UPDATE urls SET status = ?, fields = ?, error = NULL, lease = NULL, lease_expires = NULL,
+                    updated_at = ?
+                WHERE seq = ? AND status != ?
+            """, (DONE, _dumps(fields), time.time(), int(seq), DONE))
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def fail(self, seq, token, fields, error):
+        """
+        Records a failed attempt. The row goes back to pending until it has
+        been claimed max_attempts times, then it is marked failed. Ignored
+        when the lease is no longer this worker's.
+
+        Returns:
+            bool: Whether the failure was recorded.
+        """
+        with self._lock:
+            cursor = self._db.execute("""
+                UPDATE urls SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, fields = ?, error = ?,
+                    lease = NULL, lease_expires = NULL, updated_at = ?
+                WHERE seq = ? AND status = ? AND lease = ?
+            """, (self.max_attempts, FAILED, PENDING, _dumps(fields), str(error), time.time(),
+                  int(seq), LEASED, token))
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def release(self, tokens):
+        """Returns leased rows to pending without counting the attempt."""
+        tokens = list(tokens)
+        marks = ",".join("?" * len(tokens))
+        with self._lock:
+            self._db.execute(f"""
+                UPDATE urls SET status = ?, lease = NULL, lease_expires = NULL, attempts = attempts - 1
+                WHERE status = ? AND lease IN ({marks})
+            """, (PENDING, LEASED, *tokens))
+            self._db.commit()
+
+    def retry_failed(self):
+        """Puts every failed row back in the queue with a fresh attempt budget; returns how many."""
+        with self._lock:
+            cursor = self._db.execute("UPDATE urls SET status = ?, attempts = 0 WHERE status = ?", (PENDING, FAILED))
+            self._db.commit()
+        return cursor.rowcount
+
+    def set_meta(self, key, value):
+        """Stores a JSON value describing the job, such as the extractors to run."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, _dumps(value)))
+            self._db.commit()
+
+    def meta(self, key, default=None):
+        with self._lock:
+            record = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if record is None else _loads(record[0])
+
+    def page(self, after=None, limit=EXPORT_BATCH_ROWS):
+        """(seq, fields) of recorded rows after seq, for paging through the output."""
+        with self._lock:
+            records = self._db.execute(
+                "SELECT seq, fields FROM urls WHERE fields IS NOT NULL AND (? IS NULL OR seq > ?) "
+                "ORDER BY seq LIMIT ?", (after, after, int(limit))
+            ).fetchall()
+        return [(seq, json.loads(fields)) for seq, fields in records]
+
+
+class MemoryQueue(QueueClient):
+    """
+    An in-process queue with SQLiteQueue's semantics, for tests and for
+    threads of one process.
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self._rows = {}
+        self._meta = {}
+        self._lock = threading.Lock()
+
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                seq, url = int(row[0]), str(row[1])
+                existing = self._rows.get(seq)
+                if existing is None or existing["url"] != url:
+                    self._rows[seq] = {"url": url, "payload": row[2] if len(row) > 2 else None, "status": PENDING,
+                                       "fields": None, "error": None, "attempts": 0, "lease": None,
+                                       "lease_expires": None, "worker": None}
+
+    def claim(self, worker, limit=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        leases = []
+        with self._lock:
+            for seq in sorted(self._rows):
+                if len(leases) >= limit:
+                    break
+                row = self._rows[seq]
+                if row["status"] == PENDING or (row["status"] == LEASED and row["lease_expires"] < now):
+                    row.update(status=LEASED, lease=uuid.uuid4().hex, lease_expires=now + lease_seconds,
+                               worker=worker, attempts=row["attempts"] + 1)
+                    leases.append(Lease(seq, row["url"], row["payload"], row["lease"]))
+        return leases
+
+    def _leased(self, tokens):
+        tokens = set(tokens)
+        return [row for row in self._rows.values() if row["status"] == LEASED and row["lease"] in tokens]
+
+    def heartbeat(self, tokens, lease_seconds=DEFAULT_LEASE_SECONDS):
+        with self._lock:
+            held = self._leased(tokens)
+            for row in held:
+                row["lease_expires"] = time.time() + lease_seconds
+            return [row["lease"] for row in held]
+
+    def complete(self, seq, token, fields):
+        with self._lock:
+            row = self._rows.get(int(seq))
+            if row is None or row["status"] == DONE:
+                return False
+            row.update(status=DONE, fields=fields, error=None, lease=None, lease_expires=None)
+            return True
+
+    def fail(self, seq, token, fields, error):
+        with self._lock:
+            row = self._rows.get(int(seq))
+            if row is None or row["status"] != LEASED or row["lease"] != token:
+                return False
+            status = FAILED if row["attempts"] >= self.max_attempts else PENDING
+            row.update(status=status, fields=fields, error=str(error), lease=None, lease_expires=None)
+            return True
+
+    def release(self, tokens):
+        with self._lock:
+            for row in self._leased(tokens):
+                row.update(status=PENDING, lease=None, lease_expires=None, attempts=row["attempts"] - 1)
+
+    def retry_failed(self):
+        with self._lock:
+            failed = [row for row in self._rows.values() if row["status"] == FAILED]
+            for row in failed:
+                row.update(status=PENDING, attempts=0)
+            return len(failed)
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for row in self._rows.values():
+                counts[row["status"]] = counts.get(row["status"], 0) + 1
+            return counts
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._meta[key] = value
+
+    def meta(self, key, default=None):
+        with self._lock:
+            return self._meta.get(key, default)
+
+    def page(self, after=None, limit=EXPORT_BATCH_ROWS):
+        with self._lock:
+            seqs = sorted(seq for seq, row in self._rows.items()
+                          if row["fields"] is not None and (after is None or seq > after))
+            return [(seq, self._rows[seq]["fields"]) for seq in seqs[:limit]]
+
+    def rows(self):
+        return _paged_rows(self)
+
+    def close(self):
+        pass
+
+
+class HTTPQueue(QueueClient):
+    """
+    A client for a QueueServer, for workers on other machines.
+
+    Args:
+        base_url (str): The server's address, e.g. http://10.0.0.5:8765.
+        token (str): Shared secret sent as a bearer token; defaults to the
+            SCRAPER_QUEUE_TOKEN environment variable.
+        timeout (float): Seconds per API call.
+    """
+
+    def __init__(self, base_url, token=None, timeout=30):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+        token = token or os.environ.get(TOKEN_ENV)
+        if token:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+
+    def _call(self, method, **body):
+        r = self._session.post(f"{self.base_url}/{method}", timeout=self.timeout,
+                               data=json.dumps(body, default=json_default, ensure_ascii=False).encode("utf-8"),
+                               headers={"Content-Type": "application/json"})
+        if r.status_code >= 400:
+            raise OSError(f"queue {method} failed: {r.status_code} {r.text.strip()}")
+        return r.json()
+
+    def add(self, rows):
+        rows = [list(row) for row in rows]
+        for start in range(0, len(rows), EXPORT_BATCH_ROWS):
+            self._call("add", rows=rows[start:start + EXPORT_BATCH_ROWS])
+
+    def claim(self, worker, limit=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return [Lease(*lease) for lease in self._call("claim", worker=worker, limit=limit,
+                                                       lease_seconds=lease_seconds)]
+
+    def heartbeat(self, tokens, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return self._call("heartbeat", tokens=list(tokens), lease_seconds=lease_seconds)
+
+    def complete(self, seq, token, fields):
+        return self._call("complete", seq=seq, token=token, fields=fields)
+
+    def fail(self, seq, token, fields, error):
+        return self._call("fail", seq=seq, token=token, fields=fields, error=str(error))
+
+    def release(self, tokens):
+        self._call("release", tokens=list(tokens))
+
+    def retry_failed(self):
+        return self._call("retry_failed")
+
+    def counts(self):
+        return self._call("counts")
+
+    def set_meta(self, key, value):
+        self._call("set_meta", key=key, value=value)
+
+    def meta(self, key, default=None):
+        value = self._call("meta", key=key)
+        return default if value is None else value
+
+    def page(self, after=None, limit=EXPORT_BATCH_ROWS):
+        return [tuple(record) for record in self._call("page", after=after, limit=limit)]
+
+    def rows(self):
+        return _paged_rows(self)
+
+    def close(self):
+        self._session.close()
+
+
+def _paged_rows(queue):
+    last = None
+    while True:
+        records = queue.page(last)
+        if not records:
+            return
+        for last, fields in records:
+            yield fields
+
+
+# API method -> the backend call made with the request's JSON body
+API = {
+    "add": lambda q, b: q.add(b["rows"]),
+    "claim": lambda q, b: [list(lease) for lease in q.claim(b["worker"], b["limit"], b["lease_seconds"])],
+    "heartbeat": lambda q, b: q.heartbeat(b["tokens"], b["lease_seconds"]),
+    "complete": lambda q, b: q.complete(b["seq"], b["token"], b["fields"]),
+    "fail": lambda q, b: q.fail(b["seq"], b["token"], b["fields"], b["error"]),
+    "release": lambda q, b: q.release(b["tokens"]),
+    "retry_failed": lambda q, b: q.retry_failed(),
+    "counts": lambda q, b: q.counts(),
+    "set_meta": lambda q, b: q.set_meta(b["key"], b["value"]),
+    "meta": lambda q, b: q.meta(b["key"]),
+    "page": lambda q, b: [list(record) for record in q.page(b.get("after"), b.get("limit", EXPORT_BATCH_ROWS))],
+}
+
+
+class QueueServer(ThreadingHTTPServer):
+    """
+    Serves a queue backend to HTTPQueue clients as POST /<method> JSON calls.
+
+    GET /status returns the counts, for a quick look with curl or a browser.
+
+    Args:
+        backend: The SQLiteQueue or MemoryQueue the calls are made on.
+        address (tuple): (host, port) to listen on.
+        token (str): When set, requests must send it as a bearer token.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, backend, address=("127.0.0.1", DEFAULT_PORT), token=None):
+        self.backend = backend
+        self.token = token
+        super().__init__(address, _QueueHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _QueueHandler(BaseHTTPRequestHandler):
+
+    def _send(self, status, value):
+        body = json.dumps(value, default=json_default, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorised(self):
+        token = self.server.token
+        if token and self.headers.get("Authorization") != f"Bearer {token}":
+            self._send(401, {"error": "bad or missing token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorised():
+            return
+        if urlsplit(self.path).path != "/status":
+            return self._send(404, {"error": "not found"})
+        self._send(200, self.server.backend.counts())
+
+    def do_POST(self):
+        if not self._authorised():
+            return
+        call = API.get(urlsplit(self.path).path.strip("/"))
+        if call is None:
+            return self._send(404, {"error": "unknown method"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self._send(200, call(self.server.backend, body))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def open_queue(address, token=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Opens the queue at an address: an http(s):// URL, ":memory:" or a SQLite file path.
+    """
+    if urlsplit(address).scheme in ("http", "https"):
+        return HTTPQueue(address, token)
+    if address == ":memory:":
+        return MemoryQueue(max_attempts)
+    return SQLiteQueue(address, max_attempts)